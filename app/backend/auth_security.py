@@ -4,10 +4,11 @@ from pydantic import ValidationError
 import jwt
 from loguru import logger
 from assistant_agent.credentials import get_auth_config
-from assistant_agent.config import APIConfig
+from assistant_agent.config import APIConfig, AuthConfig
 from app.backend.models import TokenData
 
-auth_config = get_auth_config()
+# The secret key is only read from Secret Manager when the first token is used
+auth_config = AuthConfig()
 api_config = APIConfig()
 
 token_url = api_config.LOGIN_ENDPOINT.replace("/", "")
@@ -39,7 +40,7 @@ async def get_current_user_id_from_token(token: str = Depends(oauth2_scheme)) ->
     try:
         payload = jwt.decode(
             token,
-            auth_config.SECRET_KEY.get_secret_value(),
+            get_auth_config().SECRET_KEY.get_secret_value(),
             algorithms=[
                 auth_config.ALGORITHM,
             ],
@@ -70,3 +71,20 @@ async def get_current_user_id_from_token(token: str = Depends(oauth2_scheme)) ->
         raise credentials_exception
 
     return token_data.user_id
+
+
+async def get_admin_user_id_from_token(
+    user_id: str = Depends(get_current_user_id_from_token),
+) -> str:
+    """
+    FastAPI dependence for the administration endpoints: the user of the token must
+    be in METRICS_ADMIN_USER_IDS
+    """
+    if user_id not in api_config.METRICS_ADMIN_USER_IDS:
+        logger.warning(f"User {user_id} tried to access an administration endpoint")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+        )
+
+    return user_id
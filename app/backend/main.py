@@ -1,8 +1,13 @@
 from fastapi import FastAPI, HTTPException, status, Response, Depends
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from .auth_security import get_current_user_id_from_token
+from .auth_security import (
+    get_admin_user_id_from_token,
+    get_current_user_id_from_token,
+)
 from loguru import logger
 from app.backend.models import (
+    AgentJobResponse,
     AgentRequest,
     AgentResponse,
     TokenResponse,
@@ -14,118 +19,478 @@ from assistant_agent.schemas import (
     ChatSession,
     Prompt,
 )
-from assistant_agent.agent import generate_agent_instance
+from assistant_agent.agent import agent_registry
+from assistant_agent.memory import ChatMemoryManager
+from assistant_agent.tools.image_cache import image_cache
+from assistant_agent.tools.prompt_cache import get_prompt_cache
 from assistant_agent.utils.agent_auxiliars import (
-    prepare_to_read_chat_history,
-    get_new_agent_steps,
+    serialize_agent_steps,
+    stream_agent_run,
 )
 from assistant_agent.authentication import authenticate_user, create_access_token
 from assistant_agent.database.tables.bigquery import (
-    BQAgentStepsTable,
-    BQChatSessionsTable,
-    BQPromptsTable,
+    AsyncBQAgentStepsTable,
+    AsyncBQChatSessionsTable,
+    AsyncBQPromptsTable,
     BQUsersTable,
 )
-from assistant_agent.config import APIConfig
+from assistant_agent.config import AgentJobsConfig, APIConfig, ClientsConfig
+from assistant_agent.credentials import prefetch_credentials
+from assistant_agent.utils.gcp.bigquery_buffer import (
+    get_write_buffer,
+    shutdown_write_buffer,
+)
+from assistant_agent.utils.gcp.bigquery import (
+    get_recent_query_costs,
+    run_in_bigquery_executor,
+    shutdown_bigquery_executor,
+)
+from assistant_agent.utils.gcp.bigquery_queries import query_engine
+from assistant_agent.utils.gcp.clients import client_registry
+from assistant_agent.utils.genai_scheduler import (
+    GenAIThrottledError,
+    current_genai_user,
+    genai_scheduler,
+)
+from assistant_agent.utils.history_codec import history_codec
+from assistant_agent.utils.job_queue import (
+    Job,
+    JobManager,
+    JobQueueFullError,
+    get_job_queue_backend,
+    get_job_store,
+)
+from assistant_agent.utils.metrics import metrics
+from assistant_agent.utils.stream_events import capture_stream_events, format_sse
+from contextlib import asynccontextmanager
+from pydantic_ai.agent import AgentRunResult
+from pydantic_ai.messages import ModelMessage
+from typing import AsyncIterator, Optional
+import asyncio
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing authenticates or reads secrets at import time, the clients and the
+    # secrets are created and read here, in parallel
+    if clients_config.CLIENTS_PREWARM_ENABLED:
+        await asyncio.gather(
+            client_registry.aprewarm(
+                timeout=clients_config.CLIENTS_PREWARM_TIMEOUT_SECONDS
+            ),
+            asyncio.to_thread(
+                prefetch_credentials, clients_config.CLIENTS_PREWARM_TIMEOUT_SECONDS
+            ),
+        )
+    # Start the flusher of the BigQuery write buffer before receiving requests
+    get_write_buffer()
+    # Build the agents once, the requests lease them from the registry
+    agent_registry.prebuild()
+    agent_jobs.start()
+    yield
+    # Let the jobs, the streamed runs and the summaries being generated finish,
+    # then insert all the rows that are still buffered before the instance stops
+    await agent_jobs.stop(timeout=30)
+    if streaming_tasks:
+        await asyncio.wait(list(streaming_tasks), timeout=30)
+    await memory_manager.wait_for_summaries(timeout=30)
+    write_buffer_flushed = shutdown_write_buffer()
+    shutdown_bigquery_executor()
+    if not write_buffer_flushed:
+        # The shutdown fails, so it is not taken as clean
+        raise ValueError(
+            "Some rows of the BigQuery write buffer were not inserted, "
+            "see the dead letter in GCS"
+        )
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 api_config = APIConfig()
-
-# Instanciate only once the database tables
-agent_steps_table = BQAgentStepsTable()
-chat_sessions_table = BQChatSessionsTable()
+jobs_config = AgentJobsConfig()
+clients_config = ClientsConfig()
+
+# Instanciate only once the database tables. The async tables run the BigQuery
+# calls in a dedicated thread pool, so the event loop is never blocked by them
+agent_steps_table = AsyncBQAgentStepsTable()
+chat_sessions_table = AsyncBQChatSessionsTable()
+prompts_table = AsyncBQPromptsTable()
+# add_user is a sync endpoint, FastAPI already runs it in a thread
 users_table = BQUsersTable()
-prompts_table = BQPromptsTable()
 
+# Decides which part of the chat history is sent to the agent
+memory_manager = ChatMemoryManager()
 
-@app.post(api_config.AGENT_REQUEST_ENDPOINT, response_model=AgentResponse)
-async def agent_request(
-    request: AgentRequest,
-    current_user_id: str = Depends(get_current_user_id_from_token),
-):
-    logger.debug("Generating new agent instance...")
-    agent = generate_agent_instance()
+# Agent runs of the streaming requests, kept until they finish
+streaming_tasks: set[asyncio.Task] = set()
 
-    logger.info(f"user_id: {current_user_id}")
 
+async def get_chat_session(
+    chat_session_id: Optional[str], current_user_id: str
+) -> tuple[str, list[ModelMessage]]:
+    """
+    Get the chat session of the request and its history, a new session is created if
+    the request does not have one
+
+    Args:
+        chat_session_id: Optional[str] -> Chat session of the request
+        current_user_id: str -> User authenticated
+
+    Returns:
+        tuple[str, list[ModelMessage]] -> chat_session_id and the full history of the session
+    """
     logger.info("Getting chat_session_id...")
-    if request.chat_session_id is None:
+    if chat_session_id is None:
         logger.info("Creating a new chat session...")
-        chat_session_id = chat_sessions_table.generate_new_row(
+        chat_session_id = await chat_sessions_table.generate_new_row(
             ChatSession(user_id=current_user_id)
         )
         logger.info(f"New chat_session_id generated: {chat_session_id}")
         logger.info("Starting a new chat history")
         previous_agent_steps = list()  # To start a new chat session
+        agent_steps_table.start_session_history(chat_session_id)
 
     else:
-        chat_session_id = request.chat_session_id
         logger.info(f"chat session id found: {chat_session_id}")
 
         # if a chat_session_id was passed, then always get the history from BigQuery
         logger.info("Getting history from the database")
 
-        # Get a list of dictionaries
-        previous_agent_steps = agent_steps_table.get_chat_session_history(
+        # Get a list of JSON strings
+        previous_agent_steps = await agent_steps_table.get_chat_session_history(
             chat_session_id
         )
         logger.info("Chat history obtained from the database")
 
-    # Convert it to a list of ModelRequest/ModelResponse objects
-    chat_history = prepare_to_read_chat_history(previous_agent_steps)
+    # Convert it to a list of ModelRequest/ModelResponse objects, only the steps
+    # added since the previous turn of the session are decoded
+    chat_history = history_codec.decode(chat_session_id, previous_agent_steps)
+
+    return chat_session_id, chat_history
+
+
+async def store_agent_answer(
+    chat_session_id: str,
+    user_prompt: str,
+    agent_answer: AgentRunResult,
+    chat_history: list[ModelMessage],
+) -> str:
+    """
+    Store the prompt and the steps the agent made to answer it, then schedule the
+    update of the summary of the session
+
+    Args:
+        chat_session_id: str -> Chat session of the request
+        user_prompt: str -> Prompt of the user
+        agent_answer: AgentRunResult -> Result of the agent run
+        chat_history: list[ModelMessage] -> Full history of the session before the prompt
+
+    Returns:
+        str -> prompt_id
+    """
+    logger.info("Storing prompt data...")
+    prompt_data = Prompt(
+        chat_session_id=chat_session_id,
+        prompt=user_prompt,
+        response=agent_answer.output,
+    )
+    prompt_id = await prompts_table.generate_new_row(prompt_data=prompt_data)
+    logger.info("Prompt data stored")
+
+    logger.info("Storing agent steps...")
+
+    # Only the messages of this run, the history passed to the agent is already stored
+    new_messages = agent_answer.new_messages()
+
+    # prepare the steps to be stored in the DB, already serialized
+    new_steps_prepared = [
+        AgentStep(
+            chat_session_id=chat_session_id,
+            prompt_id=prompt_id,
+            step_data=new_step,
+        )
+        for new_step in serialize_agent_steps(new_messages)
+    ]
+    await agent_steps_table.store_prompt_steps(new_steps_prepared)
+    logger.info("Agent steps stored in DB")
+
+    # Fold the turns that left the memory window into the summary of the session
+    memory_manager.schedule_summary(chat_session_id, chat_history + new_messages)
+
+    return prompt_id
+
+
+async def answer_prompt(request: AgentRequest, current_user_id: str) -> AgentResponse:
+    """
+    Send the prompt of a user to the agent and store the answer
+
+    Args:
+        request: AgentRequest -> Prompt and chat session of the user
+        current_user_id: str -> User authenticated
+
+    Returns:
+        AgentResponse -> Answer of the agent and the chat session
+    """
+    # The GenAI calls of the tools are queued in turns between users
+    current_genai_user.set(current_user_id)
+
+    chat_session_id, chat_history = await get_chat_session(
+        request.chat_session_id, current_user_id
+    )
 
     logger.info("Sending new prompt to the agent...")
-    try:
+    # Only the last turns and the summary of the previous ones are sent
+    memory_window = await memory_manager.get_memory_window(
+        chat_session_id, chat_history
+    )
+    logger.info(
+        f"Sending {len(memory_window)} of {len(chat_history)} previous messages"
+    )
+
+    with agent_registry.lease() as agent:
         agent_answer = await agent.run(
-            request.current_user_prompt, message_history=chat_history
+            request.current_user_prompt, message_history=memory_window
         )
-        logger.info(f"Agent response:{agent_answer.output}")
+    logger.info(f"Agent response:{agent_answer.output}")
 
-        logger.info("Storing prompt data...")
-        prompt_data = Prompt(
-            chat_session_id=chat_session_id,
-            prompt=request.current_user_prompt,
-            response=agent_answer.output,
-        )
-        prompt_id = prompts_table.generate_new_row(prompt_data=prompt_data)
-        logger.info("Prompt data stored")
+    await store_agent_answer(
+        chat_session_id,
+        request.current_user_prompt,
+        agent_answer,
+        chat_history,
+    )
+
+    return AgentResponse(
+        agent_response=agent_answer.output,
+        chat_session_id=chat_session_id,
+    )
+
+
+async def run_agent_job(job: Job) -> dict:
+    """
+    Handler of the agent jobs, executed by the workers of agent_jobs
+
+    Args:
+        job: Job -> Job whose payload is an AgentRequest
+
+    Returns:
+        dict -> AgentResponse as a dictionary
+    """
+    logger.info(f"Running job {job.job_id} of user_id: {job.owner}")
+    response = await answer_prompt(AgentRequest(**job.payload), job.owner)
+
+    return response.model_dump()
+
+
+# Agent runs submitted as jobs, executed by a pool of workers of the instance
+agent_jobs = JobManager(
+    name="agent",
+    handler=run_agent_job,
+    backend=get_job_queue_backend(),
+    workers=jobs_config.AGENT_JOB_WORKERS,
+    result_ttl_seconds=jobs_config.AGENT_JOB_RESULT_TTL_SECONDS,
+    store=get_job_store(),
+    store_poll_seconds=jobs_config.AGENT_JOB_STORE_POLL_SECONDS,
+)
+
+
+@app.post(api_config.AGENT_REQUEST_ENDPOINT, response_model=AgentResponse)
+async def agent_request(
+    request: AgentRequest,
+    current_user_id: str = Depends(get_current_user_id_from_token),
+):
+    logger.info(f"user_id: {current_user_id}")
 
-        logger.info("Storing agent steps...")
+    try:
+        response = await answer_prompt(request, current_user_id)
 
-        # Get the history as a binary string
-        all_agent_steps = agent_answer.all_messages_json()
+    except GenAIThrottledError as e:
+        logger.warning(e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after_seconds))},
+        )
 
-        new_steps = get_new_agent_steps(
-            previous_steps=previous_agent_steps,
-            all_steps=all_agent_steps,
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
         )
 
-        # prepare the steps to be stored in the DB
-        new_steps_prepared = [
-            AgentStep(
-                chat_session_id=chat_session_id,
-                prompt_id=prompt_id,
-                step_data=new_step,
-            )
-            for new_step in new_steps
-        ]
-        agent_steps_table.store_prompt_steps(new_steps_prepared)
-        logger.info("Agent steps stored in DB")
+    return response
+
+
+@app.post(
+    api_config.AGENT_JOBS_ENDPOINT,
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=AgentJobResponse,
+)
+async def submit_agent_job(
+    request: AgentRequest,
+    response: Response,
+    current_user_id: str = Depends(get_current_user_id_from_token),
+):
+    """
+    Queue a prompt to be answered in the background. The answer is read from the job
+    endpoint, that can wait for the job to finish (long polling)
+    """
+    logger.info(f"user_id: {current_user_id}")
 
+    try:
+        job = await agent_jobs.submit(current_user_id, request.model_dump())
+    except JobQueueFullError as e:
+        logger.warning(e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "10"},
+        )
     except Exception as e:
+        # The job could not be stored
         logger.error(e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
         )
 
-    response = AgentResponse(
-        agent_response=agent_answer.output,
-        chat_session_id=chat_session_id,
+    logger.info(f"Job {job.job_id} queued")
+    response.headers["Location"] = api_config.AGENT_JOB_ENDPOINT.replace(
+        "{job_id}", job.job_id
     )
 
-    return response
+    return AgentJobResponse(**job.as_dict())
+
+
+@app.get(api_config.AGENT_JOB_ENDPOINT, response_model=AgentJobResponse)
+async def get_agent_job(
+    job_id: str,
+    wait_seconds: float = 0,
+    current_user_id: str = Depends(get_current_user_id_from_token),
+):
+    """
+    Get the status of a job and its answer once it finishes. With wait_seconds, the
+    request waits up to that time for the job to finish
+    """
+    wait_seconds = min(max(wait_seconds, 0), jobs_config.AGENT_JOB_MAX_WAIT_SECONDS)
+
+    try:
+        job = await agent_jobs.wait(job_id, current_user_id, timeout=wait_seconds)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(ve))
+
+    return AgentJobResponse(**job.as_dict())
+
+
+@app.post(api_config.AGENT_STREAM_ENDPOINT)
+async def agent_request_stream(
+    request: AgentRequest,
+    current_user_id: str = Depends(get_current_user_id_from_token),
+) -> StreamingResponse:
+    """
+    Streaming variant of the agent request, the answer is sent as server-sent events:
+        - session: chat_session_id of the request
+        - text_delta: fragment of the text generated by the model
+        - tool_call_start / tool_call_end: the agent started or finished a tool call
+        - image_url: url of an image, sent as soon as its upload finishes
+        - done: full answer and prompt_id, once the prompt and steps are stored
+        - error: the request failed, the prompt is not stored
+    """
+    logger.info(f"user_id: {current_user_id}")
+    # Inherited by the task that runs the agent
+    current_genai_user.set(current_user_id)
+
+    # The errors before the stream starts are answered as in agent_request
+    try:
+        chat_session_id, chat_history = await get_chat_session(
+            request.chat_session_id, current_user_id
+        )
+
+    except GenAIThrottledError as e:
+        logger.warning(e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after_seconds))},
+        )
+
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+    events_queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_agent() -> None:
+        try:
+            memory_window = await memory_manager.get_memory_window(
+                chat_session_id, chat_history
+            )
+            logger.info(
+                f"Streaming with {len(memory_window)} of {len(chat_history)} previous messages"
+            )
+
+            with capture_stream_events(events_queue), agent_registry.lease() as agent:
+                agent_answer = await stream_agent_run(
+                    agent, request.current_user_prompt, memory_window
+                )
+            logger.info(f"Agent response:{agent_answer.output}")
+
+            prompt_id = await store_agent_answer(
+                chat_session_id,
+                request.current_user_prompt,
+                agent_answer,
+                chat_history,
+            )
+            events_queue.put_nowait(
+                {
+                    "event": "done",
+                    "data": {
+                        "agent_response": agent_answer.output,
+                        "chat_session_id": chat_session_id,
+                        "prompt_id": prompt_id,
+                    },
+                }
+            )
+
+        except GenAIThrottledError as e:
+            logger.warning(e)
+            events_queue.put_nowait(
+                {
+                    "event": "error",
+                    "data": {
+                        "detail": str(e),
+                        "retry_after_seconds": e.retry_after_seconds,
+                    },
+                }
+            )
+
+        except Exception as e:
+            logger.error(e)
+            events_queue.put_nowait({"event": "error", "data": {"detail": str(e)}})
+
+        finally:
+            # Marks the end of the stream
+            events_queue.put_nowait(None)
+
+    # The run is not tied to the connection: if the client disconnects, the agent
+    # finishes and the prompt is stored anyway, as in the non streaming endpoint
+    task = asyncio.create_task(run_agent())
+    streaming_tasks.add(task)
+    task.add_done_callback(streaming_tasks.discard)
+
+    async def event_stream() -> AsyncIterator[str]:
+        yield format_sse("session", {"chat_session_id": chat_session_id})
+
+        while (stream_event := await events_queue.get()) is not None:
+            yield format_sse(stream_event["event"], stream_event["data"])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Proxies must not buffer the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post(
@@ -189,7 +554,12 @@ async def login_for_access_token(auth_form: OAuth2PasswordRequestForm = Depends(
 
     logger.info(f"Login request for email: {login_data.email}")
 
-    userdb = authenticate_user(email=login_data.email, password=login_data.password)
+    # authenticate_user queries BigQuery, run it without blocking the event loop
+    userdb = await run_in_bigquery_executor(
+        authenticate_user,
+        email=login_data.email,
+        password=login_data.password,
+    )
 
     if not userdb:
         logger.warning(
@@ -217,7 +587,7 @@ async def get_user_sessions(
 ):
     try:
         # get_users_sessions already has error handlers
-        chat_sessions = chat_sessions_table.get_user_sessions(current_user_id)
+        chat_sessions = await chat_sessions_table.get_user_sessions(current_user_id)
         return chat_sessions
     except ValueError as ve:
         logger.warning(
@@ -237,7 +607,7 @@ async def get_chat_history(
     chat_session_id: str, current_user_id: str = Depends(get_current_user_id_from_token)
 ):
     try:
-        prompts_list = prompts_table.get_prompts_from_user_session(
+        prompts_list = await prompts_table.get_prompts_from_user_session(
             user_id=current_user_id,
             chat_session_id=chat_session_id,
         )
@@ -255,3 +625,25 @@ async def get_chat_history(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Could not retrieve the chat session history",
         )
+
+
+@app.get(api_config.METRICS_ENDPOINT)
+async def get_metrics(
+    current_user_id: str = Depends(get_admin_user_id_from_token),
+):
+    """
+    Dump the metrics of the instance: the metrics registry, the statistics of each
+    named query, the cost of the last BigQuery queries (job id, bytes processed
+    and billed, slot milliseconds, cache hit and wall time) and the hit rates of
+    the prompt, image and decoded history caches, and the concurrency of each
+    GenAI model. Only for the users of METRICS_ADMIN_USER_IDS
+    """
+    return {
+        "metrics": metrics.snapshot(),
+        "queries": query_engine.stats(),
+        "recent_queries": get_recent_query_costs(),
+        "prompt_cache": get_prompt_cache().stats(),
+        "image_cache": image_cache.stats(),
+        "decoded_history": history_codec.stats(),
+        "genai": genai_scheduler.stats(),
+    }
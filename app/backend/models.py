@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, Literal, Optional
 from assistant_agent.schemas import (
     USER_ID_FIELD,
     EMAIL_FIELD,
@@ -25,6 +26,24 @@ class AgentResponse(BaseModel):
     chat_session_id: CHAT_SESSION_ID_FIELD
 
 
+class AgentJobResponse(BaseModel):
+    job_id: Annotated[str, Field(description="Id of the job")]
+    status: Annotated[
+        Literal["queued", "running", "succeeded", "failed"],
+        Field(description="Status of the job"),
+    ]
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Annotated[
+        Optional[AgentResponse],
+        Field(default=None, description="Answer of the agent, once the job succeeds"),
+    ]
+    error: Annotated[
+        Optional[str], Field(default=None, description="Error, if the job failed")
+    ]
+
+
 class TokenResponse(BaseModel):
     access_token: Annotated[
         str,
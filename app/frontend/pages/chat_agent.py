@@ -1,7 +1,7 @@
 import streamlit as st
 from loguru import logger
 import requests
-from app.frontend.utils import find_image_urls
+from app.frontend.utils import find_image_urls, iter_sse_events
 from app.frontend.config import PagesConfig
 from assistant_agent.config import APIConfig
 
@@ -10,7 +10,7 @@ backend_config = APIConfig()
 pages_config = PagesConfig()
 
 
-ask_agent_url = backend_config.BASE_URL + backend_config.AGENT_REQUEST_ENDPOINT
+ask_agent_url = backend_config.BASE_URL + backend_config.AGENT_STREAM_ENDPOINT
 chat_sessions_url = backend_config.BASE_URL + backend_config.CHAT_SESSIONS_ENDPOINT
 chat_history_url = (
     backend_config.BASE_URL + backend_config.CHAT_SESSION_HISTORY_ENDPOINT
@@ -227,85 +227,92 @@ if st.session_state.processing_request and st.session_state.active_prompt:
     logger.debug(f"User prompt to process: {prompt_to_process}")
 
     try:
-        with st.spinner("Agent is thinking..."):
-            # Get the chat_session_id
-            previous_chat_session_id = st.session_state.chat_session_id
+        # Get the chat_session_id
+        previous_chat_session_id = st.session_state.chat_session_id
 
-            logger.debug("Chat history obtained")
-
-            payload = {
-                "current_user_prompt": prompt_to_process,
-                "chat_session_id": previous_chat_session_id,
-            }
-            logger.debug("Payload created")
-
-            # Calling the agent API
-            logger.info("Sending prompt to the agent...")
-            response = requests.post(url=ask_agent_url, json=payload, headers=headers)
+        payload = {
+            "current_user_prompt": prompt_to_process,
+            "chat_session_id": previous_chat_session_id,
+        }
+        logger.debug("Payload created")
 
-            # Process response
+        # Calling the agent API, the answer is rendered while it is streamed
+        logger.info("Sending prompt to the agent...")
+        with requests.post(
+            url=ask_agent_url, json=payload, headers=headers, stream=True
+        ) as response:
             if response.status_code == 200:
-                try:
-                    response_data = response.json()
-
-                    # Extract agent data
-                    agent_response_text = response_data["agent_response"]
-                    new_chat_session_id = response_data["chat_session_id"]
-
-                    logger.info(f"Agent responded: '{agent_response_text}'")
-
-                    if (
-                        previous_chat_session_id is None
-                        and new_chat_session_id is not None
+                with st.chat_message("assistant"):
+                    tools_placeholder = st.empty()
+                    text_placeholder = st.empty()
+                    text_placeholder.markdown("Agent is thinking...")
+
+                    streamed_text = ""
+                    streamed_image_urls = list()
+                    tool_calls = dict()
+                    agent_response_text = None
+
+                    for event_name, event_data in iter_sse_events(
+                        response.iter_lines(decode_unicode=True)
                     ):
-                        st.session_state.sessions_loaded = False
-                        logger.info("New chat session created, reloading sessions")
-
-                    # Update chat_sesion_id
-                    st.session_state.chat_session_id = new_chat_session_id
-
-                    # Find image URLs that the agent retrieved
-                    image_urls_found = find_image_urls(agent_response_text)
-                    logger.debug(f"Image URLs found: {image_urls_found}")
-
-                    # Show agent response
-                    st.session_state.messages.append(
-                        {
-                            "role": "assistant",
-                            "content": agent_response_text,
-                            "image_urls": image_urls_found,
-                        }
-                    )
-
-                    # Force rerun just in case
-                    st.rerun()
-
-                except requests.exceptions.JSONDecodeError:
-                    logger.error(
-                        f"Failed to decode JSON. Response text: {response.text}"
-                    )
-                    st.error("Error: Could not understand the response from the agent.")
-                    st.session_state.messages.append(
-                        {
-                            "role": "assistant",
-                            "content": "Error: Invalid response format.",
-                            "image_urls": [],
-                        }
-                    )
-                except KeyError as e:
-                    logger.error(
-                        f"Missing key in API JSON response: {e}. Response: {response.json()}"
-                    )
-                    st.error(
-                        f"Error: Unexpected response structure from agent (missing {e})."
-                    )
-                    st.session_state.messages.append(
-                        {
-                            "role": "assistant",
-                            "content": f"Error: Missing expected data from agent ({e}).",
-                            "image_urls": [],
-                        }
-                    )
+                        if event_name == "session":
+                            new_chat_session_id = event_data["chat_session_id"]
+
+                            if (
+                                previous_chat_session_id is None
+                                and new_chat_session_id is not None
+                            ):
+                                st.session_state.sessions_loaded = False
+                                logger.info(
+                                    "New chat session created, reloading sessions"
+                                )
+
+                            # Update chat_sesion_id
+                            st.session_state.chat_session_id = new_chat_session_id
+
+                        elif event_name == "text_delta":
+                            streamed_text += event_data["delta"]
+                            text_placeholder.markdown(streamed_text)
+
+                        elif event_name in ("tool_call_start", "tool_call_end"):
+                            state = (
+                                "running..."
+                                if event_name == "tool_call_start"
+                                else "done"
+                            )
+                            tool_calls[event_data["tool_call_id"]] = (
+                                f"`{event_data['tool_name']}` {state}"
+                            )
+                            tools_placeholder.caption(" | ".join(tool_calls.values()))
+
+                        elif event_name == "image_url":
+                            # Show each image as soon as it is uploaded
+                            streamed_image_urls.append(event_data["url"])
+                            st.image(event_data["url"], width=600)
+
+                        elif event_name == "done":
+                            agent_response_text = event_data["agent_response"]
+
+                        elif event_name == "error":
+                            raise ValueError(event_data["detail"])
+
+                if agent_response_text is None:
+                    raise ValueError("The stream finished without an answer")
+
+                logger.info(f"Agent responded: '{agent_response_text}'")
+
+                # Find image URLs that the agent retrieved
+                image_urls_found = find_image_urls(agent_response_text)
+                logger.debug(f"Image URLs found: {image_urls_found}")
+
+                # Show agent response
+                st.session_state.messages.append(
+                    {
+                        "role": "assistant",
+                        "content": agent_response_text,
+                        "image_urls": image_urls_found or streamed_image_urls,
+                    }
+                )
 
             elif response.status_code == 401:  # Unauthorized - Invalid token or expired
                 logger.warning(
@@ -1,3 +1,5 @@
+from typing import Iterable, Iterator
+import json
 import re
 
 
@@ -6,7 +8,8 @@ def find_image_urls(text: str) -> list[str]:
     Finds image URLs within a given text string.
 
     Specifically targets URLs pointing to Google Cloud Storage (GCS)
-    and ending with common image file extensions.
+    and ending with common image file extensions, with the query string of the
+    signed URLs.
 
     Args:
         text: str -> The text string to search within.
@@ -14,7 +17,36 @@ def find_image_urls(text: str) -> list[str]:
     Returns:
         A list of found image URLs (strings). Returns an empty list if none are found.
     """
-    regex = r"https://storage\.googleapis\.com/[\w/%-]+\.png"
+    regex = r"https://storage\.googleapis\.com/[\w/%.-]+\.png(?:\?[\w%=&.~-]+)?"
     urls = re.findall(regex, text)
 
     return list(dict.fromkeys(urls))
+
+
+def iter_sse_events(lines: Iterable[str]) -> Iterator[tuple[str, dict]]:
+    """
+    Parse a server-sent events stream.
+
+    Args:
+        lines: Iterable[str] -> Lines of the stream. Ex: response.iter_lines(decode_unicode=True)
+
+    Returns:
+        Iterator[tuple[str, dict]] -> Name and JSON payload of each event
+    """
+    event_name = "message"
+    data_lines = list()
+
+    for line in lines:
+        if line == "":
+            # An empty line closes the event
+            if data_lines:
+                yield event_name, json.loads("\n".join(data_lines))
+            event_name = "message"
+            data_lines = list()
+        elif line.startswith("event:"):
+            event_name = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:") :].strip())
+
+    if data_lines:
+        yield event_name, json.loads("\n".join(data_lines))
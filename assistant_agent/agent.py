@@ -1,13 +1,20 @@
 from loguru import logger
+from pydantic import BaseModel
 from pydantic_ai import Agent, Tool
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic_ai.providers.google_gla import GoogleGLAProvider
 from assistant_agent.credentials import get_llm_config
-from assistant_agent.config import GCPConfig
+from assistant_agent.config import GCPConfig, LLMConfig
 from assistant_agent.tools.image_generator import generate_prompts, generate_images
+from assistant_agent.utils.gcp.clients import client_registry
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import copy
 import sys
+import threading
 
-llm_config = get_llm_config()
+# The API key is only read from Secret Manager when the first model is built
+llm_config = LLMConfig()
 gcp_config = GCPConfig()
 
 # Setting the logs level
@@ -23,38 +30,198 @@ system_prompt = (
     "When a user asks for an image, first consider if you need to generate a detailed prompt using generate_prompts based on the user's initial idea."
     " If you already have a suitable prompt or have just generated one, use generate_images to create and store the image(s) in GCS."
     " After generating the image(s), show the urls generated on the current prompt"
+    " If an image has no url, tell the user that it could not be generated and why"
     " Inform the user the name of the image(s)"
     "Only if the user asks, tell him that the images will be available only during one day after the image was generated"
     "Always answer to the user in the same language that he's making the question"
     "You have context of all the conversation history"
 )
-model = GeminiModel(
-    llm_config.AGENT_MODEL_NAME,
-    provider=GoogleGLAProvider(api_key=llm_config.API_KEY.get_secret_value()),
-)
+# The tools are wrapped (and their schemas generated) only once, the agents receive
+# copies of them. max_retries is set so the agent does not rebuild the tool to set it
+agent_tools = [
+    Tool(generate_prompts, takes_ctx=False, max_retries=1),
+    Tool(generate_images, takes_ctx=False, max_retries=1),
+]
+
+DEFAULT_AGENT_PROFILE = "default"
 
 
 def generate_agent_instance() -> Agent:
     """
-    Generate a new agent instance to avoid concurrency errors
-    during API execution
+    Generate a new agent instance with the default profile. The API does not build
+    agents per request, it leases them from agent_registry
 
     Args:
         None
     Returns:
         Agent -> Agent instance
     """
+    return build_agent(AgentProfile())
+
+
+class AgentProfile(BaseModel):
+    """
+    Named configuration of an agent
+    """
+
+    model_name: str = llm_config.AGENT_MODEL_NAME
+    system_prompt: str = system_prompt
+
+
+_models: dict[str, GeminiModel] = dict()
+_models_lock = threading.Lock()
+
+
+def get_model(model_name: str) -> GeminiModel:
+    """
+    Get the model shared by all the agents that use model_name
+
+    Args:
+        model_name: str -> Name of the Gemini model
 
-    agent = Agent(
-        model,
-        tools=[
-            Tool(generate_prompts, takes_ctx=False),
-            Tool(generate_images, takes_ctx=False),
-        ],
-        system_prompt=system_prompt,
+    Returns:
+        GeminiModel -> Model instance
+    """
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = GeminiModel(
+                model_name,
+                provider=GoogleGLAProvider(
+                    api_key=get_llm_config().API_KEY.get_secret_value()
+                ),
+            )
+        return _models[model_name]
+
+
+# Model of the default profile, so it can be prewarmed with the other clients
+client_registry.register("gemini", lambda: get_model(llm_config.AGENT_MODEL_NAME))
+
+
+def build_agent(profile: AgentProfile) -> Agent:
+    """
+    Build an agent from a profile, reusing the model and the tools already built
+
+    Args:
+        profile: AgentProfile -> Configuration of the agent
+
+    Returns:
+        Agent -> Agent instance
+    """
+    return Agent(
+        get_model(profile.model_name),
+        # Each agent needs its own copy of the tools, they keep the retries of the run
+        tools=[copy.copy(tool) for tool in agent_tools],
+        system_prompt=profile.system_prompt,
     )
 
-    return agent
+
+class AgentPool:
+    """
+    Agents of a profile built in advance. An agent keeps the retries of its tools while it
+    runs, so it is leased to a single request at a time. If all the agents are in use,
+    a new one is built, which is cheap because the tools are copied and not rebuilt.
+    """
+
+    def __init__(self, profile: AgentProfile, size: int = llm_config.AGENT_POOL_SIZE):
+        if size < 1:
+            raise ValueError("size must be greater than 0")
+
+        self.profile = profile
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle_agents: list[Agent] = list()
+
+    def prebuild(self) -> None:
+        """
+        Build the agents of the pool that are missing
+        """
+        with self._lock:
+            while len(self._idle_agents) < self.size:
+                self._idle_agents.append(build_agent(self.profile))
+
+    def acquire(self) -> Agent:
+        with self._lock:
+            if self._idle_agents:
+                return self._idle_agents.pop()
+
+        logger.debug("All the agents of the pool are in use, building a new one...")
+        return build_agent(self.profile)
+
+    def release(self, agent: Agent) -> None:
+        with self._lock:
+            # The extra agents built when the pool was empty are discarded
+            if len(self._idle_agents) < self.size:
+                self._idle_agents.append(agent)
+
+
+class AgentRegistry:
+    """
+    Named agent profiles of the application, each one with its pool of agents
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: dict[str, AgentPool] = dict()
+
+    def register(
+        self,
+        name: str,
+        profile: AgentProfile,
+        pool_size: int = llm_config.AGENT_POOL_SIZE,
+    ) -> None:
+        """
+        Register a profile, replacing the previous one with the same name
+
+        Args:
+            name: str -> Name of the profile
+            profile: AgentProfile -> Configuration of the agents
+            pool_size: int -> Agents kept built for the profile
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._pools[name] = AgentPool(profile, pool_size)
+
+    def names(self) -> list[str]:
+        return list(self._pools.keys())
+
+    def prebuild(self) -> None:
+        """
+        Build the agents of all the profiles, called at startup
+        """
+        for pool in list(self._pools.values()):
+            pool.prebuild()
+
+    @contextmanager
+    def lease(self, name: Optional[str] = None) -> Iterator[Agent]:
+        """
+        Get an agent of a profile for the duration of a run. Ex:
+
+            with agent_registry.lease() as agent:
+                result = await agent.run(prompt)
+
+        Args:
+            name: Optional[str] -> Name of the profile, the default profile if not passed
+
+        Returns:
+            Iterator[Agent] -> Agent that only the caller is using
+        """
+        name = name or DEFAULT_AGENT_PROFILE
+        pool = self._pools.get(name)
+
+        if pool is None:
+            raise ValueError(f"The agent profile {name} is not registered")
+
+        agent = pool.acquire()
+        try:
+            yield agent
+        finally:
+            pool.release(agent)
+
+
+agent_registry = AgentRegistry()
+agent_registry.register(DEFAULT_AGENT_PROFILE, AgentProfile())
 
 
 # This will execute the agent on the local console
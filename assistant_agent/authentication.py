@@ -5,11 +5,13 @@ import jwt
 from assistant_agent.utils.auth_auxiliars import verify_password
 from assistant_agent.schemas import User
 from assistant_agent.credentials import get_auth_config
+from assistant_agent.config import AuthConfig
 from assistant_agent.database.tables.bigquery import BQUsersTable
 from loguru import logger
 
 
-auth_config = get_auth_config()
+# The secret key is only read from Secret Manager when the first token is used
+auth_config = AuthConfig()
 
 users_table = BQUsersTable()
 
@@ -62,7 +64,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
     encoded_jwt = jwt.encode(
         to_encode,
-        auth_config.SECRET_KEY.get_secret_value(),
+        get_auth_config().SECRET_KEY.get_secret_value(),
         algorithm=auth_config.ALGORITHM,
     )
     logger.info("Access token successfully created")
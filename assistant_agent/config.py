@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import SecretStr
+from typing import Literal, Optional
 
 
 # Little change
@@ -18,6 +19,8 @@ class GCPConfig(BaseSettings):
     PROMPTS_TABLE_PK: str = "prompt_id"
     AGENT_STEPS_TABLE_NAME: str = "agent_steps"
     AGENT_STEPS_TABLE_PK: str = "step_id"
+    SESSION_SUMMARIES_TABLE_NAME: str = "session_summaries"
+    SESSION_SUMMARIES_TABLE_PK: str = "summary_id"
 
 
 # check models: https://ai.google.dev/gemini-api/docs/image-generation
@@ -31,7 +34,102 @@ class LLMConfig(BaseSettings):
     IMAGE_GENERATION_MODEL_NAME: str = "imagen-3.0-generate-002"
     IMAGE_GENERATION_TEMPERATURE: float = 0.8
     DEFAULT_GENERATED_IMAGES: int = 1
+    # Last turns of the chat (a user prompt and all the steps of the agent to answer it)
+    # sent verbatim to the agent, the previous turns are sent as a summary
     AGENT_MESSAGES_MEMORY_LIMIT: int = 5
+    MEMORY_SUMMARY_ENABLED: bool = True
+    MEMORY_SUMMARY_MODEL_NAME: str = "gemini-2.0-flash"
+    # Agents built at startup for each agent profile, more are built if all are in use
+    AGENT_POOL_SIZE: int = 4
+
+
+class ImagePipelineConfig(BaseSettings):
+    # Images of one generate_images call that are generated at the same time
+    IMAGE_GENERATION_CONCURRENCY: int = 4
+    # Images of one generate_images call that are uploaded to GCS at the same time
+    IMAGE_UPLOAD_CONCURRENCY: int = 8
+
+
+class PromptCacheConfig(BaseSettings):
+    # Reuse the prompts generated for the same idea, model and temperature
+    PROMPT_CACHE_ENABLED: bool = True
+    PROMPT_CACHE_MAX_ENTRIES: int = 1_000
+    PROMPT_CACHE_TTL_SECONDS: float = 7 * 24 * 60 * 60
+    # "gcs" also keeps the prompts in GCS, shared by all the API instances,
+    # "memory" keeps them only in the memory of the process
+    PROMPT_CACHE_BACKEND: str = "gcs"
+    PROMPT_CACHE_GCS_PATH: str = "prompt_cache"
+
+
+class GCSConfig(BaseSettings):
+    # Results of the bucket and object existence lookups, both positive and negative.
+    # Other processes (or the lifecycle rules) can create or delete objects, this is
+    # the maximum time that a result is trusted
+    GCS_EXISTENCE_CACHE_MAX_ENTRIES: int = 10_000
+    GCS_EXISTENCE_CACHE_TTL_SECONDS: float = 60
+    # Objects requested per page when a prefix is listed
+    GCS_LIST_PAGE_SIZE: int = 1_000
+    # "signed": the generated images are returned with V4 signed URLs, signed locally
+    # with the key of the service account, or by the IAM API if the credentials have
+    # no key (Cloud Run). "public": each image is made public (one more request per
+    # image) and its public url is returned
+    GCS_IMAGE_URL_MODE: Literal["signed", "public"] = "signed"
+    # Service account that signs the URLs through the IAM API, by default the one of
+    # the credentials. Needed with user credentials (gcloud auth application-default
+    # login), the user must have roles/iam.serviceAccountTokenCreator on it
+    GCS_SIGNING_SERVICE_ACCOUNT: Optional[str] = None
+    # The objects of GENAI_IMAGES_PATH are deleted after one day, the URLs expire with them
+    GCS_SIGNED_URL_EXPIRATION_SECONDS: int = 24 * 60 * 60
+    # Signed URLs already computed are reused while they are valid for at least
+    # GCS_SIGNED_URL_MIN_REMAINING_SECONDS more
+    GCS_SIGNED_URL_CACHE_MAX_ENTRIES: int = 10_000
+    GCS_SIGNED_URL_MIN_REMAINING_SECONDS: int = 6 * 60 * 60
+
+
+class ImageCacheConfig(BaseSettings):
+    # Reuse the image already generated for the same prompt, model and configuration
+    IMAGE_CACHE_ENABLED: bool = True
+    IMAGE_CACHE_MAX_ENTRIES: int = 1_000
+    # The objects of GENAI_IMAGES_PATH are deleted by a lifecycle rule after one day
+    GENAI_IMAGES_LIFETIME_SECONDS: float = 24 * 60 * 60
+    # An image is not reused if it will be deleted in less than this time
+    IMAGE_CACHE_MIN_REMAINING_SECONDS: float = 6 * 60 * 60
+    # One object per key with the name of its image, shared by every instance. It is
+    # inside GENAI_IMAGES_PATH so the lifecycle rule deletes it with the images
+    IMAGE_CACHE_INDEX_PATH: str = "genai_images/tmp/image_cache_index"
+
+
+class GenAISchedulerConfig(BaseSettings):
+    # Maximum concurrent calls per model, the limit is halved each time the model
+    # throttles and grows back slowly with the successful calls
+    GENAI_MAX_CONCURRENCY: dict[str, int] = {
+        "gemini-2.5-pro-preview-03-25": 8,
+        "imagen-3.0-generate-002": 4,
+    }
+    GENAI_DEFAULT_MAX_CONCURRENCY: int = 8
+    GENAI_MIN_CONCURRENCY: int = 1
+    GENAI_DECREASE_FACTOR: float = 0.5
+    GENAI_MAX_RETRIES: int = 4
+    GENAI_RETRY_BASE_SECONDS: float = 1.0
+    GENAI_RETRY_MAX_SECONDS: float = 16.0
+    # Maximum seconds a call can spend waiting for a slot and retrying
+    GENAI_DEADLINE_SECONDS: float = 60.0
+
+
+class ClientsConfig(BaseSettings):
+    # The clients (and the secrets they need) are created on first use. The API
+    # creates them in parallel at startup, the clients not ready after the timeout
+    # are created by the first request that uses them
+    CLIENTS_PREWARM_ENABLED: bool = True
+    CLIENTS_PREWARM_TIMEOUT_SECONDS: float = 30
+
+
+class SecretsConfig(BaseSettings):
+    # Age after which a secret is fetched again in the background, the cached value
+    # is used meanwhile. Only the "latest" version of a secret can change
+    SECRETS_CACHE_TTL_SECONDS: float = 900
+    # Maximum number of secrets fetched at the same time
+    SECRETS_FETCH_MAX_WORKERS: int = 4
 
 
 class AuthConfig(BaseSettings):
@@ -46,7 +144,123 @@ class AuthConfig(BaseSettings):
 class APIConfig(BaseSettings):
     BASE_URL: str = "https://agent-api-214571216460.northamerica-south1.run.app"
     AGENT_REQUEST_ENDPOINT: str = "/ask_agent"
+    AGENT_STREAM_ENDPOINT: str = "/ask_agent/stream"
     CREATE_USER_ENDPOINT: str = "/add_user"
     LOGIN_ENDPOINT: str = "/login"
     CHAT_SESSIONS_ENDPOINT: str = "/chat_sessions"
     CHAT_SESSION_HISTORY_ENDPOINT: str = "/chat_sessions/{chat_session_id}/history"
+    METRICS_ENDPOINT: str = "/metrics"
+    # Users that can read the metrics endpoint (the queries, caches, jobs and costs
+    # of the instance), nobody if empty
+    METRICS_ADMIN_USER_IDS: list[str] = []
+    AGENT_JOBS_ENDPOINT: str = "/ask_agent/jobs"
+    AGENT_JOB_ENDPOINT: str = "/ask_agent/jobs/{job_id}"
+
+
+class AgentJobsConfig(BaseSettings):
+    # Agent runs submitted as jobs that are executed at the same time by the instance
+    AGENT_JOB_WORKERS: int = 4
+    # Only "local" is supported: the jobs are queued in the memory of the instance
+    AGENT_JOB_QUEUE_BACKEND: str = "local"
+    AGENT_JOB_MAX_QUEUED: int = 100
+    # Time that the result of a job can be read after it finishes
+    AGENT_JOB_RESULT_TTL_SECONDS: float = 3600
+    # Maximum time that a status request waits for the job to finish (long polling)
+    AGENT_JOB_MAX_WAIT_SECONDS: float = 30
+    # "gcs" stores the state of each job in GCS, so any instance answers its status
+    # requests. "local" keeps it only in the instance that runs the job
+    AGENT_JOB_STORE: str = "gcs"
+    AGENT_JOB_STORE_PATH: str = "agent_jobs"
+    # Time between reads of the store while waiting for a job of another instance
+    AGENT_JOB_STORE_POLL_SECONDS: float = 1
+
+
+class BQWriteBufferConfig(BaseSettings):
+    BQ_WRITE_BUFFER_ENABLED: bool = True
+    # Tables whose inserts are coalesced in the write-behind buffer. The users table
+    # is left out because a new user must be readable right after the registration.
+    BQ_WRITE_BUFFER_TABLES: list[str] = ["chat_sessions", "prompts", "agent_steps"]
+    BQ_WRITE_BUFFER_MAX_BATCH_ROWS: int = 500
+    BQ_WRITE_BUFFER_MAX_BATCH_BYTES: int = 5_000_000
+    BQ_WRITE_BUFFER_MAX_BATCH_AGE_SECONDS: float = 1.0
+    BQ_WRITE_BUFFER_MAX_QUEUED_ROWS: int = 10_000
+    BQ_WRITE_BUFFER_ENQUEUE_TIMEOUT_SECONDS: float = 10.0
+    BQ_WRITE_BUFFER_FLUSH_RETRIES: int = 3
+    BQ_WRITE_BUFFER_SHUTDOWN_TIMEOUT_SECONDS: float = 30.0
+    # GCS folder (in BUCKET_NAME) where the rows that could not be inserted after the
+    # retries are written, one JSON row per line. None to only log them
+    BQ_WRITE_BUFFER_DEAD_LETTER_PATH: Optional[str] = "bq_dead_letter"
+
+
+class IDAllocatorConfig(BaseSettings):
+    # "gcs" keeps the sequences shared by all the API instances in GCS objects,
+    # "local" keeps them only in memory, valid only if one single process writes in the tables
+    ID_ALLOCATOR_BACKEND: str = "gcs"
+    ID_ALLOCATOR_GCS_PATH: str = "id_sequences"
+    ID_ALLOCATOR_MAX_SEQUENCES: int = 10_000
+    ID_ALLOCATOR_MAX_RETRIES: int = 10
+    # First wait before retrying a reservation rejected by the rate limit of GCS
+    # (429) or by an outage (503), doubled at each retry
+    ID_ALLOCATOR_BACKOFF_SECONDS: float = 0.5
+
+
+class HistoryCacheConfig(BaseSettings):
+    HISTORY_CACHE_ENABLED: bool = True
+    HISTORY_CACHE_MAX_SESSIONS: int = 1_000
+    HISTORY_CACHE_MAX_BYTES: int = 200_000_000
+    # Sessions answered by other instances make the cached history stale, so before
+    # using it, the number of steps of the session is checked with a short query.
+    # Only disable it if a single instance answers each session (session affinity)
+    HISTORY_CACHE_VALIDATION_ENABLED: bool = True
+    # Maximum time that a cached history is kept
+    HISTORY_CACHE_TTL_SECONDS: float = 900
+
+
+class BQExecutorConfig(BaseSettings):
+    # Threads that run the BigQuery calls of the async data-access layer, it is also
+    # the maximum number of concurrent BigQuery calls of the process
+    BQ_EXECUTOR_MAX_WORKERS: int = 16
+
+
+class BQMetadataConfig(BaseSettings):
+    # Lifetime of the cached datasets, tables and schemas. A write that fails
+    # because the table was not found refreshes the cache immediately
+    BQ_METADATA_TTL_SECONDS: float = 3600
+    BQ_METADATA_MAX_ENTRIES: int = 256
+    # Validate the rows against the cached schema before sending them to BigQuery
+    BQ_VALIDATE_ROWS: bool = True
+
+
+class BQQueryConfig(BaseSettings):
+    # Run the point lookups with query_and_wait, which returns the rows of a fast
+    # query in the same request instead of creating a job and polling it.
+    # If False, every query creates a full job
+    BQ_SHORT_QUERIES_ENABLED: bool = True
+    # Let BigQuery run the short queries without creating a job at all (optional job creation)
+    BQ_JOBLESS_QUERIES_ENABLED: bool = True
+
+
+class BQTableLayoutConfig(BaseSettings):
+    # The tables are partitioned by day on this column
+    BQ_PARTITION_FIELD: str = "created_at"
+    # Days that a partition is kept, None to keep the data forever
+    BQ_PARTITION_EXPIRATION_DAYS: Optional[int] = None
+    # Columns used to cluster each table, in the order used by the lookups. The queries
+    # filter by these columns, so clustering is what reduces the bytes scanned per query
+    BQ_CLUSTERING_FIELDS: dict[str, list[str]] = {
+        "chat_sessions": ["user_id", "chat_session_id"],
+        "prompts": ["chat_session_id", "prompt_id"],
+        "agent_steps": ["chat_session_id", "prompt_id"],
+        "session_summaries": ["chat_session_id"],
+    }
+
+
+class BQCostConfig(BaseSettings):
+    # Queries that would bill more bytes fail instead of running, None for no limit
+    BQ_MAXIMUM_BYTES_BILLED: Optional[int] = None
+    # Estimate the bytes of each query with a dry run before running it, and reject
+    # it if it would process more than BQ_DRY_RUN_MAX_BYTES. It adds a request per query
+    BQ_DRY_RUN_GUARD_ENABLED: bool = False
+    BQ_DRY_RUN_MAX_BYTES: int = 1024 * 1024 * 1024  # 1GB
+    # Number of recent queries whose cost is kept to be inspected
+    BQ_RECENT_QUERIES: int = 200
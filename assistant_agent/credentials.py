@@ -4,32 +4,64 @@ import sys
 sys.path.append("..")
 
 from assistant_agent.config import GCPConfig, LLMConfig, AuthConfig
-from assistant_agent.utils.gcp.secret_manager import get_secret
+from assistant_agent.utils.gcp.secret_manager import secret_cache
+from typing import Optional
 
 gcp_config = GCPConfig()
 llm_config = LLMConfig()
 auth_config = AuthConfig()
 
 
-@lru_cache()
 def get_llm_config() -> LLMConfig:
     """
-    Get the LLMConfig class
+    Get the LLMConfig class, with the API key read from Secret Manager. The key is
+    cached and refreshed in the background, a rotated key is returned once it is fetched
     """
-    secret_id = llm_config.SECRET_ID
-    version_id = llm_config.SECRET_VERSION
-    api_key = get_secret(secret_id, version_id, gcp_config.PROJECT_ID)
+    api_key = secret_cache.get(
+        llm_config.SECRET_ID, llm_config.SECRET_VERSION, gcp_config.PROJECT_ID
+    )
 
-    return LLMConfig(API_KEY=api_key)
+    return _build_llm_config(api_key.get_secret_value())
 
 
-@lru_cache()
 def get_auth_config() -> AuthConfig:
     """
-    Get the AuthConfig class
+    Get the AuthConfig class, with the secret key read from Secret Manager. The key
+    is cached and refreshed in the background, a rotated key is returned once it is fetched
     """
-    secret_id = auth_config.SECRET_ID
-    version_id = auth_config.SECRET_VERSION
-    secret_key = get_secret(secret_id, version_id, gcp_config.PROJECT_ID)
+    secret_key = secret_cache.get(
+        auth_config.SECRET_ID, auth_config.SECRET_VERSION, gcp_config.PROJECT_ID
+    )
+
+    return _build_auth_config(secret_key.get_secret_value())
+
+
+# The configs are only built again when a secret changes
+@lru_cache(maxsize=2)
+def _build_llm_config(api_key: str) -> LLMConfig:
+    return LLMConfig(API_KEY=api_key)
+
 
+@lru_cache(maxsize=2)
+def _build_auth_config(secret_key: str) -> AuthConfig:
     return AuthConfig(SECRET_KEY=secret_key)
+
+
+def prefetch_credentials(timeout: Optional[float] = None) -> dict[str, Optional[str]]:
+    """
+    Read all the secrets of the application concurrently, called at startup
+
+    Args:
+        timeout: Optional[float] -> Maximum seconds to wait, None to wait for all of them
+
+    Returns:
+        dict[str, Optional[str]] -> secret_id -> None if it was read, or the error
+    """
+    return secret_cache.prefetch(
+        [
+            (llm_config.SECRET_ID, llm_config.SECRET_VERSION),
+            (auth_config.SECRET_ID, auth_config.SECRET_VERSION),
+        ],
+        gcp_config.PROJECT_ID,
+        timeout=timeout,
+    )
@@ -0,0 +1,304 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from google.api_core.exceptions import ServiceUnavailable, TooManyRequests
+from typing import Callable, Iterator, Optional
+from loguru import logger
+import json
+import random
+import threading
+import time
+from assistant_agent.config import IDAllocatorConfig, GCPConfig
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.utils.metrics import metrics
+from assistant_agent.utils.gcp.gcs import (
+    get_text_with_generation,
+    upload_text_if_generation_match,
+)
+
+allocator_config = IDAllocatorConfig()
+gcp_config = GCPConfig()
+
+
+class SequenceBackend(ABC):
+    """
+    Storage shared by all the processes that allocate numbers of the same sequences
+    """
+
+    @abstractmethod
+    def reserve(self, sequence_key: str, count: int, seed: Callable[[], int]) -> int:
+        """
+        Reserve the next 'count' numbers of a sequence
+
+        Args:
+            sequence_key: str -> Identifier of the sequence
+            count: int -> Amount of numbers to reserve
+            seed: Callable[[], int] -> Function that returns the last number used,
+                                       called only if the backend does not know the sequence yet
+
+        Returns:
+            int -> First number reserved, the numbers reserved are [first, first + count)
+        """
+        pass
+
+
+class GCSSequenceBackend(SequenceBackend):
+    """
+    Keeps the last number of each sequence in a GCS object, the numbers are reserved
+    with a compare-and-swap over the generation of the object, so the same number is
+    never given to two processes.
+
+    The generation written by the last reservation of the process is remembered, so
+    while no other process reserves numbers of the sequence, a reservation is a single
+    conditional write instead of a read and a write.
+
+    GCS accepts about one write per second on the same object, and there is one object
+    per parent (Ex: the prompts of a chat session), which are created at the pace of a
+    user. The writes rejected by the rate limit (429) or by an outage (503) are retried
+    with exponential backoff. A write that was applied although it failed is seen as a
+    conflict by the retry, so its numbers are skipped, never given twice.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str = gcp_config.BUCKET_NAME,
+        gcs_path: str = allocator_config.ID_ALLOCATOR_GCS_PATH,
+        max_retries: int = allocator_config.ID_ALLOCATOR_MAX_RETRIES,
+        backoff_seconds: float = allocator_config.ID_ALLOCATOR_BACKOFF_SECONDS,
+        max_sequences: int = allocator_config.ID_ALLOCATOR_MAX_SEQUENCES,
+    ):
+        self.bucket_name = bucket_name
+        self.gcs_path = gcs_path
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        # Sequence key -> (generation, last number) written by this process
+        self._written = LRUCache(
+            name="id_sequences", max_entries=max_sequences, size_function=lambda _: 0
+        )
+
+    def reserve(self, sequence_key: str, count: int, seed: Callable[[], int]) -> int:
+        blob_name = f"{self.gcs_path}/{sequence_key}.json"
+        written = self._written.get(sequence_key)
+
+        for attempt in range(self.max_retries):
+            try:
+                if written is not None:
+                    generation, last_number = written
+                else:
+                    text, generation = get_text_with_generation(
+                        blob_name, self.bucket_name
+                    )
+                    last_number = (
+                        json.loads(text)["last"] if text is not None else seed()
+                    )
+
+                new_last_number = last_number + count
+                new_generation = upload_text_if_generation_match(
+                    blob_name,
+                    json.dumps({"last": new_last_number}),
+                    self.bucket_name,
+                    generation,
+                )
+            except (TooManyRequests, ServiceUnavailable) as e:
+                metrics.increment(
+                    "id_allocator_transient_errors", labels={"error": type(e).__name__}
+                )
+                logger.warning(
+                    f"Transient error reserving numbers of {sequence_key}, retrying: {e}"
+                )
+                # The object could have been written, it is read again
+                written = None
+                self._written.invalidate(sequence_key)
+                time.sleep(self.backoff_seconds * 2**attempt * random.uniform(0.5, 1))
+                continue
+
+            if new_generation is not None:
+                self._written.put(sequence_key, (new_generation, new_last_number))
+                return last_number + 1
+
+            if written is not None:
+                # Another process wrote the object since this one did, read it again
+                written = None
+                self._written.invalidate(sequence_key)
+                continue
+
+            # Another process reserved numbers in between, try again
+            logger.debug(f"Conflict reserving numbers of {sequence_key}, retrying...")
+            time.sleep(random.uniform(0, 0.05 * 2**attempt))
+
+        raise ValueError(
+            f"Could not reserve numbers of the sequence {sequence_key} "
+            f"after {self.max_retries} attempts"
+        )
+
+
+class _Sequence:
+    """
+    State of a sequence inside the process
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Number after the last one given by this process, None if none was given yet.
+        # The sequences that are not shared give their numbers from here
+        self.next_number: Optional[int] = None
+        # True if the parent was created by this process, so its last number is 0
+        self.new_parent: bool = False
+        # Callers between _use_sequence and the end of their use, changed under the
+        # lock of the allocator. A sequence in use is never evicted
+        self.users: int = 0
+
+
+class IDAllocator:
+    """
+    Hands out the sequence numbers used to build the ids of the tables (Ex: the 007 of
+    CS2505ABC123-007) from an in-process cache, so the numbers can be obtained without querying
+    the tables.
+
+    A sequence is seeded once per parent (Ex: the sessions of a user), with the last number
+    stored in the table. After that, the numbers are given from memory if the sequence
+    is local, or reserved in the shared backend if it is shared.
+
+    The shared numbers are reserved one request at a time, exactly the numbers requested.
+    Reading MAX() of the table instead is not safe with several instances, two of them
+    can read the same maximum before any of them inserts its row, and the rows stay in
+    the write buffer for a while after the id is given.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[SequenceBackend] = None,
+        max_sequences: int = allocator_config.ID_ALLOCATOR_MAX_SEQUENCES,
+    ):
+        if max_sequences < 1:
+            raise ValueError("max_sequences must be greater than 0")
+
+        self.backend = backend
+        self.max_sequences = max_sequences
+        self._lock = threading.Lock()
+        self._sequences: OrderedDict[str, _Sequence] = OrderedDict()
+
+    @contextmanager
+    def _use_sequence(self, sequence_key: str) -> Iterator[_Sequence]:
+        """
+        Get the state of a sequence, creating it if needed, and keep it in the allocator
+        while it is used. The least recently used sequences that nobody is using are
+        evicted when there are too many
+        """
+        with self._lock:
+            sequence = self._sequences.get(sequence_key)
+
+            if sequence is None:
+                sequence = _Sequence()
+                self._sequences[sequence_key] = sequence
+            else:
+                self._sequences.move_to_end(sequence_key)
+
+            # Taken under the same lock as the lookup, so the sequence cannot be evicted
+            # before the caller uses it
+            sequence.users += 1
+
+            for key in list(self._sequences.keys()):
+                if len(self._sequences) <= self.max_sequences:
+                    break
+                if self._sequences[key].users == 0:
+                    del self._sequences[key]
+
+        try:
+            yield sequence
+        finally:
+            with self._lock:
+                sequence.users -= 1
+
+    def mark_new_parent(self, sequence_key: str) -> None:
+        """
+        Tell the allocator that the parent of a sequence was just created, so its numbers
+        start in 1 and there is no need to look for the last number in the table.
+
+        Args:
+            sequence_key: str -> Identifier of the sequence
+
+        Returns:
+            None
+        """
+        with self._use_sequence(sequence_key) as sequence, sequence.lock:
+            if sequence.next_number is None:
+                sequence.new_parent = True
+
+    def next_numbers(
+        self,
+        sequence_key: str,
+        seed: Callable[[], int],
+        count: int = 1,
+        shared: bool = True,
+    ) -> list[int]:
+        """
+        Get the next numbers of a sequence
+
+        Args:
+            sequence_key: str -> Identifier of the sequence. Ex: "prompts/CS2505ABC123-001"
+            seed: Callable[[], int] -> Function that returns the last number stored in the table,
+                                       called at most once per sequence
+            count: int -> Amount of consecutive numbers to get
+            shared: bool -> False if only this process allocates numbers of the sequence,
+                            in that case the shared backend is never used
+
+        Returns:
+            list[int] -> Numbers allocated, consecutive and in increasing order
+        """
+        if count < 1:
+            raise ValueError("count must be greater than 0")
+
+        with self._use_sequence(sequence_key) as sequence, sequence.lock:
+            seed_function = (lambda: 0) if sequence.new_parent else seed
+
+            if not shared or self.backend is None:
+                if sequence.next_number is None:
+                    sequence.next_number = seed_function() + 1
+
+                first_number = sequence.next_number
+                sequence.next_number += count
+            else:
+                first_number = self.backend.reserve(sequence_key, count, seed_function)
+                sequence.next_number = first_number + count
+
+        return list(range(first_number, first_number + count))
+
+    def next_number(
+        self, sequence_key: str, seed: Callable[[], int], shared: bool = True
+    ) -> int:
+        """
+        Get the next number of a sequence, see next_numbers
+        """
+        return self.next_numbers(sequence_key, seed, count=1, shared=shared)[0]
+
+
+_id_allocator: Optional[IDAllocator] = None
+_id_allocator_lock = threading.Lock()
+
+
+def get_id_allocator() -> IDAllocator:
+    """
+    Get the allocator shared by all the tables of the process
+
+    Returns:
+        IDAllocator -> Allocator configured with IDAllocatorConfig
+    """
+    global _id_allocator
+
+    with _id_allocator_lock:
+        if _id_allocator is None:
+            backend_name = allocator_config.ID_ALLOCATOR_BACKEND
+
+            if backend_name == "gcs":
+                backend = GCSSequenceBackend()
+            elif backend_name == "local":
+                backend = None
+            else:
+                raise ValueError(
+                    f"Unknown ID_ALLOCATOR_BACKEND '{backend_name}', use 'gcs' or 'local'"
+                )
+
+            _id_allocator = IDAllocator(backend=backend)
+
+    return _id_allocator
@@ -0,0 +1,202 @@
+from assistant_agent.config import GCPConfig, BQTableLayoutConfig
+from assistant_agent.utils.gcp.bigquery import (
+    create_table,
+    delete_table,
+    get_table_metadata,
+    invalidate_metadata,
+    query_data,
+)
+from datetime import datetime, timezone
+from google.cloud import bigquery
+from loguru import logger
+from typing import Optional
+import argparse
+
+gcp_config = GCPConfig()
+layout_config = BQTableLayoutConfig()
+
+# Rebuilds the tables with the layout defined in BQTableLayoutConfig. The API must be
+# stopped while a table is migrated, the rows inserted after the copy would be lost.
+# Usage: python -m assistant_agent.database.migrate_tables [--tables prompts] [--dry-run]
+
+
+def has_expected_layout(table: bigquery.Table, clustering_fields: list[str]) -> bool:
+    """
+    Check if a table is already partitioned and clustered as expected
+
+    Args:
+        table: bigquery.Table -> Table to check
+        clustering_fields: list[str] -> Expected clustering columns
+
+    Returns:
+        bool -> True if the table does not need to be migrated
+    """
+    partitioning = table.time_partitioning
+
+    expected_expiration_ms = (
+        layout_config.BQ_PARTITION_EXPIRATION_DAYS * 24 * 60 * 60 * 1000
+        if layout_config.BQ_PARTITION_EXPIRATION_DAYS is not None
+        else None
+    )
+
+    return (
+        partitioning is not None
+        and partitioning.field == layout_config.BQ_PARTITION_FIELD
+        and partitioning.expiration_ms == expected_expiration_ms
+        and list(table.clustering_fields or []) == clustering_fields
+    )
+
+
+def migrate_table(
+    table_name: str,
+    dataset_name: str = gcp_config.BQ_DATASET_ID,
+    project_id: str = gcp_config.PROJECT_ID,
+    dry_run: bool = False,
+    drop_backup: bool = False,
+) -> Optional[str]:
+    """
+    Rebuild a table with the layout of BQTableLayoutConfig. The rows are copied into a
+    new table, then the original table is renamed as a backup and the new table takes
+    its name.
+
+    Args:
+        table_name: str -> Name of the table to migrate
+        dataset_name: str -> Name of the dataset of the table
+        project_id: str -> Project of the dataset
+        dry_run: bool -> Only log what would be done
+        drop_backup: bool -> Delete the original table once the migration finishes
+
+    Returns:
+        Optional[str] -> Name of the backup table, None if the table was not migrated
+                         or the backup was deleted
+    """
+    if table_name not in layout_config.BQ_CLUSTERING_FIELDS:
+        raise ValueError(f"There is no layout defined for the table {table_name}")
+
+    clustering_fields = layout_config.BQ_CLUSTERING_FIELDS[table_name]
+
+    table = get_table_metadata(table_name, dataset_name, project_id, refresh=True)
+    if table is None:
+        raise ValueError(
+            f"Table {table_name} does not exist in dataset {dataset_name}."
+        )
+
+    if has_expected_layout(table, clustering_fields):
+        logger.info(f"Table {table_name} already has the expected layout.")
+        return None
+
+    # A table cannot be renamed while it has rows in the streaming buffer, and the
+    # rows that are still arriving would not be copied
+    if table.streaming_buffer is not None:
+        raise ValueError(
+            f"Table {table_name} has rows in the streaming buffer. Stop the API and "
+            "try again once the buffer is empty (it can take up to 90 minutes)."
+        )
+
+    suffix = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    new_table_name = f"{table_name}_migration_{suffix}"
+    backup_table_name = f"{table_name}_backup_{suffix}"
+    dataset = f"{project_id}.{dataset_name}"
+
+    logger.info(
+        f"Migrating {table_name} ({table.num_rows} rows): partitioned by "
+        f"{layout_config.BQ_PARTITION_FIELD}, clustered by {', '.join(clustering_fields)}"
+    )
+
+    if dry_run:
+        logger.info(
+            f"Dry run: {table_name} would be copied into {new_table_name} "
+            f"and renamed as {backup_table_name}"
+        )
+        return None
+
+    # The new table keeps the columns and modes of the original one
+    create_table(
+        table_name=new_table_name,
+        dataset_name=dataset_name,
+        project_id=project_id,
+        schema=list(table.schema),
+        partition_field=layout_config.BQ_PARTITION_FIELD,
+        partition_expiration_days=layout_config.BQ_PARTITION_EXPIRATION_DAYS,
+        clustering_fields=clustering_fields,
+    )
+
+    logger.info(f"Copying the rows of {table_name}...")
+    query_data(
+        f"insert into `{dataset}.{new_table_name}` select * from `{dataset}.{table_name}`",
+        operation="migrate_tables.copy",
+    )
+
+    counts = next(
+        query_data(
+            f"""
+            select
+                (select count(*) from `{dataset}.{table_name}`) as original_rows,
+                (select count(*) from `{dataset}.{new_table_name}`) as new_rows
+            """,
+            operation="migrate_tables.count",
+        )
+    )
+    if counts.original_rows != counts.new_rows:
+        raise ValueError(
+            f"The copy of {table_name} has {counts.new_rows} rows instead of "
+            f"{counts.original_rows}, the original table was not modified."
+        )
+
+    logger.info(f"Replacing {table_name}...")
+    query_data(
+        f"alter table `{dataset}.{table_name}` rename to `{backup_table_name}`",
+        operation="migrate_tables.rename",
+    )
+    query_data(
+        f"alter table `{dataset}.{new_table_name}` rename to `{table_name}`",
+        operation="migrate_tables.rename",
+    )
+
+    for name in [table_name, new_table_name, backup_table_name]:
+        invalidate_metadata(dataset_name, project_id, name)
+
+    logger.info(f"Table {table_name} migrated, the original is {backup_table_name}")
+
+    if drop_backup:
+        delete_table(backup_table_name, dataset_name, project_id)
+        return None
+
+    return backup_table_name
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the BigQuery tables with partitioning and clustering"
+    )
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        default=list(layout_config.BQ_CLUSTERING_FIELDS.keys()),
+        help="Tables to migrate, by default all the tables with a layout defined",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only show what would be done"
+    )
+    parser.add_argument(
+        "--drop-backup",
+        action="store_true",
+        help="Delete the original tables after the migration",
+    )
+    args = parser.parse_args()
+
+    for table_name in args.tables:
+        # The tables are created by terraform, a table that was not deployed yet has
+        # nothing to migrate
+        table = get_table_metadata(
+            table_name, gcp_config.BQ_DATASET_ID, gcp_config.PROJECT_ID, refresh=True
+        )
+        if table is None:
+            logger.warning(f"Table {table_name} does not exist, it is not migrated.")
+            continue
+
+        migrate_table(table_name, dry_run=args.dry_run, drop_backup=args.drop_backup)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,24 @@ from .users import BQUsersTable
 from .chat_sessions import BQChatSessionsTable
 from .prompts import BQPromptsTable
 from .agent_history import BQAgentStepsTable
+from .session_summaries import BQSessionSummariesTable
+from .async_tables import (
+    AsyncBQUsersTable,
+    AsyncBQChatSessionsTable,
+    AsyncBQPromptsTable,
+    AsyncBQAgentStepsTable,
+    AsyncBQSessionSummariesTable,
+)
 
 __all__ = [
     "BQUsersTable",
     "BQChatSessionsTable",
     "BQPromptsTable",
     "BQAgentStepsTable",
+    "BQSessionSummariesTable",
+    "AsyncBQUsersTable",
+    "AsyncBQChatSessionsTable",
+    "AsyncBQPromptsTable",
+    "AsyncBQAgentStepsTable",
+    "AsyncBQSessionSummariesTable",
 ]
@@ -1,18 +1,63 @@
 from .bq_base import BigQueryTable
+from .session_summaries import summaries_cache
 from assistant_agent.database.tables.bigquery import BQPromptsTable, BQChatSessionsTable
-from assistant_agent.config import GCPConfig
-from assistant_agent.utils.gcp.bigquery import query_data, insert_rows
+from assistant_agent.config import GCPConfig, HistoryCacheConfig
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.utils.history_codec import history_codec
+from assistant_agent.utils.metrics import metrics
 from assistant_agent.schemas import AgentStep
 from datetime import datetime, timezone
 from loguru import logger
 
 gcp_config = GCPConfig()
+history_cache_config = HistoryCacheConfig()
+
+
+def _steps_size(steps: list[str]) -> int:
+    """
+    Approximate size in bytes of a list of agent steps
+    """
+    return sum([len(step) for step in steps])
+
+
+# Chat histories shared by all the instances of the table, the key is the chat_session_id.
+# The steps are kept as the JSON stored in the table, they are decoded by the HistoryCodec
+history_cache = LRUCache(
+    name="chat_history",
+    max_entries=history_cache_config.HISTORY_CACHE_MAX_SESSIONS,
+    max_bytes=history_cache_config.HISTORY_CACHE_MAX_BYTES,
+    ttl_seconds=history_cache_config.HISTORY_CACHE_TTL_SECONDS,
+    size_function=_steps_size,
+)
 
 
 class BQAgentStepsTable(BigQueryTable):
     __name: str = gcp_config.AGENT_STEPS_TABLE_NAME
     __primary_key: str = gcp_config.AGENT_STEPS_TABLE_PK
 
+    _queries: dict[str, str] = {
+        **BigQueryTable._queries,
+        "get_chat_session_history": """
+            select
+                {primary_key},
+                created_at,
+                to_json_string(step_data) as step_data
+            from {table}
+            where chat_session_id = @chat_session_id
+            order by created_at asc, {primary_key} asc
+        """,
+        "count_session_steps": """
+            select
+                count(*) as steps_count
+            from {table}
+            where chat_session_id = @chat_session_id
+        """,
+    }
+    _short_queries: set[str] = {
+        *BigQueryTable._short_queries,
+        "count_session_steps",
+    }
+
     def __init__(self):
         super().__init__()
         self._prompts_table: BQPromptsTable = BQPromptsTable()
@@ -26,33 +71,124 @@ class BQAgentStepsTable(BigQueryTable):
     def primary_key(self):
         return self.__primary_key
 
-    def _generate_id(self, prompt_id: str) -> str:
+    @property
+    def history_cache(self) -> LRUCache:
+        return history_cache
+
+    def start_session_history(self, chat_session_id: str) -> None:
         """
-        Generate an agent_step_id
+        Cache an empty history for a chat session that was just created, so its
+        following turns do not need to read the history from BigQuery
 
         Args:
-            prompt_id: str -> ID of the prompt that generated the step
+            chat_session_id: str -> Id of the new chat session
 
         Returns:
-            str -> agent_step_id
+            None
+        """
+        if history_cache_config.HISTORY_CACHE_ENABLED:
+            history_cache.put(chat_session_id, list(), size=0)
+
+    def invalidate_session_history(self, chat_session_id: str) -> bool:
+        """
+        Remove the history of a chat session from the cache, the next read will
+        get it from BigQuery
+
+        Args:
+            chat_session_id: str -> Id of the chat session
+
+        Returns:
+            bool -> True if the history was cached
+        """
+        return history_cache.invalidate(chat_session_id)
+
+    def _append_to_cached_history(
+        self, chat_session_id: str, new_steps: list[str]
+    ) -> None:
+        """
+        Add new steps (JSON strings) at the end of the cached history of a chat
+        session, if it is cached
+        """
+        history_cache.update(
+            chat_session_id,
+            lambda history: history + new_steps,
+            size_delta=_steps_size(new_steps),
+        )
+
+    def _cached_history_is_fresh(
+        self, chat_session_id: str, cached_history: list[str]
+    ) -> bool:
+        """
+        Check that no other instance added steps to a cached history. The table is
+        append-only, so the history is up to date if it has as many steps as the table
+        plus the steps of the session that are still in the write buffer
+
+        Args:
+            chat_session_id: str -> Id of the chat session
+            cached_history: list[str] -> History of the session in the cache
+
+        Returns:
+            bool -> True if the cached history has all the steps of the session
+        """
+        # Read the buffer before querying BigQuery. A step that leaves the buffer while
+        # the query runs is counted twice, which only makes the history be read again
+        pending_steps = self._pending_rows(
+            self.name, "chat_session_id", chat_session_id
+        )
+
+        rows_iterator = self._run_query(
+            "count_session_steps", chat_session_id=chat_session_id
+        )
+        steps_count = next(rows_iterator).steps_count
+
+        return steps_count + len(pending_steps) == len(cached_history)
+
+    def _next_step_numbers(self, prompt_id: str, count: int) -> list[int]:
         """
-        if not self._prompts_table.prompt_exists(prompt_id):
-            raise ValueError("The prompt_id does not exist")
+        Get the next step numbers of a prompt from the id allocator
+
+        Args:
+            prompt_id: str -> ID of the prompt that generated the steps
+            count: int -> Amount of step numbers needed
 
-        query = f"""
-                select
-                    count(*) as total_prompt_steps
-                from {self.project_id}.{self.dataset_id}.{self.name}
-                where prompt_id = '{prompt_id}'
-                """
+        Returns:
+            list[int] -> Consecutive step numbers
+        """
 
-        # Query the BigQuery database to get the total number of steps in the prompt
-        row_iterator = query_data(query=query)
+        def seed() -> int:
+            # Only executed the first time a step is generated for the prompt
+            if not self._prompts_table.prompt_exists(prompt_id):
+                raise ValueError("The prompt_id does not exist")
 
-        prompt_steps = next(row_iterator).total_prompt_steps
+            # Last step number of the prompt, including the steps
+            # that are still in the write buffer
+            return self._last_sequence_number(
+                table_name=self.name,
+                id_column_name=self.primary_key,
+                parent_column_name="prompt_id",
+                parent_value=prompt_id,
+            )
 
-        # Generate the step_id
-        next_id = prompt_steps + 1
+        # The steps of a prompt are stored by the same request that generated
+        # the prompt, so the sequence does not need to be shared between instances
+        return self.id_allocator.next_numbers(
+            sequence_key=f"{self.name}/{prompt_id}",
+            seed=seed,
+            count=count,
+            shared=False,
+        )
+
+    def _generate_id(self, prompt_id: str) -> str:
+        """
+        Generate an agent_step_id
+
+        Args:
+            prompt_id: str -> ID of the prompt that generated the step
+
+        Returns:
+            str -> agent_step_id
+        """
+        next_id = self._next_step_numbers(prompt_id, count=1)[0]
 
         # Extract the first numbers of the prompt_id
         prompt_number = prompt_id[3:].replace("-", "")
@@ -96,10 +232,8 @@ class BQAgentStepsTable(BigQueryTable):
         logger.info("Inserting data...")
 
         try:
-            insert_rows(
+            self._insert_rows(
                 table_name=self.name,
-                dataset_name=self.dataset_id,
-                project_id=self.project_id,
                 rows=[
                     step_data.model_dump(),
                 ],
@@ -107,6 +241,8 @@ class BQAgentStepsTable(BigQueryTable):
         except Exception as e:
             raise ValueError(f"Error while inserting prompt's data into BigQuery: {e}")
 
+        self._append_to_cached_history(step_data.chat_session_id, [step_data.step_data])
+
     def generate_new_row(self, step_data: AgentStep) -> str:
         """
         Public method to generate a new row in the agent_steps table
@@ -130,32 +266,78 @@ class BQAgentStepsTable(BigQueryTable):
 
         return step_id
 
-    def get_chat_session_history(self, chat_session_id: str) -> list[dict]:
+    def get_chat_session_history(self, chat_session_id: str) -> list[str]:
         """
-        Generate a list of dictionaries. The list is the full chat session history
+        Get the full chat session history, each step is the JSON string stored in the
+        table, so it can be decoded without converting it to dictionaries first.
+        The history is cached, so it is only read from BigQuery the first time that
+        the session is requested in the instance, or when another instance added
+        steps to it (see _cached_history_is_fresh).
 
         Args:
             chat_session_id: str -> Id of the chat session
 
         Returns:
-            list[dict] -> Full chat session history
+            list[str] -> Full chat session history, one JSON string per step
         """
+        if history_cache_config.HISTORY_CACHE_ENABLED:
+            cached_history = history_cache.get(chat_session_id)
+            if cached_history is not None:
+                if (
+                    not history_cache_config.HISTORY_CACHE_VALIDATION_ENABLED
+                    or self._cached_history_is_fresh(chat_session_id, cached_history)
+                ):
+                    logger.info("Chat history obtained from the cache")
+                    return list(cached_history)
+
+                metrics.increment("chat_history_stale")
+                logger.info("The cached chat history is stale, reading it again")
+                history_cache.invalidate(chat_session_id)
+                # The decoded messages belong to the stale history too
+                history_codec.invalidate(chat_session_id)
+
         if not self._sessions_table.session_exists(chat_session_id):
             raise ValueError("chat_session_id does not exist")
 
-        query = f"""
-            select
-                step_data
-            from {self.project_id}.{self.dataset_id}.{self.name}
-            where chat_session_id = '{chat_session_id}'
-            order by {self.primary_key} asc
-        """
+        # The cached summary is trusted only while the cached history is. The steps
+        # that this instance did not see may come with a newer summary
+        summaries_cache.invalidate(chat_session_id)
+
+        # Read the buffer before querying BigQuery, this way a step that leaves the
+        # buffer while the query is running is always seen by one of the two reads
+        pending_steps = self._pending_rows(
+            self.name, "chat_session_id", chat_session_id
+        )
+
+        rows_iterator = self._run_query(
+            "get_chat_session_history", chat_session_id=chat_session_id
+        )
 
-        rows_iterator = query_data(query)
+        # step_id -> (sort key, step_data)
+        steps = {
+            row[self.primary_key]: (
+                self._creation_order(row.created_at, row[self.primary_key]),
+                row.step_data,
+            )
+            for row in rows_iterator
+        }
+
+        # Add the steps that are not visible in BigQuery yet, the buffered
+        # rows contain the step_data already serialized
+        for pending_step in pending_steps:
+            step_id = pending_step[self.primary_key]
+            if step_id not in steps:
+                steps[step_id] = (
+                    self._creation_order(pending_step["created_at"], step_id),
+                    pending_step["step_data"],
+                )
 
-        history = [row.step_data for row in rows_iterator]
+        history = [step_data for _, step_data in sorted(steps.values())]
 
-        return history
+        if history_cache_config.HISTORY_CACHE_ENABLED:
+            history_cache.put(chat_session_id, history)
+
+        return list(history)
 
     def store_prompt_steps(self, new_steps: list[AgentStep]) -> list[str]:
         """
@@ -174,23 +356,19 @@ class BQAgentStepsTable(BigQueryTable):
         # Instanciating a list that will return the step_ids
         step_ids = list()
 
-        for step_number, step_data in enumerate(new_steps):
-            if step_number == 0:
-                # Get the structure of the step_id variable
-                new_step_id = self._generate_id(
-                    prompt_id=step_data.prompt_id,
-                )
+        if len(new_steps) == 0:
+            return step_ids
 
-                # Get the first next step number that belongs to the prompt_id
-                initial_step_number = int(new_step_id[-3:])
+        # All the steps belong to the same prompt_id
+        prompt_id = new_steps[0].prompt_id
+        step_numbers = self._next_step_numbers(prompt_id, count=len(new_steps))
 
-                # Get the prompt number only once, because is the same prompt_id
-                prompt_number = step_data.prompt_id[3:].replace("-", "")
+        # Get the prompt number only once, because is the same prompt_id
+        prompt_number = prompt_id[3:].replace("-", "")
 
+        for step_number, step_data in zip(step_numbers, new_steps):
             # Generating a step_id
-            next_step_number = initial_step_number + step_number
-
-            step_id = f"AST{prompt_number}-{next_step_number:03d}"
+            step_id = f"AST{prompt_number}-{step_number:03d}"
 
             # Getting the current date
             now = datetime.now(timezone.utc)
@@ -204,13 +382,17 @@ class BQAgentStepsTable(BigQueryTable):
             step_ids.append(step_id)
 
         try:
-            insert_rows(
+            self._insert_rows(
                 table_name=self.name,
-                dataset_name=self.dataset_id,
-                project_id=self.project_id,
                 rows=steps_to_store,
             )
         except Exception as e:
             raise ValueError(f"Error while inserting prompt's data into BigQuery: {e}")
 
+        # Keep the cached history of the session up to date
+        self._append_to_cached_history(
+            new_steps[0].chat_session_id,
+            [step_data.step_data for step_data in new_steps],
+        )
+
         return step_ids
@@ -0,0 +1,144 @@
+from .bq_base import BigQueryTable
+from .users import BQUsersTable
+from .chat_sessions import BQChatSessionsTable
+from .prompts import BQPromptsTable
+from .agent_history import BQAgentStepsTable
+from .session_summaries import BQSessionSummariesTable
+from assistant_agent.utils.gcp.bigquery import run_in_bigquery_executor
+from assistant_agent.schemas import (
+    User,
+    ChatSession,
+    Prompt,
+    AgentStep,
+    SessionSummary,
+)
+from typing import Any, Callable, Optional
+
+
+class AsyncBigQueryTable:
+    """
+    Async counterpart of a BigQueryTable. Each method runs the method of the
+    synchronous table in the BigQuery thread pool, so the event loop is never
+    blocked while waiting for BigQuery.
+    """
+
+    def __init__(self, table: BigQueryTable):
+        self._table = table
+
+    @property
+    def table(self) -> BigQueryTable:
+        return self._table
+
+    @property
+    def name(self) -> str:
+        return self._table.name
+
+    @property
+    def primary_key(self) -> str:
+        return self._table.primary_key
+
+    async def _run(self, method: Callable, *args, **kwargs) -> Any:
+        """
+        Run a method of the synchronous table in the BigQuery thread pool
+
+        Args:
+            method: Callable -> Method of the synchronous table
+            *args, **kwargs -> Arguments of the method
+
+        Returns:
+            Any -> Result of the method
+        """
+        return await run_in_bigquery_executor(
+            method,
+            *args,
+            operation=f"{type(self._table).__name__}.{method.__name__}",
+            **kwargs,
+        )
+
+
+class AsyncBQUsersTable(AsyncBigQueryTable):
+    def __init__(self):
+        super().__init__(BQUsersTable())
+
+    async def user_exists(self, user_id: str) -> bool:
+        return await self._run(self.table.user_exists, user_id)
+
+    async def email_in_table(self, email: str) -> Optional[str]:
+        return await self._run(self.table.email_in_table, email)
+
+    async def get_user_data(self, user_id: str) -> Optional[User]:
+        return await self._run(self.table.get_user_data, user_id)
+
+    async def generate_new_row(self, user_data: User) -> str:
+        return await self._run(self.table.generate_new_row, user_data)
+
+
+class AsyncBQChatSessionsTable(AsyncBigQueryTable):
+    def __init__(self):
+        super().__init__(BQChatSessionsTable())
+
+    async def session_exists(self, chat_session_id: str) -> bool:
+        return await self._run(self.table.session_exists, chat_session_id)
+
+    async def generate_new_row(self, session_info: ChatSession) -> str:
+        return await self._run(self.table.generate_new_row, session_info)
+
+    async def get_user_sessions(self, user_id: str) -> list[ChatSession]:
+        return await self._run(self.table.get_user_sessions, user_id)
+
+
+class AsyncBQPromptsTable(AsyncBigQueryTable):
+    def __init__(self):
+        super().__init__(BQPromptsTable())
+
+    async def prompt_exists(self, prompt_id: str) -> bool:
+        return await self._run(self.table.prompt_exists, prompt_id)
+
+    async def generate_new_row(self, prompt_data: Prompt) -> str:
+        return await self._run(self.table.generate_new_row, prompt_data)
+
+    async def get_prompts_from_user_session(
+        self, user_id: str, chat_session_id: str
+    ) -> list[Prompt]:
+        return await self._run(
+            self.table.get_prompts_from_user_session,
+            user_id=user_id,
+            chat_session_id=chat_session_id,
+        )
+
+
+class AsyncBQAgentStepsTable(AsyncBigQueryTable):
+    def __init__(self):
+        super().__init__(BQAgentStepsTable())
+
+    def start_session_history(self, chat_session_id: str) -> None:
+        # Only touches the in-memory cache, there is no need to use the thread pool
+        self.table.start_session_history(chat_session_id)
+
+    def invalidate_session_history(self, chat_session_id: str) -> bool:
+        return self.table.invalidate_session_history(chat_session_id)
+
+    async def step_exists(self, step_id: str) -> bool:
+        return await self._run(self.table.step_exists, step_id)
+
+    async def generate_new_row(self, step_data: AgentStep) -> str:
+        return await self._run(self.table.generate_new_row, step_data)
+
+    async def get_chat_session_history(self, chat_session_id: str) -> list[str]:
+        return await self._run(self.table.get_chat_session_history, chat_session_id)
+
+    async def store_prompt_steps(self, new_steps: list[AgentStep]) -> list[str]:
+        return await self._run(self.table.store_prompt_steps, new_steps)
+
+
+class AsyncBQSessionSummariesTable(AsyncBigQueryTable):
+    def __init__(self):
+        super().__init__(BQSessionSummariesTable())
+
+    async def generate_new_row(self, summary_data: SessionSummary) -> str:
+        return await self._run(self.table.generate_new_row, summary_data)
+
+    async def get_latest_summary(
+        self, chat_session_id: str
+    ) -> Optional[SessionSummary]:
+        return await self._run(self.table.get_latest_summary, chat_session_id)
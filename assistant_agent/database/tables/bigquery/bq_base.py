@@ -1,14 +1,53 @@
 from assistant_agent.database.tables import Table
-from assistant_agent.config import GCPConfig
-from assistant_agent.utils.gcp.bigquery import query_data
+from assistant_agent.database.id_allocator import IDAllocator, get_id_allocator
+from assistant_agent.config import GCPConfig, BQMetadataConfig
+from assistant_agent.utils.gcp.bigquery import (
+    insert_rows,
+    get_table_schema,
+    validate_rows,
+)
+from assistant_agent.utils.gcp.bigquery_queries import query_engine
+from google.cloud.bigquery.table import RowIterator
+from assistant_agent.utils.gcp.bigquery_buffer import (
+    get_write_buffer,
+    is_buffered_table,
+)
+from datetime import datetime
+from typing import Any, Optional, Union
 
 gcp_config = GCPConfig()
+metadata_config = BQMetadataConfig()
 
 
 class BigQueryTable(Table):
     __project_id: str = gcp_config.PROJECT_ID
     __dataset_id: str = gcp_config.BQ_DATASET_ID
 
+    # Method name -> SQL of the queries run by the table. The templates can use the
+    # identifiers returned by _query_identifiers (Ex: {table}) and the values are
+    # passed as query parameters (Ex: @user_id). The subclasses extend this dict.
+    _queries: dict[str, str] = {
+        "_id_in_table": """
+            select
+                {id_column}
+            from {table}
+            where {id_column} = @id_value
+            limit 1
+        """,
+        "_last_sequence_number": """
+            select
+                ifnull(
+                    max(safe_cast(split({id_column}, '-')[safe_offset(1)] as int64)),
+                    0
+                ) as last_number
+            from {table}
+            where {parent_column} = @parent_value
+        """,
+    }
+    # Queries that read a few rows through an equality on an id, they are run as short
+    # queries (without polling a job). The subclasses extend this set
+    _short_queries: set[str] = {"_id_in_table", "_last_sequence_number"}
+
     @property
     def project_id(self):
         return self.__project_id
@@ -17,6 +56,86 @@ class BigQueryTable(Table):
     def dataset_id(self):
         return self.__dataset_id
 
+    @property
+    def id_allocator(self) -> IDAllocator:
+        return get_id_allocator()
+
+    def _query_identifiers(self) -> dict[str, str]:
+        """
+        Identifiers that can be used in the SQL templates of the table
+
+        Returns:
+            dict[str, str] -> Name of the identifier -> value
+        """
+        return {
+            "dataset": f"{self.project_id}.{self.dataset_id}",
+            "table": f"{self.project_id}.{self.dataset_id}.{self.name}",
+            "primary_key": self.primary_key,
+        }
+
+    @staticmethod
+    def _creation_order(
+        created_at: Optional[Union[datetime, str]], row_id: str
+    ) -> tuple[str, str]:
+        """
+        Sort key that orders the rows of a table as they were created. The ids follow
+        the order in which they were reserved, not always the order of created_at, so
+        they only break the ties between rows created in the same second.
+
+        Args:
+            created_at: Optional[Union[datetime, str]] -> created_at of the row, as returned
+                                                          by BigQuery or by the write buffer
+            row_id: str -> Primary key of the row
+
+        Returns:
+            tuple[str, str] -> Key to sort the rows
+        """
+        if isinstance(created_at, datetime):
+            # Same format used to store it, so both sources sort together
+            created_at = created_at.strftime(r"%Y-%m-%d %H:%M:%S")
+
+        return created_at or "", row_id
+
+    def _run_query(
+        self,
+        query_name: str,
+        sql_identifiers: Optional[dict[str, str]] = None,
+        **parameters: Any,
+    ) -> RowIterator:
+        """
+        Run one of the queries of the table through the query engine. The query is
+        registered as <ClassName>.<query_name> the first time it is run, as a short
+        query if it is in _short_queries. The extra identifiers are part of the name
+        (Ex: <ClassName>.<query_name>(table=...)), so each combination of identifiers
+        is a different query.
+
+        Args:
+            query_name: str -> Key of the query in _queries
+            sql_identifiers: Optional[dict[str, str]] -> Extra identifiers for the SQL template
+            **parameters: Any -> Values of the query parameters
+
+        Returns:
+            RowIterator -> Rows returned by the query
+        """
+        name = f"{type(self).__name__}.{query_name}"
+        if sql_identifiers:
+            identifiers = ", ".join(
+                f"{identifier}={value}"
+                for identifier, value in sorted(sql_identifiers.items())
+            )
+            name = f"{name}({identifiers})"
+
+        if name not in query_engine:
+            # The extra identifiers replace the ones of the table (Ex: {table})
+            sql = self._queries[query_name].format_map(
+                {**self._query_identifiers(), **(sql_identifiers or dict())}
+            )
+            query_engine.register(
+                name, sql, short_query=query_name in self._short_queries
+            )
+
+        return query_engine.run(name, **parameters)
+
     def _id_in_table(
         self, primary_key_row_value: str, primary_key_column_name: str, table_name: str
     ) -> bool:
@@ -31,14 +150,22 @@ class BigQueryTable(Table):
         Returns:
             bool -> True if the id exists in the table
         """
-        query = f"""
-            select
-                {primary_key_column_name}
-            from {self.project_id}.{self.dataset_id}.{table_name}
-            where {primary_key_column_name} = '{primary_key_row_value}'
-        """
+        # The row could still be in the write buffer
+        if self._pending_rows(
+            table_name=table_name,
+            column_name=primary_key_column_name,
+            column_value=primary_key_row_value,
+        ):
+            return True
 
-        rows_iterator = query_data(query)
+        rows_iterator = self._run_query(
+            "_id_in_table",
+            sql_identifiers={
+                "table": f"{self.project_id}.{self.dataset_id}.{table_name}",
+                "id_column": primary_key_column_name,
+            },
+            id_value=primary_key_row_value,
+        )
 
         try:
             # Try to get the first element (row) of the rows_iterator
@@ -47,3 +174,120 @@ class BigQueryTable(Table):
 
         except StopIteration:  # If the iterator is empty
             return False
+
+    def _insert_rows(self, table_name: str, rows: list[dict]) -> None:
+        """
+        Insert rows into one of the tables of the dataset. If the table is buffered, the rows
+        are queued in the write buffer and inserted later by its flusher. The rows are validated
+        against the cached schema first, so an invalid row is rejected here and not when the
+        buffer is flushed.
+
+        Args:
+            table_name: str -> Name of the table
+            rows: list[dict] -> Rows to insert
+
+        Returns:
+            None
+        """
+        if metadata_config.BQ_VALIDATE_ROWS:
+            schema = get_table_schema(table_name, self.dataset_id, self.project_id)
+            errors = validate_rows(rows, schema)
+            if errors:
+                raise ValueError(
+                    f"The rows do not match the schema of {table_name}: {errors}"
+                )
+
+        if is_buffered_table(table_name):
+            get_write_buffer().submit(
+                table_name=table_name,
+                dataset_name=self.dataset_id,
+                project_id=self.project_id,
+                rows=rows,
+            )
+            return
+
+        insert_rows(
+            table_name=table_name,
+            dataset_name=self.dataset_id,
+            project_id=self.project_id,
+            rows=rows,
+            # Already validated
+            validate=False,
+        )
+
+    def _pending_rows(
+        self,
+        table_name: str,
+        column_name: Optional[str] = None,
+        column_value: Optional[str] = None,
+    ) -> list[dict]:
+        """
+        Get the rows of a table that are still in the write buffer, so they
+        can be read before they are visible in BigQuery.
+
+        Args:
+            table_name: str -> Name of the table
+            column_name: Optional[str] -> If passed, only the rows where column_name
+                                          is equal to column_value are returned
+            column_value: Optional[str] -> Value used to filter the rows
+
+        Returns:
+            list[dict] -> Rows submitted but maybe not inserted yet
+        """
+        if not is_buffered_table(table_name):
+            return list()
+
+        rows = get_write_buffer().pending_rows(
+            table_name=table_name,
+            dataset_name=self.dataset_id,
+            project_id=self.project_id,
+        )
+
+        if column_name is None:
+            return rows
+
+        return [row for row in rows if row.get(column_name) == column_value]
+
+    def _last_sequence_number(
+        self,
+        table_name: str,
+        id_column_name: str,
+        parent_column_name: str,
+        parent_value: str,
+    ) -> int:
+        """
+        Get the greatest sequence number used by the ids that belong to a parent. The ids
+        must end with '-<number>'. Ex: CS2505ABC123-007 -> 7
+
+        It is used to seed the sequences of the id allocator.
+
+        Args:
+            table_name: str -> Name of the table
+            id_column_name: str -> Name of the column with the ids
+            parent_column_name: str -> Name of the column with the parent id
+            parent_value: str -> Value of the parent id
+
+        Returns:
+            int -> Last sequence number used, 0 if the parent has no rows
+        """
+        # Read the buffer before querying BigQuery, this way a row that leaves the
+        # buffer while the query is running is always seen by one of the two reads
+        pending_numbers = [
+            int(row[id_column_name].split("-")[-1])
+            for row in self._pending_rows(table_name, parent_column_name, parent_value)
+            if row.get(id_column_name)
+        ]
+
+        rows_iterator = self._run_query(
+            "_last_sequence_number",
+            sql_identifiers={
+                "table": f"{self.project_id}.{self.dataset_id}.{table_name}",
+                "id_column": id_column_name,
+                "parent_column": parent_column_name,
+            },
+            parent_value=parent_value,
+        )
+
+        last_number = next(rows_iterator).last_number
+
+        return max([last_number, *pending_numbers])
@@ -1,7 +1,6 @@
 from .bq_base import BigQueryTable
 from assistant_agent.database.tables.bigquery import BQUsersTable
 from assistant_agent.schemas import ChatSession
-from assistant_agent.utils.gcp.bigquery import query_data, insert_rows
 from assistant_agent.config import GCPConfig
 from datetime import datetime, timezone
 from loguru import logger
@@ -13,10 +12,33 @@ class BQChatSessionsTable(BigQueryTable):
     __name: str = gcp_config.CHAT_SESSIONS_TABLE_NAME
     __primary_key: str = gcp_config.CHAT_SESSIONS_TABLE_PK
 
+    _queries: dict[str, str] = {
+        **BigQueryTable._queries,
+        # The user is the left side of the join, so the query returns no rows only if
+        # the user does not exist, and a row without a session if the user has no sessions
+        "get_user_sessions": """
+            select
+                sessions.chat_session_id,
+                sessions.created_at
+            from {users_table} as users
+            left join {table} as sessions
+                on sessions.user_id = users.{users_primary_key}
+            where users.{users_primary_key} = @user_id
+            order by sessions.created_at desc, sessions.chat_session_id desc
+        """,
+    }
+
     def __init__(self):
         super().__init__()
         self._users_table: BQUsersTable = BQUsersTable()
 
+    def _query_identifiers(self) -> dict[str, str]:
+        return {
+            **super()._query_identifiers(),
+            "users_table": f"{self.project_id}.{self.dataset_id}.{self._users_table.name}",
+            "users_primary_key": self._users_table.primary_key,
+        }
+
     @property
     def name(self) -> str:
         return self.__name
@@ -27,7 +49,7 @@ class BQChatSessionsTable(BigQueryTable):
 
     def _generate_id(self, user_id: str) -> str:
         """
-        Generates a new chat session id based on the current users registered in the DB
+        Generates a new chat session id based on the sessions that the user already has
 
         Args:
             user_id: str -> Id of the user
@@ -36,23 +58,25 @@ class BQChatSessionsTable(BigQueryTable):
             chat_session_id: str -> ID of the chat session generated
 
         """
-        if not self._users_table.user_exists(user_id):
-            raise ValueError("The user_id does not exists")
 
-        query = f"""
-                select
-                    count(*) as total_sessions
-                from {self.project_id}.{self.dataset_id}.{self.name}
-                where user_id = '{user_id}'
-                """
+        def seed() -> int:
+            # Only executed the first time a session is generated for the user
+            if not self._users_table.user_exists(user_id):
+                raise ValueError("The user_id does not exists")
 
-        # Query the BigQuery database to get the total number of sessions of the user
-        row_iterator = query_data(query=query)
-
-        total_user_sessions = next(row_iterator).total_sessions
+            # Last session number of the user, including the sessions
+            # that are still in the write buffer
+            return self._last_sequence_number(
+                table_name=self.name,
+                id_column_name=self.primary_key,
+                parent_column_name="user_id",
+                parent_value=user_id,
+            )
 
-        # Generating the user ID
-        next_id = total_user_sessions + 1
+        # Get the session number from the id allocator
+        next_id = self.id_allocator.next_number(
+            sequence_key=f"{self.name}/{user_id}", seed=seed
+        )
 
         # Extracting the user number from the user_id to generate a session_id
         user_number = user_id[3:]
@@ -60,6 +84,11 @@ class BQChatSessionsTable(BigQueryTable):
         chat_session_id = f"CS{user_number}-{next_id:03d}"
         logger.info(f"Generated chat session ID: {chat_session_id}")
 
+        # The new session does not have prompts yet
+        self.id_allocator.mark_new_parent(
+            f"{gcp_config.PROMPTS_TABLE_NAME}/{chat_session_id}"
+        )
+
         return chat_session_id
 
     def session_exists(self, chat_session_id: str) -> bool:
@@ -103,10 +132,8 @@ class BQChatSessionsTable(BigQueryTable):
         session_info.created_at = datetime.now(timezone.utc)
 
         try:
-            insert_rows(
+            self._insert_rows(
                 table_name=self.name,
-                dataset_name=self.dataset_id,
-                project_id=self.project_id,
                 rows=[
                     session_info.model_dump(),
                 ],
@@ -140,21 +167,10 @@ class BQChatSessionsTable(BigQueryTable):
         Returns:
             list[ChatSessionData] -> list of chat_sessions
         """
-        logger.info("Validating user_id")
-        userdb = self._users_table.user_exists(user_id)
-        if not userdb:
-            raise ValueError("The user_id does not exist")
+        rows = list(self._run_query("get_user_sessions", user_id=user_id))
 
-        query = f"""
-            select
-                chat_session_id,
-                created_at
-            from {self.project_id}.{self.dataset_id}.{self.name}
-            where user_id = '{user_id}'
-            order by chat_session_id desc
-        """
-
-        rows_iterator = query_data(query)
+        if not rows:
+            raise ValueError("The user_id does not exist")
 
         chat_sessions_info = [
             ChatSession(
@@ -162,7 +178,25 @@ class BQChatSessionsTable(BigQueryTable):
                 chat_session_id=row.chat_session_id,
                 created_at=row.created_at,
             )
-            for row in rows_iterator
+            for row in rows
+            if row.chat_session_id is not None
         ]
 
+        # Add the sessions that are not visible in BigQuery yet
+        stored_ids = {session.chat_session_id for session in chat_sessions_info}
+        pending_sessions = [
+            ChatSession(**row)
+            for row in self._pending_rows(self.name, "user_id", user_id)
+            if row[self.primary_key] not in stored_ids
+        ]
+
+        if pending_sessions:
+            chat_sessions_info = sorted(
+                chat_sessions_info + pending_sessions,
+                key=lambda session: self._creation_order(
+                    session.created_at, session.chat_session_id
+                ),
+                reverse=True,
+            )
+
         return chat_sessions_info
@@ -3,7 +3,6 @@ from assistant_agent.database.tables.bigquery import (
     BQUsersTable,
     BQChatSessionsTable,
 )
-from assistant_agent.utils.gcp.bigquery import insert_rows, query_data
 from assistant_agent.config import GCPConfig
 from assistant_agent.schemas import Prompt
 from loguru import logger
@@ -16,11 +15,48 @@ class BQPromptsTable(BigQueryTable):
     __name: str = gcp_config.PROMPTS_TABLE_NAME
     __primary_key: str = gcp_config.PROMPTS_TABLE_PK
 
+    _queries: dict[str, str] = {
+        **BigQueryTable._queries,
+        # A single query answers if the user exists, who owns the chat session and which are
+        # its prompts. The anchor row makes the query return at least one row, even if
+        # the chat session does not exist or has no prompts. It carries the chat_session_id,
+        # because BigQuery only accepts outer joins on an equality of both sides
+        "get_prompts_from_user_session": """
+            select
+                exists(
+                    select 1
+                    from {users_table}
+                    where {users_primary_key} = @user_id
+                ) as user_found,
+                sessions.user_id as session_owner,
+                prompts.prompt_id,
+                prompts.chat_session_id,
+                prompts.created_at,
+                prompts.prompt,
+                prompts.response
+            from (select @chat_session_id as chat_session_id) as anchor
+            left join {sessions_table} as sessions
+                on sessions.{sessions_primary_key} = anchor.chat_session_id
+            left join {table} as prompts
+                on prompts.chat_session_id = sessions.{sessions_primary_key}
+            order by prompts.created_at asc, prompts.prompt_id asc
+        """,
+    }
+
     def __init__(self):
         super().__init__()
         self._users_table: BQUsersTable = BQUsersTable()
         self._chat_sessions_table: BQChatSessionsTable = BQChatSessionsTable()
 
+    def _query_identifiers(self) -> dict[str, str]:
+        return {
+            **super()._query_identifiers(),
+            "users_table": f"{self.project_id}.{self.dataset_id}.{self._users_table.name}",
+            "users_primary_key": self._users_table.primary_key,
+            "sessions_table": f"{self.project_id}.{self.dataset_id}.{self._chat_sessions_table.name}",
+            "sessions_primary_key": self._chat_sessions_table.primary_key,
+        }
+
     @property
     def name(self):
         return self.__name
@@ -36,24 +72,25 @@ class BQPromptsTable(BigQueryTable):
         Args:
             chat_session_id: str -> ID of the chat session of the user
         """
-        if not self._chat_sessions_table.session_exists(chat_session_id):
-            raise ValueError("Chat Session ID does not exist")
 
-        # Get the last prompt number generated
-        query = f"""
-                select
-                    count(*) as total_session_prompts
-                from {self.project_id}.{self.dataset_id}.{self.name}
-                where chat_session_id = '{chat_session_id}'
-                """
+        def seed() -> int:
+            # Only executed the first time a prompt is generated for the session
+            if not self._chat_sessions_table.session_exists(chat_session_id):
+                raise ValueError("Chat Session ID does not exist")
 
-        # Query the DB to get the number of prompts the chat_session_id has
-        rows_iterator = query_data(query)
-
-        total_session_prompts = next(rows_iterator).total_session_prompts
+            # Last prompt number of the session, including the prompts
+            # that are still in the write buffer
+            return self._last_sequence_number(
+                table_name=self.name,
+                id_column_name=self.primary_key,
+                parent_column_name="chat_session_id",
+                parent_value=chat_session_id,
+            )
 
-        # Generating the user ID
-        next_id = total_session_prompts + 1
+        # Get the prompt number from the id allocator
+        next_id = self.id_allocator.next_number(
+            sequence_key=f"{self.name}/{chat_session_id}", seed=seed
+        )
 
         # Extract the first coincidence of the regular expression
         session_number = chat_session_id[2:].replace("-", "")
@@ -61,6 +98,11 @@ class BQPromptsTable(BigQueryTable):
         prompt_id = f"PID{session_number}-{next_id:04d}"
         logger.info(f"{prompt_id = }")
 
+        # The new prompt does not have steps yet
+        self.id_allocator.mark_new_parent(
+            f"{gcp_config.AGENT_STEPS_TABLE_NAME}/{prompt_id}"
+        )
+
         return prompt_id
 
     def prompt_exists(self, prompt_id: str) -> bool:
@@ -102,10 +144,8 @@ class BQPromptsTable(BigQueryTable):
         prompt_data.created_at = datetime.now(timezone.utc)
 
         try:
-            insert_rows(
+            self._insert_rows(
                 table_name=self.name,
-                dataset_name=self.dataset_id,
-                project_id=self.project_id,
                 rows=[
                     prompt_data.model_dump(),
                 ],
@@ -141,44 +181,36 @@ class BQPromptsTable(BigQueryTable):
             list[PromptData] -> Each entry is a prompt, containing the prompt,
                                 response, and when it was creaetd
         """
-        if not self._users_table.user_exists(user_id):
-            raise ValueError("The user_id introduced does not exists")
+        logger.info("Getting the prompts of the chat session and verifying its owner")
+        rows = list(
+            self._run_query(
+                "get_prompts_from_user_session",
+                user_id=user_id,
+                chat_session_id=chat_session_id,
+            )
+        )
 
-        if not self._chat_sessions_table.session_exists(chat_session_id):
-            raise ValueError("The chat_session_id does not exists")
+        if not rows[0].user_found:
+            raise ValueError("The user_id introduced does not exists")
 
-        logger.info(
-            "Verifying that the chat session owner corresponds to the user_id provided"
-        )
-        chat_session_owner_query = f"""
-            select
-                user_id
-            from {self.project_id}.{self.dataset_id}.{self._chat_sessions_table.name}
-            where {self._chat_sessions_table.primary_key} = '{chat_session_id}'
-        """
+        chat_session_owner = rows[0].session_owner
 
-        rows_iterator = query_data(chat_session_owner_query)
+        if chat_session_owner is None:
+            # The session could still be in the write buffer
+            pending_sessions = self._pending_rows(
+                self._chat_sessions_table.name,
+                self._chat_sessions_table.primary_key,
+                chat_session_id,
+            )
+            if not pending_sessions:
+                raise ValueError("The chat_session_id does not exists")
 
-        chat_session_owner = next(rows_iterator).user_id
+            chat_session_owner = pending_sessions[0]["user_id"]
 
         if chat_session_owner != user_id:
             raise ValueError("The chat session is not of the user_id provided")
 
-        # Getting the chat session historu
-        query = f"""
-                select
-                    prompt_id,
-                    chat_session_id,
-                    created_at,
-                    prompt,
-                    response
-                from {self.project_id}.{self.dataset_id}.{self.name}
-                where chat_session_id = '{chat_session_id}'
-                order by prompt_id asc
-            """
-
-        rows_iterator = query_data(query)
-
+        # A session without prompts returns a single row without prompt data
         total_prompts = [
             Prompt(
                 prompt_id=row.prompt_id,
@@ -187,7 +219,24 @@ class BQPromptsTable(BigQueryTable):
                 prompt=row.prompt,
                 response=row.response,
             )
-            for row in rows_iterator
+            for row in rows
+            if row.prompt_id is not None
+        ]
+
+        # Add the prompts that are not visible in BigQuery yet
+        stored_ids = {prompt.prompt_id for prompt in total_prompts}
+        pending_prompts = [
+            Prompt(**row)
+            for row in self._pending_rows(self.name, "chat_session_id", chat_session_id)
+            if row[self.primary_key] not in stored_ids
         ]
 
+        if pending_prompts:
+            total_prompts = sorted(
+                total_prompts + pending_prompts,
+                key=lambda prompt: self._creation_order(
+                    prompt.created_at, prompt.prompt_id
+                ),
+            )
+
         return total_prompts
@@ -0,0 +1,175 @@
+from .bq_base import BigQueryTable
+from assistant_agent.database.tables.bigquery import BQChatSessionsTable
+from assistant_agent.config import GCPConfig, HistoryCacheConfig
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.schemas import SessionSummary
+from datetime import datetime, timezone
+from loguru import logger
+from typing import Optional
+
+gcp_config = GCPConfig()
+history_cache_config = HistoryCacheConfig()
+
+
+# Latest summary of each chat session, the key is the chat_session_id. The agent_steps
+# table invalidates it whenever it reads the history of the session from BigQuery
+summaries_cache = LRUCache(
+    name="session_summaries",
+    max_entries=history_cache_config.HISTORY_CACHE_MAX_SESSIONS,
+    ttl_seconds=history_cache_config.HISTORY_CACHE_TTL_SECONDS,
+)
+
+
+class BQSessionSummariesTable(BigQueryTable):
+    """
+    Append-only table with the rolling summaries of the chat sessions. Each new summary
+    covers more turns than the previous one, so only the latest summary is used.
+    """
+
+    __name: str = gcp_config.SESSION_SUMMARIES_TABLE_NAME
+    __primary_key: str = gcp_config.SESSION_SUMMARIES_TABLE_PK
+
+    _queries: dict[str, str] = {
+        **BigQueryTable._queries,
+        "get_latest_summary": """
+            select
+                {primary_key},
+                chat_session_id,
+                created_at,
+                summary,
+                summarized_turns
+            from {table}
+            where chat_session_id = @chat_session_id
+            order by summarized_turns desc, {primary_key} desc
+            limit 1
+        """,
+    }
+    _short_queries: set[str] = {
+        *BigQueryTable._short_queries,
+        "get_latest_summary",
+    }
+
+    def __init__(self):
+        super().__init__()
+        self._chat_sessions_table: BQChatSessionsTable = BQChatSessionsTable()
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def primary_key(self) -> str:
+        return self.__primary_key
+
+    def _generate_id(self, chat_session_id: str) -> str:
+        """
+        Generates a summary_id based on the chat_session_id
+
+        Args:
+            chat_session_id: str -> ID of the chat session summarized
+        """
+
+        def seed() -> int:
+            # Only executed the first time a summary is generated for the session
+            if not self._chat_sessions_table.session_exists(chat_session_id):
+                raise ValueError("Chat Session ID does not exist")
+
+            return self._last_sequence_number(
+                table_name=self.name,
+                id_column_name=self.primary_key,
+                parent_column_name="chat_session_id",
+                parent_value=chat_session_id,
+            )
+
+        next_id = self.id_allocator.next_number(
+            sequence_key=f"{self.name}/{chat_session_id}", seed=seed
+        )
+
+        session_number = chat_session_id[2:].replace("-", "")
+
+        return f"SUM{session_number}-{next_id:04d}"
+
+    def summary_exists(self, summary_id: str) -> bool:
+        """
+        Public method to know if a summary exists in the DB
+
+        Args:
+            summary_id: str -> ID of the summary
+
+        Returns:
+            bool -> True if the summary exists, otherwise False
+        """
+        return super()._id_in_table(
+            primary_key_column_name=self.primary_key,
+            primary_key_row_value=summary_id,
+            table_name=self.name,
+        )
+
+    def _insert_row(self, summary_data: SessionSummary) -> str:
+        """
+        Insert a row in the BigQuery table
+
+        Args:
+            summary_data: SessionSummary -> Summary to store
+
+        Return:
+            str -> summary_id
+        """
+        summary_data.summary_id = self._generate_id(summary_data.chat_session_id)
+        summary_data.created_at = datetime.now(timezone.utc)
+
+        try:
+            self._insert_rows(table_name=self.name, rows=[summary_data.model_dump()])
+        except Exception as e:
+            raise ValueError(f"Error while inserting the summary into BigQuery: {e}")
+
+        summaries_cache.put(summary_data.chat_session_id, summary_data)
+        logger.info(f"Summary {summary_data.summary_id} stored")
+
+        return summary_data.summary_id
+
+    def generate_new_row(self, summary_data: SessionSummary) -> str:
+        """
+        Public method to generate a new row in the session summaries table
+
+        Args:
+            summary_data: SessionSummary -> Summary to store
+
+        Return:
+            str -> summary_id
+        """
+        return self._insert_row(summary_data)
+
+    def get_latest_summary(self, chat_session_id: str) -> Optional[SessionSummary]:
+        """
+        Get the summary of the session that covers more turns
+
+        Args:
+            chat_session_id: str -> Id of the chat session
+
+        Returns:
+            Optional[SessionSummary] -> Latest summary, None if the session has no summaries
+        """
+        cached_summary = summaries_cache.get(chat_session_id)
+        if cached_summary is not None:
+            return cached_summary
+
+        rows_iterator = self._run_query(
+            "get_latest_summary", chat_session_id=chat_session_id
+        )
+
+        try:
+            row = next(rows_iterator)
+        except StopIteration:
+            return None
+
+        summary = SessionSummary(
+            summary_id=row[self.primary_key],
+            chat_session_id=row.chat_session_id,
+            created_at=row.created_at,
+            summary=row.summary,
+            summarized_turns=row.summarized_turns,
+        )
+        summaries_cache.put(chat_session_id, summary)
+
+        return summary
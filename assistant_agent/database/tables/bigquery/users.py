@@ -1,5 +1,4 @@
 from .bq_base import BigQueryTable
-from assistant_agent.utils.gcp.bigquery import query_data, insert_rows
 from assistant_agent.utils.auth_auxiliars import get_password_hash
 from assistant_agent.config import GCPConfig
 from assistant_agent.schemas import User
@@ -18,6 +17,27 @@ class BQUsersTable(BigQueryTable):
     __name: str = gcp_config.USERS_TABLE_NAME
     __primary_key: str = gcp_config.USERS_TABLE_PK
 
+    _queries: dict[str, str] = {
+        **BigQueryTable._queries,
+        "email_in_table": """
+            select
+                user_id
+            from {table}
+            where email = @email
+        """,
+        "get_user_data": """
+            select
+                *
+            from {table}
+            where {primary_key} = @user_id
+        """,
+    }
+    _short_queries: set[str] = {
+        *BigQueryTable._short_queries,
+        "email_in_table",
+        "get_user_data",
+    }
+
     @property
     def name(self) -> str:
         return self.__name
@@ -71,14 +91,7 @@ class BQUsersTable(BigQueryTable):
         Returns:
             Optional[str] -> If the email exists, returns its user_id
         """
-        query_email = f"""
-            select
-                user_id
-            from {self.project_id}.{self.dataset_id}.{self.name}
-            where email = '{email}'
-        """
-
-        rows_iterator = query_data(query_email)
+        rows_iterator = self._run_query("email_in_table", email=email)
 
         try:
             user_id = next(rows_iterator).user_id
@@ -97,14 +110,7 @@ class BQUsersTable(BigQueryTable):
         Returns:
             Optional[User] -> Data of the user if the email is registered
         """
-        query = f"""
-            select
-                *
-            from {self.project_id}.{self.dataset_id}.{self.name}
-            where {self.primary_key} = '{user_id}'
-        """
-
-        rows_iterator = query_data(query)
+        rows_iterator = self._run_query("get_user_data", user_id=user_id)
 
         try:
             # Try to get the first element (row) of the rows_iterator
@@ -158,10 +164,8 @@ class BQUsersTable(BigQueryTable):
         )
 
         try:
-            insert_rows(
+            self._insert_rows(
                 table_name=self.name,
-                dataset_name=self.dataset_id,
-                project_id=self.project_id,
                 rows=[
                     data_to_insert,
                 ],
@@ -0,0 +1,182 @@
+from loguru import logger
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage
+from assistant_agent.agent import get_model
+from assistant_agent.config import LLMConfig
+from assistant_agent.database.tables.bigquery import AsyncBQSessionSummariesTable
+from assistant_agent.schemas import SessionSummary
+from assistant_agent.utils.chat_memory import (
+    build_memory_window,
+    render_turns,
+    split_into_turns,
+)
+from assistant_agent.utils.metrics import metrics
+from typing import Optional
+import asyncio
+
+llm_config = LLMConfig()
+
+summary_system_prompt = (
+    "You summarize conversations between a user and an AI assistant that generates images."
+    " Merge the previous summary (if any) with the new turns into a single summary."
+    " Keep the user's goals and preferences, the ideas and prompts used,"
+    " the names and urls of the images generated and any pending request."
+    " Write it in the language of the conversation, in less than 300 words."
+)
+
+
+class ChatMemoryManager:
+    """
+    Decides which part of the chat history is sent to the agent. The last
+    AGENT_MESSAGES_MEMORY_LIMIT turns are sent verbatim and the previous turns are
+    replaced by a rolling summary, that is updated in the background after each
+    response and stored in the session summaries table.
+    """
+
+    def __init__(
+        self,
+        summaries_table: Optional[AsyncBQSessionSummariesTable] = None,
+        memory_limit: int = llm_config.AGENT_MESSAGES_MEMORY_LIMIT,
+        summary_enabled: bool = llm_config.MEMORY_SUMMARY_ENABLED,
+    ):
+        self.summaries_table = summaries_table or AsyncBQSessionSummariesTable()
+        self.memory_limit = memory_limit
+        self.summary_enabled = summary_enabled
+        self._summary_agent: Optional[Agent] = None
+        # Background summaries, keeping a reference avoids that they are garbage collected
+        self._tasks: set[asyncio.Task] = set()
+        self._sessions_summarizing: set[str] = set()
+
+    @property
+    def summary_agent(self) -> Agent:
+        if self._summary_agent is None:
+            self._summary_agent = Agent(
+                get_model(llm_config.MEMORY_SUMMARY_MODEL_NAME),
+                system_prompt=summary_system_prompt,
+            )
+        return self._summary_agent
+
+    async def get_memory_window(
+        self, chat_session_id: str, messages: list[ModelMessage]
+    ) -> list[ModelMessage]:
+        """
+        Get the history that must be passed to the agent
+
+        Args:
+            chat_session_id: str -> Id of the chat session
+            messages: list[ModelMessage] -> Full history of the session
+
+        Returns:
+            list[ModelMessage] -> Last turns of the session, with the summary of the previous ones
+        """
+        if len(split_into_turns(messages)) <= self.memory_limit:
+            return messages
+
+        summary = None
+        if self.summary_enabled:
+            try:
+                summary = await self.summaries_table.get_latest_summary(chat_session_id)
+            except Exception as e:
+                # Without the summary the window keeps more turns verbatim instead
+                metrics.increment("chat_memory_summary_read_errors")
+                logger.error(f"Error reading the summary of {chat_session_id}: {e}")
+
+        window = build_memory_window(
+            messages,
+            memory_limit=self.memory_limit,
+            summary=summary.summary if summary else None,
+            summarized_turns=summary.summarized_turns if summary else 0,
+        )
+
+        metrics.observe(
+            "chat_memory_dropped_messages",
+            len(messages) - len(window),
+            buckets=(0, 5, 10, 25, 50, 100, 250, 500),
+        )
+
+        return window
+
+    def schedule_summary(
+        self, chat_session_id: str, messages: list[ModelMessage]
+    ) -> Optional[asyncio.Task]:
+        """
+        Update the summary of the session in the background if there are turns outside
+        the memory window that it does not cover yet. Must be called after the response,
+        with the full history including the new turn.
+
+        Args:
+            chat_session_id: str -> Id of the chat session
+            messages: list[ModelMessage] -> Full history of the session
+
+        Returns:
+            Optional[asyncio.Task] -> Task that updates the summary, None if it is not needed
+        """
+        if not self.summary_enabled or chat_session_id in self._sessions_summarizing:
+            return None
+
+        turns = split_into_turns(messages)
+        if len(turns) <= self.memory_limit:
+            return None
+
+        self._sessions_summarizing.add(chat_session_id)
+        task = asyncio.create_task(self._update_summary(chat_session_id, turns))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return task
+
+    async def _update_summary(
+        self, chat_session_id: str, turns: list[list[ModelMessage]]
+    ) -> None:
+        try:
+            previous_summary = await self.summaries_table.get_latest_summary(
+                chat_session_id
+            )
+            summarized_turns = (
+                previous_summary.summarized_turns if previous_summary else 0
+            )
+            last_turn_to_summarize = len(turns) - self.memory_limit
+
+            if last_turn_to_summarize <= summarized_turns:
+                return
+
+            prompt = (
+                f"Previous summary:\n{previous_summary.summary if previous_summary else 'None'}"
+                "\n\nNew turns:\n"
+                f"{render_turns(turns[summarized_turns:last_turn_to_summarize])}"
+            )
+
+            with metrics.timer("chat_memory_summary_seconds"):
+                result = await self.summary_agent.run(prompt)
+
+            await self.summaries_table.generate_new_row(
+                SessionSummary(
+                    chat_session_id=chat_session_id,
+                    summary=result.output,
+                    summarized_turns=last_turn_to_summarize,
+                )
+            )
+            logger.info(
+                f"Summary of {chat_session_id} updated to {last_turn_to_summarize} turns"
+            )
+
+        except Exception as e:
+            # The turns stay in the memory window until a summary covers them
+            metrics.increment("chat_memory_summary_errors")
+            logger.error(f"Error updating the summary of {chat_session_id}: {e}")
+
+        finally:
+            self._sessions_summarizing.discard(chat_session_id)
+
+    async def wait_for_summaries(self, timeout: float) -> None:
+        """
+        Wait for the summaries that are being generated, called before the instance stops
+
+        Args:
+            timeout: float -> Maximum seconds to wait
+
+        Returns:
+            None
+        """
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
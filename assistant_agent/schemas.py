@@ -147,10 +147,36 @@ class AgentStep(BaseModel, validate_assignment=True):
     prompt_id: PROMPT_ID_FIELD
     created_at: CREATED_AT_FIELD
     step_data: Annotated[
-        dict,
-        Field(description="Dictionary with all the data related to the agent's step"),
-        PlainSerializer(  # Tells pydantic when serializing (converting to a dict or a json string), use the function
-            lambda dict_data: json.dumps(dict_data),
-            when_used="always",
+        str,
+        Field(description="JSON string with all the data related to the agent's step"),
+        # The steps are usually serialized by pydantic-ai, dictionaries are dumped once
+        BeforeValidator(
+            lambda data: json.dumps(data) if isinstance(data, dict) else data
+        ),
+    ]
+
+
+class SessionSummary(BaseModel, validate_assignment=True):
+    summary_id: Annotated[
+        Optional[str],
+        Field(
+            default=None,
+            description="ID of the summary",
+            pattern=r"^SUM\d{4}[A-Z0-9]{6}\d{3}-\d{4}$",
+        ),
+        STRING_NORMALIZER,
+    ]
+    chat_session_id: CHAT_SESSION_ID_FIELD
+    created_at: CREATED_AT_FIELD
+    summary: Annotated[
+        str,
+        Field(description="Summary of the first turns of the chat session"),
+        STRING_NORMALIZER,
+    ]
+    summarized_turns: Annotated[
+        int,
+        Field(
+            description="Number of turns, from the start of the session, included in the summary",
+            ge=0,
         ),
     ]
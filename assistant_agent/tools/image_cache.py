@@ -0,0 +1,174 @@
+from typing import Optional
+from loguru import logger
+import asyncio
+import hashlib
+import json
+import time
+from assistant_agent.config import GCPConfig, ImageCacheConfig
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.utils.gcp.gcs import (
+    get_blob_metadata,
+    get_image_url,
+    get_text_with_generation,
+    upload_file_from_memory,
+)
+from assistant_agent.utils.metrics import metrics
+
+gcp_config = GCPConfig()
+image_cache_config = ImageCacheConfig()
+
+# Custom metadata of the images uploaded, tells which generation produced them
+IMAGE_CACHE_KEY_METADATA = "image_cache_key"
+
+
+def image_cache_key(prompt: str, llm_model: str, generation_config: dict) -> str:
+    """
+    Build the key of a generated image, it changes if any input of the generation changes
+
+    Args:
+        prompt: str -> Prompt of the image
+        llm_model: str -> Model that generates the image
+        generation_config: dict -> Configuration of the generation. Ex: {"number_of_images": 1}
+
+    Returns:
+        str -> sha256 of the inputs
+    """
+    key_data = json.dumps(
+        {"prompt": prompt.strip(), "model": llm_model, "config": generation_config},
+        sort_keys=True,
+    )
+
+    return hashlib.sha256(key_data.encode()).hexdigest()
+
+
+class ImageCache:
+    """
+    Maps the key of a generation to the GCS object of the image it produced. The
+    index is kept in GCS, one small object per key, so it survives the restarts and
+    it is shared by every instance; the entries already read are kept in memory.
+    Before reusing an image, its object is read with a single metadata request: it
+    is reused only if it still exists, it was not overwritten by another generation
+    (its custom metadata keeps the key) and it will not be deleted soon by the
+    lifecycle rule of the images folder.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str = gcp_config.BUCKET_NAME,
+        max_entries: int = image_cache_config.IMAGE_CACHE_MAX_ENTRIES,
+        lifetime_seconds: float = image_cache_config.GENAI_IMAGES_LIFETIME_SECONDS,
+        min_remaining_seconds: float = image_cache_config.IMAGE_CACHE_MIN_REMAINING_SECONDS,
+        index_path: str = image_cache_config.IMAGE_CACHE_INDEX_PATH,
+    ):
+        self.bucket_name = bucket_name
+        self.lifetime_seconds = lifetime_seconds
+        self.min_remaining_seconds = min_remaining_seconds
+        self.index_path = index_path
+        # The key is the image_cache_key, the value a tuple (blob_name, url)
+        self.images = LRUCache(
+            name="images",
+            max_entries=max_entries,
+            ttl_seconds=lifetime_seconds - min_remaining_seconds,
+        )
+
+    def _index_blob_name(self, key: str) -> str:
+        return f"{self.index_path}/{key}.json"
+
+    def _read_index(self, key: str) -> Optional[tuple[str, str]]:
+        """
+        Read the image of a key from the index stored in GCS
+
+        Args:
+            key: str -> Key built with image_cache_key
+
+        Returns:
+            Optional[tuple[str, str]] -> blob_name and url of the image, None if the key
+                                         is not in the index
+        """
+        index_entry, _ = get_text_with_generation(
+            self._index_blob_name(key), self.bucket_name
+        )
+        if index_entry is None:
+            return None
+
+        blob_name = json.loads(index_entry)["blob_name"]
+
+        return blob_name, get_image_url(blob_name, self.bucket_name)
+
+    async def get(self, key: str) -> Optional[tuple[str, str]]:
+        """
+        Get the image generated with the same key, by this or by another instance
+
+        Args:
+            key: str -> Key built with image_cache_key
+
+        Returns:
+            Optional[tuple[str, str]] -> blob_name and url of the image, None if there is
+                                         no image that can be reused
+        """
+        cached_image = self.images.get(key)
+
+        try:
+            if cached_image is None:
+                cached_image = await asyncio.to_thread(self._read_index, key)
+                if cached_image is None:
+                    return None
+                metrics.increment("image_cache_index_hits")
+
+            blob_name, url = cached_image
+            blob = await asyncio.to_thread(
+                get_blob_metadata, blob_name, self.bucket_name
+            )
+        except Exception as e:
+            logger.warning(f"Error checking the cached image of {key}: {e}")
+            return None
+
+        if blob is None or (blob.metadata or {}).get(IMAGE_CACHE_KEY_METADATA) != key:
+            # Deleted or overwritten with another image
+            self.images.invalidate(key)
+            metrics.increment("image_cache_stale")
+            return None
+
+        age_seconds = time.time() - blob.time_created.timestamp()
+        if self.lifetime_seconds - age_seconds < self.min_remaining_seconds:
+            self.images.invalidate(key)
+            metrics.increment("image_cache_stale")
+            return None
+
+        self.images.put(key, cached_image)
+
+        return blob_name, url
+
+    async def put(self, key: str, blob_name: str, url: str) -> None:
+        """
+        Register the image generated with a key, in memory and in the index stored in
+        GCS. The object must have been uploaded with the key in its metadata
+        (IMAGE_CACHE_KEY_METADATA)
+
+        Args:
+            key: str -> Key built with image_cache_key
+            blob_name: str -> Name of the object of the image
+            url: str -> url of the image
+
+        Returns:
+            None
+        """
+        self.images.put(key, (blob_name, url))
+
+        try:
+            await asyncio.to_thread(
+                upload_file_from_memory,
+                self._index_blob_name(key),
+                json.dumps({"blob_name": blob_name}),
+                self.bucket_name,
+            )
+        except Exception as e:
+            # The image is still reused by this instance
+            logger.warning(f"Error storing the image of {key} in the index: {e}")
+
+    def stats(self) -> dict:
+        return self.images.stats()
+
+
+# Cache shared by the process
+image_cache = ImageCache()
@@ -2,20 +2,51 @@ from loguru import logger
 from google import genai
 from google.genai import types
 from io import BytesIO
+from pydantic import BaseModel
+from typing import Optional
 import asyncio
 import sys
+import time
 from assistant_agent.utils.gcp.gcs import upload_image_from_memory
+from assistant_agent.utils.stream_events import emit_stream_event
 from assistant_agent.credentials import get_llm_config
-from assistant_agent.config import GCPConfig
+from assistant_agent.config import (
+    GCPConfig,
+    ImageCacheConfig,
+    ImagePipelineConfig,
+    LLMConfig,
+    PromptCacheConfig,
+)
+from assistant_agent.tools.image_cache import (
+    IMAGE_CACHE_KEY_METADATA,
+    image_cache,
+    image_cache_key,
+)
+from assistant_agent.tools.prompt_cache import get_prompt_cache, prompt_cache_key
+from assistant_agent.utils.gcp.clients import client_registry
+from assistant_agent.utils.genai_scheduler import genai_scheduler
+from assistant_agent.utils.metrics import metrics
+from assistant_agent.utils.single_flight import SingleFlight
 
 # Setting the logs level
 logger.remove()
 logger.add(sys.stderr, level="INFO")
 
 gcp_config = GCPConfig()
-llm_config = get_llm_config()
+# The API key is only read from Secret Manager when the client is created
+llm_config = LLMConfig()
+image_pipeline_config = ImagePipelineConfig()
+prompt_cache_config = PromptCacheConfig()
+image_cache_config = ImageCacheConfig()
 
-genai_client = genai.Client(api_key=llm_config.API_KEY.get_secret_value())
+genai_client = client_registry.register(
+    "genai",
+    lambda: genai.Client(api_key=get_llm_config().API_KEY.get_secret_value()),
+)
+
+# Calls to the models that are running, identified by the key of their inputs
+prompt_flights = SingleFlight("prompts")
+image_flights = SingleFlight("images")
 
 
 async def generate_prompt_image(
@@ -115,20 +146,40 @@ async def generate_prompt_image(
     Remember to tailor the prompt complexity and detail level to the user's request. Start with the core idea (subject, context, style) and add details and modifiers as needed. Always generate the prompt in english
     """
 
-    response = await genai_client.aio.models.generate_content(
-        model=llm_model,
-        config=types.GenerateContentConfig(
-            temperature=temperature,
-            system_instruction=prompt_designer,
-        ),
-        contents=[
-            idea,
-        ],
-    )
+    cache_key = prompt_cache_key(idea, llm_model, temperature, prompt_designer)
+    if prompt_cache_config.PROMPT_CACHE_ENABLED:
+        cached_prompt = await get_prompt_cache().get(cache_key)
+        if cached_prompt is not None:
+            logger.info(f"Prompt found in cache: {cached_prompt}")
+            return cached_prompt
+
+    async def expand_idea() -> str:
+        response = await genai_scheduler.call(
+            llm_model,
+            lambda: genai_client.aio.models.generate_content(
+                model=llm_model,
+                config=types.GenerateContentConfig(
+                    temperature=temperature,
+                    system_instruction=prompt_designer,
+                ),
+                contents=[
+                    idea,
+                ],
+            ),
+        )
+
+        if prompt_cache_config.PROMPT_CACHE_ENABLED and response.text:
+            await get_prompt_cache().put(cache_key, response.text)
+
+        return response.text
+
+    # The same idea requested at the same time (retries, double clicks or other
+    # users) is expanded only once
+    prompt = await prompt_flights.do(cache_key, expand_idea)
     logger.info("Prompt generation completed.")
-    logger.info(f"Prompt generated: {response.text}")
+    logger.info(f"Prompt generated: {prompt}")
 
-    return response.text
+    return prompt
 
 
 async def generate_prompts(
@@ -234,11 +285,19 @@ async def generate_image(
 
     image_data = {}
 
-    response = await genai_client.aio.models.generate_images(
-        model=llm_model,
-        prompt=prompt,
-        config=types.GenerateImagesConfig(
-            number_of_images=llm_config.DEFAULT_GENERATED_IMAGES,
+    generation_config = {"number_of_images": llm_config.DEFAULT_GENERATED_IMAGES}
+
+    # The same prompt requested at the same time is generated only once. The response
+    # is shared, so each caller builds its own BytesIO from the image bytes
+    response = await image_flights.do(
+        image_cache_key(prompt, llm_model, generation_config),
+        lambda: genai_scheduler.call(
+            llm_model,
+            lambda: genai_client.aio.models.generate_images(
+                model=llm_model,
+                prompt=prompt,
+                config=types.GenerateImagesConfig(**generation_config),
+            ),
         ),
     )
 
@@ -254,18 +313,155 @@ async def generate_image(
     return image_data
 
 
-async def generate_images(prompts_info: list[dict]) -> list[str]:
+class ImageResult(BaseModel):
+    """
+    Result of the generation and upload of one image
+    """
+
+    image_name: str
+    url: Optional[str] = None
+    # Object of the image in GCS. When the image is reused, it is the object
+    # generated for an earlier request, with its own name
+    blob_name: Optional[str] = None
+    # Stage that failed (generation or upload) and the error, None if the image is ready
+    failed_stage: Optional[str] = None
+    error: Optional[str] = None
+    generation_seconds: Optional[float] = None
+    upload_seconds: Optional[float] = None
+    # The image was generated before with the same prompt and it is reused
+    cached: bool = False
+
+
+async def upload_image(
+    image_name: str, image_bytes: BytesIO, metadata: Optional[dict[str, str]] = None
+) -> str:
+    """
+    Upload an image to GCS in a thread. If the agent is being streamed, the url is
+    sent to the client as soon as the upload finishes
+
+    Args:
+        image_name: str -> Name of the blob. Ex: "genai_images/waves_in_the_sea.png"
+        image_bytes: BytesIO -> Content of the image
+        metadata: Optional[dict[str, str]] -> Custom metadata of the object
+
+    Returns:
+        str -> url of the image, signed or public (GCS_IMAGE_URL_MODE)
+    """
+    image_url = await asyncio.to_thread(
+        upload_image_from_memory,
+        image_name,
+        image_bytes,
+        gcp_config.BUCKET_NAME,
+        metadata,
+    )
+
+    emit_stream_event("image_url", {"image_name": image_name, "url": image_url})
+
+    return image_url
+
+
+async def generate_and_upload_image(
+    prompt_info: dict,
+    generation_semaphore: asyncio.Semaphore,
+    upload_semaphore: asyncio.Semaphore,
+    reuse_images: bool = True,
+) -> ImageResult:
     """
-    Generates n number of images based on n number of requests
+    Generate one image and upload it as soon as it is ready, without waiting for the
+    other images of the request. The errors are returned in the result
+
+    Args:
+        prompt_info: dict -> Dictionary with the keys prompt and image_name
+        generation_semaphore: asyncio.Semaphore -> Limits the images generated at the same time
+        upload_semaphore: asyncio.Semaphore -> Limits the images uploaded at the same time
+        reuse_images: bool -> Return the image generated before with the same prompt, if any
+
+    Returns:
+        ImageResult -> url of the image or the stage that failed, with the time of each stage
+    """
+    result = ImageResult(image_name=prompt_info["image_name"])
+
+    cache_key = image_cache_key(
+        prompt_info["prompt"],
+        llm_config.IMAGE_GENERATION_MODEL_NAME,
+        {"number_of_images": llm_config.DEFAULT_GENERATED_IMAGES},
+    )
+    if reuse_images and image_cache_config.IMAGE_CACHE_ENABLED:
+        cached_image = await image_cache.get(cache_key)
+        if cached_image is not None:
+            result.blob_name, result.url = cached_image
+            result.cached = True
+            logger.info(
+                f"Reusing the image {result.blob_name} generated before for "
+                f"{result.image_name}"
+            )
+            emit_stream_event(
+                "image_url", {"image_name": result.blob_name, "url": result.url}
+            )
+            return result
+
+    try:
+        async with generation_semaphore:
+            start = time.perf_counter()
+            image_data = await generate_image(
+                prompt=prompt_info["prompt"],
+                general_image_name=prompt_info["image_name"],
+            )
+            result.generation_seconds = time.perf_counter() - start
+
+        async with upload_semaphore:
+            start = time.perf_counter()
+            result.url = await upload_image(
+                image_data["image_name"],
+                image_data["image_bytes"],
+                metadata={IMAGE_CACHE_KEY_METADATA: cache_key},
+            )
+            result.upload_seconds = time.perf_counter() - start
+        result.blob_name = image_data["image_name"]
+
+        # The newest image of the prompt replaces the previous one, even if the
+        # user asked for a new variation
+        await image_cache.put(cache_key, result.blob_name, result.url)
+
+    except Exception as e:
+        result.failed_stage = (
+            "generation" if result.generation_seconds is None else "upload"
+        )
+        result.error = str(e)
+        metrics.increment(
+            "image_pipeline_errors", labels={"stage": result.failed_stage}
+        )
+        logger.error(f"Error in the {result.failed_stage} of {result.image_name}: {e}")
+
+    for stage, seconds in [
+        ("generation", result.generation_seconds),
+        ("upload", result.upload_seconds),
+    ]:
+        if seconds is not None:
+            metrics.observe("image_pipeline_stage_seconds", seconds, {"stage": stage})
+
+    return result
+
+
+async def generate_images(
+    prompts_info: list[dict], new_variations: bool = False
+) -> list[ImageResult]:
+    """
+    Generates n number of images based on n number of requests. Each image is uploaded
+    as soon as it is generated, so the latency is close to the one of the slowest image.
+    If an image was already generated with the same prompt, it is reused.
 
     Args:
         requests: list[dict] -> List of dictionaries, each dictianary can be represented as one image generation request
                                 The dictionary must contain two keys:
                                         - prompt: Prompt that will generate the image
                                         - image_name: Name of the image
+        new_variations: bool -> True only if the user wants new versions of images already generated
+                                with the same prompts, so they are generated again instead of reused
 
     Returns:
-        list[str] -> A list of public urls where the images can be downloaded
+        list[ImageResult] -> One result per request, in the same order, with the url
+                             where the image can be downloaded or the error that happened
     """
 
     logger.debug("generate_images function started")
@@ -292,32 +488,30 @@ async def generate_images(prompts_info: list[dict]) -> list[str]:
     logger.info(f"Generating {len(prompts_info)} images...")
 
     logger.debug(f"{prompts_info = }")
-    # Creating a list of generation tasks
-    generation_tasks = list()
 
-    logger.info("Preparing generation requests")
-    for request in prompts_info:
-        task = generate_image(
-            prompt=request["prompt"], general_image_name=request["image_name"]
-        )
-        generation_tasks.append(task)
-
-    logger.info("Launching concurrent generation")
-    images_data = await asyncio.gather(*generation_tasks)
-
-    # As upload_image_from_memory is a syncronus function, it will be executed in
-    # different threads to reduce the execution time
-    storage_tasks = list()
-    for image_data in images_data:
-        task = asyncio.to_thread(
-            upload_image_from_memory,
-            image_data["image_name"],  # First argument of the function
-            image_data["image_bytes"],  # Second argument
-            gcp_config.BUCKET_NAME,  # last argument
+    # The generation and the upload have their own limits, an image can be uploaded
+    # while the next one is being generated
+    generation_semaphore = asyncio.Semaphore(
+        image_pipeline_config.IMAGE_GENERATION_CONCURRENCY
+    )
+    upload_semaphore = asyncio.Semaphore(image_pipeline_config.IMAGE_UPLOAD_CONCURRENCY)
+
+    with metrics.timer("image_pipeline_seconds"):
+        images_results = await asyncio.gather(
+            *[
+                generate_and_upload_image(
+                    prompt_info,
+                    generation_semaphore,
+                    upload_semaphore,
+                    reuse_images=not new_variations,
+                )
+                for prompt_info in prompts_info
+            ]
         )
 
-        storage_tasks.append(task)
-
-    images_urls = await asyncio.gather(*storage_tasks, return_exceptions=True)
+    failed_images = [result for result in images_results if result.url is None]
+    logger.info(
+        f"{len(images_results) - len(failed_images)} of {len(images_results)} images generated"
+    )
 
-    return images_urls
+    return images_results
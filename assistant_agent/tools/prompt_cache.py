@@ -0,0 +1,269 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+from loguru import logger
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from assistant_agent.config import GCPConfig, PromptCacheConfig
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.utils.gcp.gcs import (
+    get_text_with_generation,
+    upload_file_from_memory,
+)
+from assistant_agent.utils.metrics import metrics
+
+gcp_config = GCPConfig()
+prompt_cache_config = PromptCacheConfig()
+
+
+def normalize_idea(idea: str) -> str:
+    """
+    Normalize an idea so the same idea written with a different spacing uses the
+    same cache entry. The case is kept, it can matter in the image
+    (Ex: a text that must appear in it)
+
+    Args:
+        idea: str -> Idea of the user. Ex: " Waves in the  sea "
+
+    Returns:
+        str -> Normalized idea. Ex: "Waves in the sea"
+    """
+    return " ".join(idea.split())
+
+
+def prompt_cache_key(
+    idea: str, llm_model: str, temperature: float, system_instruction: str
+) -> str:
+    """
+    Build the key of a generated prompt, it changes if any input of the generation changes
+
+    Args:
+        idea: str -> Idea of the user
+        llm_model: str -> Model that generates the prompt
+        temperature: float -> Temperature of the model
+        system_instruction: str -> Instructions given to the model
+
+    Returns:
+        str -> sha256 of the inputs
+    """
+    key_data = json.dumps(
+        {
+            "idea": normalize_idea(idea),
+            "model": llm_model,
+            "temperature": temperature,
+            "instruction": hashlib.sha256(system_instruction.encode()).hexdigest(),
+        },
+        sort_keys=True,
+    )
+
+    return hashlib.sha256(key_data.encode()).hexdigest()
+
+
+class PromptCacheBackend(ABC):
+    """
+    Persistent tier of the prompt cache, shared by all the processes
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        """
+        Get a generated prompt
+
+        Args:
+            key: str -> Key of the prompt
+
+        Returns:
+            Optional[tuple[str, float]] -> Prompt and the timestamp when it was
+                                           stored, None if it is not stored
+        """
+        pass
+
+    @abstractmethod
+    def put(self, key: str, prompt: str) -> None:
+        """
+        Store a generated prompt
+
+        Args:
+            key: str -> Key of the prompt
+            prompt: str -> Prompt generated
+
+        Returns:
+            None
+        """
+        pass
+
+
+class GCSPromptCacheBackend(PromptCacheBackend):
+    """
+    Keeps each generated prompt in a small JSON object in GCS. The objects are not
+    deleted, an expired prompt is ignored and overwritten by the next generation.
+    A lifecycle rule over gcs_path can be used to remove the old objects.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str = gcp_config.BUCKET_NAME,
+        gcs_path: str = prompt_cache_config.PROMPT_CACHE_GCS_PATH,
+    ):
+        self.bucket_name = bucket_name
+        self.gcs_path = gcs_path
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        text, _ = get_text_with_generation(
+            f"{self.gcs_path}/{key}.json", self.bucket_name
+        )
+        if text is None:
+            return None
+
+        data = json.loads(text)
+
+        return data["prompt"], data["created_at"]
+
+    def put(self, key: str, prompt: str) -> None:
+        upload_file_from_memory(
+            f"{self.gcs_path}/{key}.json",
+            json.dumps({"prompt": prompt, "created_at": time.time()}),
+            self.bucket_name,
+        )
+
+
+class PromptCache:
+    """
+    Two tier cache of the prompts generated from the ideas of the users: an in-memory
+    LRU and, optionally, a persistent backend shared by the API instances. The
+    prompts found in the backend are copied into the memory tier.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[PromptCacheBackend] = None,
+        max_entries: int = prompt_cache_config.PROMPT_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = prompt_cache_config.PROMPT_CACHE_TTL_SECONDS,
+    ):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUCache(
+            name="prompts",
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+        )
+        self._lock = threading.Lock()
+        self.backend_hits = 0
+        self.misses = 0
+
+    def _count(self, tier: str) -> None:
+        with self._lock:
+            if tier == "backend":
+                self.backend_hits += 1
+            elif tier == "miss":
+                self.misses += 1
+        metrics.increment("prompt_cache_lookups", labels={"tier": tier})
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Get a generated prompt from the memory tier or from the backend
+
+        Args:
+            key: str -> Key built with prompt_cache_key
+
+        Returns:
+            Optional[str] -> Prompt, None if it is not cached or expired
+        """
+        prompt = self.memory.get(key)
+        if prompt is not None:
+            self._count("memory")
+            return prompt
+
+        if self.backend is not None:
+            try:
+                stored_prompt = await asyncio.to_thread(self.backend.get, key)
+            except Exception as e:
+                # The cache must never break the generation
+                stored_prompt = None
+                logger.warning(f"Error reading the prompt cache backend: {e}")
+
+            if stored_prompt is not None:
+                prompt, created_at = stored_prompt
+                remaining_seconds = self.ttl_seconds - (time.time() - created_at)
+
+                if remaining_seconds > 0:
+                    self.memory.put(key, prompt, ttl_seconds=remaining_seconds)
+                    self._count("backend")
+                    return prompt
+
+        self._count("miss")
+        return None
+
+    async def put(self, key: str, prompt: str) -> None:
+        """
+        Store a generated prompt in both tiers
+
+        Args:
+            key: str -> Key built with prompt_cache_key
+            prompt: str -> Prompt generated
+
+        Returns:
+            None
+        """
+        self.memory.put(key, prompt)
+
+        if self.backend is not None:
+            try:
+                await asyncio.to_thread(self.backend.put, key, prompt)
+            except Exception as e:
+                logger.warning(f"Error writing the prompt cache backend: {e}")
+
+    def stats(self) -> dict:
+        """
+        Get the usage statistics of the cache
+
+        Returns:
+            dict -> Hits of each tier, misses, hit rate and the stats of the memory tier
+        """
+        memory_stats = self.memory.stats()
+
+        with self._lock:
+            memory_hits = memory_stats["hits"]
+            lookups = memory_hits + self.backend_hits + self.misses
+            return {
+                "memory_hits": memory_hits,
+                "backend_hits": self.backend_hits,
+                "misses": self.misses,
+                "hit_rate": (memory_hits + self.backend_hits) / lookups
+                if lookups
+                else None,
+                "memory": memory_stats,
+            }
+
+
+_prompt_cache: Optional[PromptCache] = None
+_prompt_cache_lock = threading.Lock()
+
+
+def get_prompt_cache() -> PromptCache:
+    """
+    Get the prompt cache shared by the process
+
+    Returns:
+        PromptCache -> Cache configured with PromptCacheConfig
+    """
+    global _prompt_cache
+
+    with _prompt_cache_lock:
+        if _prompt_cache is None:
+            backend_name = prompt_cache_config.PROMPT_CACHE_BACKEND
+
+            if backend_name == "gcs":
+                backend = GCSPromptCacheBackend()
+            elif backend_name == "memory":
+                backend = None
+            else:
+                raise ValueError(
+                    f"Unknown PROMPT_CACHE_BACKEND '{backend_name}', use 'gcs' or 'memory'"
+                )
+
+            _prompt_cache = PromptCache(backend=backend)
+
+    return _prompt_cache
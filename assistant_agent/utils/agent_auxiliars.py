@@ -1,60 +1,108 @@
-from pydantic_core import to_jsonable_python
-from pydantic_ai.messages import ModelMessagesTypeAdapter, ModelMessage
-import json
-
-
-def prepare_to_read_chat_history(chat_history: list[dict]) -> list[ModelMessage]:
+from pydantic_ai import Agent
+from pydantic_ai.agent import AgentRunResult
+from pydantic_ai.messages import (
+    FunctionToolCallEvent,
+    FunctionToolResultEvent,
+    ModelMessagesTypeAdapter,
+    ModelMessage,
+    PartDeltaEvent,
+    PartStartEvent,
+    TextPart,
+    TextPartDelta,
+)
+from assistant_agent.utils.stream_events import emit_stream_event
+
+
+def serialize_agent_steps(messages: list[ModelMessage]) -> list[str]:
     """
-    Convert a chat session history that is obtained as a list of dictionaries and
-    transform it into a list[ModelMessage] that the agent can read during chat sessions.
+    Serialize the messages of an agent run as the JSON strings stored in the
+    agent_steps table, one per message
 
     Args:
-        chat_history: list[dict] -> list of dictionaries obtained fron the database, this contains all the
-                                    agent steps, not only the answer/response
+        messages: list[ModelMessage] -> Messages to store, usually AgentRunResult.new_messages(),
+                                        which only contains the messages of the run, whatever
+                                        the length of the history passed to the agent
 
     Returns:
-        list[ModelMessage] -> List of ModelMessage objects that the agent can process
+        list[str] -> JSON of each message
     """
-
-    # Validates the structure of the python objects
-    chat_history = to_jsonable_python(chat_history)
-
-    # Convert into a list of ModelMessage
-    chat_history = ModelMessagesTypeAdapter.validate_python(chat_history)
-
-    return chat_history
+    # Serialized with the same adapter as new_messages_json(), so the steps can be
+    # decoded with ModelMessagesTypeAdapter. The brackets of the list are removed
+    return [
+        ModelMessagesTypeAdapter.dump_json([message])[1:-1].decode()
+        for message in messages
+    ]
 
 
-def get_new_agent_steps(previous_steps: list[dict], all_steps: bytes):
+def prepare_to_send_chat_history(chat_history: bytes) -> str:
     """
-    Process the previous_steps and the new one to store only the new history generated
+    Prepare the chat session obtained from the agent chat session to be sent through an API
 
     Args:
-        previous_steps: list[dict] -> List of dictionaries, each dictionary is an agent step
-                                        that was already stored in the database
-        all_steps: bytes -> binary string obtained after making agent.all_messages_json()
+        chat_history: bytes -> Chat history obtained from agent.run_sync.all_messages_json()
 
-    Returns: -> list[dict] -> List of the new agent steps generated
+    Returns:
+        str: str -> JSON string
     """
-    # Convert it into a list of dictionaries
-    all_steps = json.loads(all_steps)
 
-    number_new_steps = len(previous_steps) - len(all_steps)  # always a negative number
-
-    new_steps = all_steps[number_new_steps:]
-
-    return new_steps
+    return chat_history.decode("UTF-8")
 
 
-def prepare_to_send_chat_history(chat_history: bytes) -> str:
+async def stream_agent_run(
+    agent: Agent, user_prompt: str, message_history: list[ModelMessage]
+) -> AgentRunResult:
     """
-    Prepare the chat session obtained from the agent chat session to be sent through an API
+    Run the agent node by node, emitting in the stream of the current context the
+    text deltas of the model responses and the start and end of each tool call
 
     Args:
-        chat_history: bytes -> Chat history obtained from agent.run_sync.all_messages_json()
+        agent: Agent -> Agent that answers the prompt
+        user_prompt: str -> Prompt of the user
+        message_history: list[ModelMessage] -> History passed to the agent
 
     Returns:
-        str: str -> JSON string
+        AgentRunResult -> Result of the run, the same that agent.run returns
     """
-
-    return chat_history.decode("UTF-8")
+    async with agent.iter(user_prompt, message_history=message_history) as agent_run:
+        async for node in agent_run:
+            if Agent.is_model_request_node(node):
+                async with node.stream(agent_run.ctx) as request_stream:
+                    async for event in request_stream:
+                        if isinstance(event, PartStartEvent) and isinstance(
+                            event.part, TextPart
+                        ):
+                            delta = event.part.content
+                        elif isinstance(event, PartDeltaEvent) and isinstance(
+                            event.delta, TextPartDelta
+                        ):
+                            delta = event.delta.content_delta
+                        else:
+                            continue
+
+                        if delta:
+                            emit_stream_event("text_delta", {"delta": delta})
+
+            elif Agent.is_call_tools_node(node):
+                async with node.stream(agent_run.ctx) as tools_stream:
+                    async for event in tools_stream:
+                        if isinstance(event, FunctionToolCallEvent):
+                            emit_stream_event(
+                                "tool_call_start",
+                                {
+                                    "tool_name": event.part.tool_name,
+                                    "tool_call_id": event.call_id,
+                                    "args": event.part.args_as_dict(),
+                                },
+                            )
+                        elif isinstance(event, FunctionToolResultEvent):
+                            emit_stream_event(
+                                "tool_call_end",
+                                {
+                                    "tool_name": event.result.tool_name,
+                                    "tool_call_id": event.tool_call_id,
+                                    "succeeded": event.result.part_kind
+                                    == "tool-return",
+                                },
+                            )
+
+    return agent_run.result
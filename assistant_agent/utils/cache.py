@@ -0,0 +1,234 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from assistant_agent.utils.metrics import metrics
+import sys
+import threading
+import time
+
+
+class _CacheEntry:
+    def __init__(self, value: Any, size: int, expires_at: Optional[float]):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by number of entries and by total size.
+    The entries expire after ttl_seconds since the last time they were written.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        size_function: Callable[[Any], int] = sys.getsizeof,
+    ):
+        """
+        Args:
+            name: str -> Name of the cache, used to label its metrics
+            max_entries: int -> Maximum number of entries
+            max_bytes: Optional[int] -> Maximum total size of the entries, None for no limit
+            ttl_seconds: Optional[float] -> Lifetime of an entry, None for no expiration
+            size_function: Callable[[Any], int] -> Function that returns the size of a value
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be greater than 0")
+
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size_function = size_function
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, _CacheEntry] = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _is_expired(self, entry: _CacheEntry) -> bool:
+        return entry.expires_at is not None and time.monotonic() >= entry.expires_at
+
+    def _expiration(self, ttl_seconds: Optional[float]) -> Optional[float]:
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl_seconds is None:
+            return None
+        return time.monotonic() + ttl_seconds
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used entries until the limits are respected,
+        must be called with the lock acquired
+        """
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+            metrics.increment("cache_evictions", labels={"cache": self.name})
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value from the cache
+
+        Args:
+            key: Hashable -> Key of the entry
+            default: Any -> Value returned if the key is not cached or expired
+
+        Returns:
+            Any -> Cached value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and self._is_expired(entry):
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                metrics.increment("cache_misses", labels={"cache": self.name})
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.increment("cache_hits", labels={"cache": self.name})
+
+            return entry.value
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        size: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        Store a value in the cache, replacing the previous one
+
+        Args:
+            key: Hashable -> Key of the entry
+            value: Any -> Value to store
+            size: Optional[int] -> Size of the value, computed with size_function if not passed
+            ttl_seconds: Optional[float] -> Lifetime of this entry, the cache ttl if not passed
+
+        Returns:
+            None
+        """
+        size = self.size_function(value) if size is None else size
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # Values bigger than the whole cache are not stored
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+
+            self._entries[key] = _CacheEntry(value, size, self._expiration(ttl_seconds))
+            self._total_bytes += size
+            self._evict()
+
+    def update(
+        self,
+        key: Hashable,
+        update_function: Callable[[Any], Any],
+        size_delta: Optional[int] = None,
+    ) -> bool:
+        """
+        Replace the value of an entry with update_function(value), only if the entry is cached.
+        The entry becomes the most recently used and its lifetime starts again.
+
+        Args:
+            key: Hashable -> Key of the entry
+            update_function: Callable[[Any], Any] -> Receives the current value and returns the new one
+            size_delta: Optional[int] -> Change of the size of the value. If not passed,
+                                         the size is computed again with size_function
+
+        Returns:
+            bool -> True if the entry was cached and updated
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or self._is_expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                return False
+
+            entry.value = update_function(entry.value)
+            new_size = (
+                self.size_function(entry.value)
+                if size_delta is None
+                else entry.size + size_delta
+            )
+            self._total_bytes += new_size - entry.size
+            entry.size = new_size
+            entry.expires_at = self._expiration(None)
+
+            self._entries.move_to_end(key)
+            self._evict()
+
+            return True
+
+    def invalidate(self, key: Hashable) -> bool:
+        """
+        Remove an entry from the cache
+
+        Args:
+            key: Hashable -> Key of the entry
+
+        Returns:
+            bool -> True if the entry was cached
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Get the usage statistics of the cache
+
+        Returns:
+            dict -> Hits, misses, hit rate, evictions, entries and bytes
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else None,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
@@ -0,0 +1,143 @@
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+from typing import Optional
+
+
+def split_into_turns(messages: list[ModelMessage]) -> list[list[ModelMessage]]:
+    """
+    Split a chat history into turns. A turn starts with the request that contains a
+    user prompt and includes every step that the agent made to answer it, so a tool call
+    and its tool return always belong to the same turn.
+
+    Args:
+        messages: list[ModelMessage] -> Chat history
+
+    Returns:
+        list[list[ModelMessage]] -> Messages of each turn, in order
+    """
+    turns: list[list[ModelMessage]] = list()
+
+    for message in messages:
+        starts_turn = isinstance(message, ModelRequest) and any(
+            isinstance(part, UserPromptPart) for part in message.parts
+        )
+
+        if starts_turn or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+
+    return turns
+
+
+def build_memory_window(
+    messages: list[ModelMessage],
+    memory_limit: int,
+    summary: Optional[str] = None,
+    summarized_turns: int = 0,
+) -> list[ModelMessage]:
+    """
+    Build the history sent to the agent: the last memory_limit turns verbatim and, if
+    there is one, the summary of the previous turns. The system prompt of the first
+    message is always kept, because the agent only adds it when the history is empty.
+
+    The turns that the summary does not cover yet are kept verbatim (up to twice the
+    limit), so nothing is lost while a summary is being generated. Without a summary
+    no turn is covered, so the last 2 * memory_limit turns are kept.
+
+    Args:
+        messages: list[ModelMessage] -> Full chat history
+        memory_limit: int -> Number of turns sent verbatim
+        summary: Optional[str] -> Summary of the first turns of the session
+        summarized_turns: int -> Number of turns covered by the summary
+
+    Returns:
+        list[ModelMessage] -> History to pass to the agent as message_history
+    """
+    if memory_limit < 1:
+        raise ValueError("memory_limit must be greater than 0")
+
+    turns = split_into_turns(messages)
+
+    if len(turns) <= memory_limit:
+        return messages
+
+    # Without a summary (not generated yet, or it failed) no turn is covered
+    if summary is None:
+        summarized_turns = 0
+    start = max(
+        min(len(turns) - memory_limit, summarized_turns),
+        len(turns) - 2 * memory_limit,
+    )
+
+    if start == 0:
+        return messages
+
+    system_parts = [
+        part for part in turns[0][0].parts if isinstance(part, SystemPromptPart)
+    ]
+    if summary is not None:
+        system_parts.append(
+            SystemPromptPart(
+                content=f"Summary of the previous conversation with the user:\n{summary}"
+            )
+        )
+
+    kept_messages = [message for turn in turns[start:] for message in turn]
+
+    # The system prompt and the summary go in the first request of the window
+    first_request = kept_messages[0]
+    kept_messages[0] = ModelRequest(
+        parts=[
+            *system_parts,
+            *[
+                part
+                for part in first_request.parts
+                if not isinstance(part, SystemPromptPart)
+            ],
+        ],
+        instructions=first_request.instructions,
+    )
+
+    return kept_messages
+
+
+def render_turns(
+    turns: list[list[ModelMessage]], max_tool_return_length: int = 500
+) -> str:
+    """
+    Render turns of a chat as plain text, to be summarized by a model
+
+    Args:
+        turns: list[list[ModelMessage]] -> Turns to render
+        max_tool_return_length: int -> The tool returns are truncated to this length
+
+    Returns:
+        str -> Text with one line per user prompt, agent answer, tool call or tool return
+    """
+    lines = list()
+
+    for turn in turns:
+        for message in turn:
+            for part in message.parts:
+                if isinstance(part, UserPromptPart):
+                    lines.append(f"User: {part.content}")
+                elif isinstance(part, TextPart) and isinstance(message, ModelResponse):
+                    lines.append(f"Assistant: {part.content}")
+                elif isinstance(part, ToolCallPart):
+                    lines.append(
+                        f"Assistant called {part.tool_name}({part.args_as_json_str()})"
+                    )
+                elif isinstance(part, ToolReturnPart):
+                    content = part.model_response_str()[:max_tool_return_length]
+                    lines.append(f"{part.tool_name} returned: {content}")
+
+    return "\n".join(lines)
@@ -1,8 +1,207 @@
 from google.cloud import bigquery
+from google.api_core.exceptions import Conflict, NotFound
 from loguru import logger
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from datetime import date, datetime
+from decimal import Decimal
+from assistant_agent.config import (
+    BQExecutorConfig,
+    BQMetadataConfig,
+    BQQueryConfig,
+    BQCostConfig,
+)
+from assistant_agent.utils.gcp.clients import bigquery_client
+from assistant_agent.utils.metrics import metrics
+from assistant_agent.utils.cache import LRUCache
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+
+
+# Created on first use, importing the module does not authenticate
+client = bigquery_client
+
+executor_config = BQExecutorConfig()
+metadata_config = BQMetadataConfig()
+query_config = BQQueryConfig()
+cost_config = BQCostConfig()
+
+# While the optional job creation is in preview, the BigQuery client only requests it
+# to the jobs.query API (used by query_and_wait) if this variable is set
+if query_config.BQ_SHORT_QUERIES_ENABLED and query_config.BQ_JOBLESS_QUERIES_ENABLED:
+    os.environ.setdefault("QUERY_PREVIEW_ENABLED", "true")
+
+# Registry of the datasets and tables (with their schemas) already resolved by the process.
+# Only existing objects are cached, so a new table is visible as soon as it is created
+_datasets_metadata = LRUCache(
+    name="bq_datasets_metadata",
+    max_entries=metadata_config.BQ_METADATA_MAX_ENTRIES,
+    ttl_seconds=metadata_config.BQ_METADATA_TTL_SECONDS,
+    size_function=lambda _: 0,
+)
+_tables_metadata = LRUCache(
+    name="bq_tables_metadata",
+    max_entries=metadata_config.BQ_METADATA_MAX_ENTRIES,
+    ttl_seconds=metadata_config.BQ_METADATA_TTL_SECONDS,
+    size_function=lambda _: 0,
+)
+
+
+def get_dataset_metadata(
+    dataset_name: str, project_id: str, refresh: bool = False
+) -> Optional[bigquery.Dataset]:
+    """
+    Get a dataset from the metadata registry, it is requested to BigQuery only
+    if it is not cached or if refresh is True.
+
+    Args:
+        dataset_name (str): The name of the dataset.
+        project_id (str): The project ID where the dataset is located.
+        refresh (bool): Ignore the cached value.
+
+    Returns:
+        Optional[bigquery.Dataset]: The dataset, None if it does not exist.
+    """
+    dataset_id = f"{project_id}.{dataset_name}"
+
+    if not refresh:
+        dataset = _datasets_metadata.get(dataset_id)
+        if dataset is not None:
+            return dataset
+
+    try:
+        dataset = client.get_dataset(dataset_id)
+    except NotFound:
+        _datasets_metadata.invalidate(dataset_id)
+        return None
+
+    _datasets_metadata.put(dataset_id, dataset)
+
+    return dataset
+
+
+def get_table_metadata(
+    table_name: str, dataset_name: str, project_id: str, refresh: bool = False
+) -> Optional[bigquery.Table]:
+    """
+    Get a table (including its schema) from the metadata registry, it is requested
+    to BigQuery only if it is not cached or if refresh is True.
+
+    Args:
+        table_name (str): The name of the table.
+        dataset_name (str): The name of the dataset where the table is located.
+        project_id (str): The project ID where the dataset is located.
+        refresh (bool): Ignore the cached value.
+
+    Returns:
+        Optional[bigquery.Table]: The table, None if it does not exist.
+    """
+    table_id = f"{project_id}.{dataset_name}.{table_name}"
+
+    if not refresh:
+        table = _tables_metadata.get(table_id)
+        if table is not None:
+            return table
+
+    try:
+        table = client.get_table(table_id)
+    except NotFound:
+        _tables_metadata.invalidate(table_id)
+        return None
+
+    _tables_metadata.put(table_id, table)
+
+    return table
+
+
+def get_table_schema(
+    table_name: str, dataset_name: str, project_id: str
+) -> list[bigquery.SchemaField]:
+    """
+    Get the cached schema of a table
+
+    Args:
+        table_name (str): The name of the table.
+        dataset_name (str): The name of the dataset where the table is located.
+        project_id (str): The project ID where the dataset is located.
+
+    Returns:
+        list[bigquery.SchemaField]: The columns of the table.
+    """
+    table = get_table_metadata(table_name, dataset_name, project_id)
+
+    if table is None:
+        raise ValueError(
+            f"Table {table_name} does not exist in dataset {dataset_name}."
+        )
+
+    return list(table.schema)
 
 
-client = bigquery.Client()
+def invalidate_metadata(
+    dataset_name: str, project_id: str, table_name: Optional[str] = None
+) -> None:
+    """
+    Remove a dataset or a table from the metadata registry
+
+    Args:
+        dataset_name (str): The name of the dataset.
+        project_id (str): The project ID where the dataset is located.
+        table_name (Optional[str]): The name of the table, if None the dataset is removed.
+
+    Returns:
+        None
+    """
+    if table_name is None:
+        _datasets_metadata.invalidate(f"{project_id}.{dataset_name}")
+    else:
+        _tables_metadata.invalidate(f"{project_id}.{dataset_name}.{table_name}")
+
+
+def validate_rows(rows: list[dict], schema: list[bigquery.SchemaField]) -> list[str]:
+    """
+    Validate locally that the rows can be inserted in a table with the schema provided.
+    It checks that all the columns exist, that the required columns have a value and
+    that the repeated columns are lists.
+
+    Args:
+        rows (list[dict]): Rows to validate, same format as in insert_rows.
+        schema (list[bigquery.SchemaField]): The columns of the table.
+
+    Returns:
+        list[str]: Errors found, empty if the rows are valid.
+    """
+    fields = {field.name: field for field in schema}
+    errors = list()
+
+    for row_number, row in enumerate(rows):
+        unknown_columns = set(row.keys()) - set(fields.keys())
+        if unknown_columns:
+            errors.append(
+                f"Row {row_number}: unknown columns {', '.join(sorted(unknown_columns))}"
+            )
+
+        for field in fields.values():
+            value = row.get(field.name)
+
+            if field.mode == "REQUIRED" and value is None:
+                errors.append(f"Row {row_number}: the column {field.name} is required")
+
+            elif (
+                field.mode == "REPEATED"
+                and value is not None
+                and not isinstance(value, list)
+            ):
+                errors.append(
+                    f"Row {row_number}: the column {field.name} must be a list"
+                )
+
+    return errors
 
 
 def dataset_exists(dataset_name: str, project_id: str) -> bool:
@@ -24,16 +223,7 @@ def dataset_exists(dataset_name: str, project_id: str) -> bool:
             f"The parameters {', '.join(parameters.keys())} must be not null strings."
         )
 
-    dataset_id = f"{project_id}.{dataset_name}"
-
-    try:
-        client.get_dataset(dataset_id)
-        return True
-    except Exception as e:
-        if "Not found" in str(e):
-            return False
-        else:
-            raise e
+    return get_dataset_metadata(dataset_name, project_id) is not None
 
 
 def table_exists(table_name: str, dataset_name: str, project_id: str) -> bool:
@@ -60,16 +250,7 @@ def table_exists(table_name: str, dataset_name: str, project_id: str) -> bool:
             f"The parameters {', '.join(parameters.keys())} must be not null strings."
         )
 
-    table_id = f"{project_id}.{dataset_name}.{table_name}"
-
-    try:
-        client.get_table(table_id)
-        return True
-    except Exception as e:
-        if "Not found" in str(e):
-            return False
-        else:
-            raise e
+    return get_table_metadata(table_name, dataset_name, project_id) is not None
 
 
 def create_dataset(dataset_name: str, dataset_location: str, project_id: str) -> None:
@@ -96,14 +277,21 @@ def create_dataset(dataset_name: str, dataset_location: str, project_id: str) ->
     dataset.location = dataset_location
 
     try:
-        client.create_dataset(dataset)
+        dataset = client.create_dataset(dataset)
+        _datasets_metadata.put(dataset_id, dataset)
         logger.info(f"Dataset {dataset_name} created.")
     except Exception as e:
         logger.info(f"Error creating the dataset: {e}")
 
 
 def create_table(
-    table_name: str, dataset_name: str, project_id: str, schema: dict
+    table_name: str,
+    dataset_name: str,
+    project_id: str,
+    schema: dict | list[bigquery.SchemaField],
+    partition_field: Optional[str] = None,
+    partition_expiration_days: Optional[int] = None,
+    clustering_fields: Optional[list[str]] = None,
 ) -> None:
     """
     Create a new table in a dataset in BigQuery.
@@ -112,7 +300,7 @@ def create_table(
         table_name (str): The name of the table to create.
         dataset_name (str): The name of the dataset where the table will be created.
         project_id (str): The project ID where the dataset is located.
-        schema (dict): The schema of the table to create.
+        schema (dict | list[bigquery.SchemaField]): The schema of the table to create.
 
                 The keys are the column names and the values are the data types. Ex:
                 {
@@ -124,6 +312,15 @@ def create_table(
                 To see all the data types, see:
                 https://cloud.google.com/bigquery/docs/reference/standard-sql/data-types
 
+                A list of SchemaField can be passed instead, to set the mode
+                (Ex: REQUIRED) of the columns.
+        partition_field (Optional[str]): DATE or TIMESTAMP column used to partition the
+                table by day. Ex: "created_at". If None, the table is not partitioned.
+        partition_expiration_days (Optional[int]): Days that each partition is kept,
+                only used if the table is partitioned. None to keep the data forever.
+        clustering_fields (Optional[list[str]]): Up to four columns used to cluster
+                the table, in order of importance. Ex: ["chat_session_id"]
+
     Returns:
         None
     """
@@ -133,20 +330,46 @@ def create_table(
             f"Table {table_name} already exists in dataset {dataset_name}."
         )
 
+    if clustering_fields is not None and not 0 < len(clustering_fields) <= 4:
+        raise ValueError("clustering_fields must have between 1 and 4 columns.")
+
     table_id = f"{project_id}.{dataset_name}.{table_name}"
 
-    schema = [
-        bigquery.SchemaField(column_name, datatype)
-        for column_name, datatype in schema.items()
-    ]
+    if isinstance(schema, dict):
+        schema = [
+            bigquery.SchemaField(column_name, datatype)
+            for column_name, datatype in schema.items()
+        ]
 
     table = bigquery.Table(table_id, schema=schema)
 
+    if partition_field is not None:
+        table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field=partition_field,
+            expiration_ms=(
+                partition_expiration_days * 24 * 60 * 60 * 1000
+                if partition_expiration_days is not None
+                else None
+            ),
+        )
+
+    if clustering_fields is not None:
+        table.clustering_fields = clustering_fields
+
     try:
-        client.create_table(table)
-        logger.info(f"Table {table_name} created.")
+        table = client.create_table(table)
+    except Conflict:
+        # Created by someone else after the existence check
+        logger.info(f"Table {table_name} already exists in dataset {dataset_name}.")
+        return
     except Exception as e:
-        logger.info(f"Error creating the table: {e}")
+        # e.g. the partition field or a clustering field is not a column of the schema
+        logger.error(f"Error creating the table {table_name}: {e}")
+        raise
+
+    _tables_metadata.put(table_id, table)
+    logger.info(f"Table {table_name} created.")
 
 
 def delete_dataset(dataset_name: str, project_id: str) -> None:
@@ -170,6 +393,7 @@ def delete_dataset(dataset_name: str, project_id: str) -> None:
 
     try:
         client.delete_dataset(dataset_id, delete_contents=True)
+        invalidate_metadata(dataset_name, project_id)
         logger.info(f"Dataset {dataset_name} deleted.")
     except Exception as e:
         raise ValueError(f"Error deleting the dataset: {e}")
@@ -197,35 +421,246 @@ def delete_table(table_name: str, dataset_name: str, project_id: str) -> None:
 
     try:
         client.delete_table(table_id)
+        invalidate_metadata(dataset_name, project_id, table_name)
         logger.info(f"Table {table_name} deleted.")
     except Exception as e:
         raise ValueError(f"Error deleting the table: {e}")
 
 
-def query_data(query: str) -> list:
+def _parameter_type(value: Any) -> str:
+    """
+    Infer the BigQuery type of a query parameter from its Python value
     """
-    Query data from a table in BigQuery.
+    # bool must be checked before int, because bool is a subclass of int
+    if isinstance(value, bool):
+        return "BOOL"
+    if isinstance(value, int):
+        return "INT64"
+    if isinstance(value, float):
+        return "FLOAT64"
+    if isinstance(value, Decimal):
+        return "NUMERIC"
+    # datetime must be checked before date, because datetime is a subclass of date
+    if isinstance(value, datetime):
+        return "TIMESTAMP" if value.tzinfo is not None else "DATETIME"
+    if isinstance(value, date):
+        return "DATE"
+    if isinstance(value, bytes):
+        return "BYTES"
+    if isinstance(value, str):
+        return "STRING"
+
+    raise ValueError(
+        f"Cannot infer the BigQuery type of {value!r}, pass a ScalarQueryParameter instead."
+    )
+
+
+def build_query_parameters(parameters: dict[str, Any]) -> list:
+    """
+    Build the BigQuery query parameters of a query. The type of each parameter
+    is inferred from its value, lists become array parameters.
 
     Args:
-        query (str): The SQL query to execute.
+        parameters (dict[str, Any]): Name of the parameter (without @) -> value. The values
+                    can also be ScalarQueryParameter or ArrayQueryParameter instances.
 
     Returns:
-        list: A list of rows returned by the query.
+        list: Query parameters to use in a QueryJobConfig.
+    """
+    query_parameters = list()
+
+    for name, value in parameters.items():
+        if isinstance(
+            value, (bigquery.ScalarQueryParameter, bigquery.ArrayQueryParameter)
+        ):
+            query_parameters.append(value)
+
+        elif isinstance(value, (list, tuple)):
+            if len(value) == 0:
+                raise ValueError(
+                    f"Cannot infer the type of the empty list {name}, "
+                    "pass an ArrayQueryParameter instead."
+                )
+            query_parameters.append(
+                bigquery.ArrayQueryParameter(name, _parameter_type(value[0]), value)
+            )
+
+        else:
+            query_parameters.append(
+                bigquery.ScalarQueryParameter(name, _parameter_type(value), value)
+            )
+
+    return query_parameters
+
+
+# Cost of the last queries executed, to find the job of an expensive query
+_recent_query_costs: deque[dict] = deque(maxlen=cost_config.BQ_RECENT_QUERIES)
+
+
+def _record_query_cost(
+    operation: str,
+    path: str,
+    seconds: float,
+    job_id: Optional[str],
+    bytes_processed: Optional[int],
+    bytes_billed: Optional[int] = None,
+    slot_millis: Optional[int] = None,
+    cache_hit: Optional[bool] = None,
+) -> None:
+    """
+    Record the cost of a query in the metrics registry, labelled by the operation
+    that ran it (Ex: BQUsersTable.email_in_table)
+    """
+    labels = {"operation": operation}
+
+    metrics.observe("bq_query_seconds", seconds, labels=labels)
+    metrics.increment("bq_queries", labels=labels)
+    metrics.increment("bq_bytes_processed", bytes_processed or 0, labels=labels)
+    metrics.increment("bq_bytes_billed", bytes_billed or 0, labels=labels)
+    metrics.increment("bq_slot_millis", slot_millis or 0, labels=labels)
+    if cache_hit:
+        metrics.increment("bq_cache_hits", labels=labels)
+
+    _recent_query_costs.append(
+        {
+            "operation": operation,
+            "path": path,
+            "job_id": job_id,
+            "seconds": seconds,
+            "bytes_processed": bytes_processed,
+            "bytes_billed": bytes_billed,
+            "slot_millis": slot_millis,
+            "cache_hit": cache_hit,
+        }
+    )
+
+
+def get_recent_query_costs() -> list[dict]:
+    """
+    Get the cost of the last queries executed by the process
+
+    Returns:
+        list[dict]: From the oldest to the newest, the operation, job id, wall time,
+                    bytes processed and billed, slot milliseconds and cache hit of each query
+    """
+    return list(_recent_query_costs)
+
+
+def estimate_query_bytes(
+    query: str, job_config: Optional[bigquery.QueryJobConfig]
+) -> int:
+    """
+    Estimate the bytes that a query would process with a dry run, which is not billed
+
+    Args:
+        query (str): The SQL query.
+        job_config (Optional[bigquery.QueryJobConfig]): Configuration of the query (Ex: parameters).
+
+    Returns:
+        int: Bytes that the query would process.
+    """
+    dry_run_config = bigquery.QueryJobConfig(
+        dry_run=True,
+        use_query_cache=False,
+        query_parameters=job_config.query_parameters if job_config else [],
+    )
+
+    return client.query(query, job_config=dry_run_config).total_bytes_processed or 0
+
+
+def query_data(
+    query: str,
+    parameters: Optional[dict[str, Any]] = None,
+    short_query: bool = False,
+    operation: Optional[str] = None,
+) -> bigquery.table.RowIterator:
+    """
+    Query data from a table in BigQuery. The wall time and the bytes processed and billed
+    by the query are recorded in the metrics registry under the operation provided.
+
+    Args:
+        query (str): The SQL query to execute, the parameters are referenced as @name.
+        parameters (Optional[dict[str, Any]]): Values of the query parameters, see
+                    build_query_parameters.
+        short_query (bool): Run the query with query_and_wait, which returns the rows
+                    in the same request when the query finishes quickly, instead of
+                    creating a job and polling it. Use it for point lookups, the large
+                    scans should create a full job. Ignored if BQ_SHORT_QUERIES_ENABLED
+                    is False.
+        operation (Optional[str]): Name used to label the cost of the query.
+                    Ex: BQUsersTable.email_in_table
+
+    Returns:
+        RowIterator: The rows returned by the query.
     """
     if not isinstance(query, str) or query == "":
         raise ValueError("The query must be a non-empty string.")
 
+    operation = operation or "unlabeled"
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=build_query_parameters(parameters) if parameters else [],
+        maximum_bytes_billed=cost_config.BQ_MAXIMUM_BYTES_BILLED,
+    )
+
+    if cost_config.BQ_DRY_RUN_GUARD_ENABLED:
+        estimated_bytes = estimate_query_bytes(query, job_config)
+        if estimated_bytes > cost_config.BQ_DRY_RUN_MAX_BYTES:
+            metrics.increment("bq_queries_rejected", labels={"operation": operation})
+            raise ValueError(
+                f"The query {operation} would process {estimated_bytes} bytes, "
+                f"more than the budget of {cost_config.BQ_DRY_RUN_MAX_BYTES} bytes."
+            )
+
+    short_query = short_query and query_config.BQ_SHORT_QUERIES_ENABLED
+    path = "short" if short_query else "job"
+    query_job = None
+
+    start = time.perf_counter()
     try:
-        query_job = client.query(query)
-        results = query_job.result()
-        return results
+        if short_query:
+            results = client.query_and_wait(query, job_config=job_config)
+        else:
+            query_job = client.query(query, job_config=job_config)
+            results = query_job.result()
 
     except Exception as e:
+        metrics.increment("bq_query_errors", labels={"operation": operation})
         raise ValueError(f"Error querying the data: {e}")
 
+    finally:
+        # Latency of each path, to compare the short queries with the full jobs
+        metrics.observe(
+            "bq_query_path_seconds",
+            time.perf_counter() - start,
+            labels={"path": path},
+        )
+
+    if short_query and results.job_id is None:
+        metrics.increment("bq_queries_without_job")
+
+    # The short queries only return the bytes processed, the rest of the
+    # statistics are only available in the job
+    _record_query_cost(
+        operation=operation,
+        path=path,
+        seconds=time.perf_counter() - start,
+        job_id=results.job_id,
+        bytes_processed=results.total_bytes_processed,
+        bytes_billed=query_job.total_bytes_billed if query_job else None,
+        slot_millis=query_job.slot_millis if query_job else None,
+        cache_hit=query_job.cache_hit if query_job else None,
+    )
+
+    return results
+
 
 def insert_rows(
-    table_name: str, dataset_name: str, project_id: str, rows: list[dict]
+    table_name: str,
+    dataset_name: str,
+    project_id: str,
+    rows: list[dict],
+    validate: bool = metadata_config.BQ_VALIDATE_ROWS,
 ) -> None:
     """
     Insert rows into a table in BigQuery.
@@ -250,6 +685,8 @@ def insert_rows(
                             "column_name4": "2023-10-02T00:00:00Z"
                         }
                     ]
+        validate (bool): Validate the rows against the cached schema of the table before
+                    sending them.
 
     Returns:
         None
@@ -260,16 +697,50 @@ def insert_rows(
             f"Table {table_name} does not exist in dataset {dataset_name}."
         )
 
+    if validate:
+        schema = get_table_schema(table_name, dataset_name, project_id)
+        validation_errors = validate_rows(rows, schema)
+        if validation_errors:
+            raise ValueError(
+                f"The rows do not match the schema of {table_name}: {validation_errors}"
+            )
+
     table_id = f"{project_id}.{dataset_name}.{table_name}"
 
+    start = time.perf_counter()
     try:
-        errors = client.insert_rows_json(table_id, rows)
+        try:
+            errors = client.insert_rows_json(table_id, rows)
+        except NotFound:
+            # The cached metadata is stale (Ex: the table was recreated), refresh it
+            # and try again only if the table still exists
+            logger.warning(f"Table {table_id} not found, refreshing its metadata...")
+            if (
+                get_table_metadata(table_name, dataset_name, project_id, refresh=True)
+                is None
+            ):
+                raise ValueError(
+                    f"Table {table_name} does not exist in dataset {dataset_name}."
+                )
+            errors = client.insert_rows_json(table_id, rows)
+
         if errors:
             raise ValueError(f"Errors occurred while inserting rows: {errors}")
         logger.info(f"Rows inserted into {table_name}.")
     except Exception as e:
+        metrics.increment("bq_insert_errors", labels={"table": table_name})
         raise ValueError(f"Error inserting rows: {e}")
 
+    # The streaming inserts are billed by size, with a minimum of 1KB per row
+    labels = {"table": table_name}
+    metrics.observe("bq_insert_seconds", time.perf_counter() - start, labels=labels)
+    metrics.increment("bq_inserted_rows", len(rows), labels=labels)
+    metrics.increment(
+        "bq_inserted_billed_bytes",
+        sum([max(len(json.dumps(row, default=str)), 1024) for row in rows]),
+        labels=labels,
+    )
+
 
 def update_row(
     table_name: str,
@@ -288,13 +759,15 @@ def update_row(
         project_id (str): The project ID where the dataset is located.
         primary_key_column_name (str): The name of the primary key column in the table.
         row_id (str): The ID of the row to update.
-        update_data (dict): A dictionary representing the data to update. Ex:
+        update_data (dict): A dictionary representing the data to update. The values are
+                    bound as query parameters, so their Python type must match the column
+                    (Ex: a datetime for a TIMESTAMP column). Ex:
 
                     {
                         "column_name": "new_value",
                         "column_name2": 123,
                         "column_name3": 123.45,
-                        "column_name4": "2023-10-01T00:00:00Z"
+                        "column_name4": datetime(2023, 10, 1, tzinfo=timezone.utc)
                     }
 
     Returns:
@@ -309,12 +782,130 @@ def update_row(
     table_id = f"{project_id}.{dataset_name}.{table_name}"
 
     try:
+        # Only the column names are part of the SQL, the values are query parameters
         query = f"""
             UPDATE `{table_id}`
-            SET {", ".join([f"{key} = '{value}'" for key, value in update_data.items()])}
-            WHERE {primary_key_column_name} = '{row_id}'
+            SET {", ".join([f"{key} = @value_{key}" for key in update_data.keys()])}
+            WHERE {primary_key_column_name} = @row_id
         """
-        client.query(query).result()
+        parameters = {f"value_{key}": value for key, value in update_data.items()}
+        parameters["row_id"] = row_id
+
+        query_data(query, parameters, operation="update_row")
         logger.info(f"Row with ID {row_id} updated in {table_name}.")
     except Exception as e:
         raise ValueError(f"Error updating row: {e}")
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_bigquery_executor() -> ThreadPoolExecutor:
+    """
+    Get the thread pool dedicated to the BigQuery calls. Its size limits the number
+    of BigQuery calls that run at the same time.
+
+    Returns:
+        ThreadPoolExecutor -> Thread pool shared by the whole process
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=executor_config.BQ_EXECUTOR_MAX_WORKERS,
+                thread_name_prefix="bigquery",
+            )
+
+    return _executor
+
+
+def shutdown_bigquery_executor() -> None:
+    """
+    Wait for the running BigQuery calls and stop the thread pool
+    """
+    global _executor
+
+    with _executor_lock:
+        executor = _executor
+        _executor = None
+
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+async def run_in_bigquery_executor(
+    function: Callable, *args, operation: Optional[str] = None, **kwargs
+) -> Any:
+    """
+    Run a blocking function in the BigQuery thread pool without blocking the event loop.
+    The time waiting for a free thread and the time running are recorded in the metrics.
+
+    Args:
+        function: Callable -> Blocking function to execute
+        operation: Optional[str] -> Name used to label the metrics, the function name by default
+        *args, **kwargs -> Arguments of the function
+
+    Returns:
+        Any -> Result of the function
+    """
+    operation = operation or function.__name__
+    labels = {"operation": operation}
+    submitted_at = time.perf_counter()
+
+    def timed_call():
+        started_at = time.perf_counter()
+        metrics.observe("bq_call_wait_seconds", started_at - submitted_at, labels)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.observe("bq_call_seconds", time.perf_counter() - started_at, labels)
+
+    metrics.increment("bq_calls", labels=labels)
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(get_bigquery_executor(), timed_call)
+
+
+async def async_query_data(
+    query: str,
+    parameters: Optional[dict[str, Any]] = None,
+    short_query: bool = False,
+    operation: Optional[str] = None,
+) -> list:
+    """
+    Async version of query_data. The rows are fetched inside the thread pool,
+    so iterating them does not make network calls from the event loop.
+
+    Args:
+        query (str): The SQL query to execute.
+        parameters (Optional[dict[str, Any]]): Values of the query parameters.
+        short_query (bool): Run the query with query_and_wait.
+        operation (Optional[str]): Name used to label the cost of the query.
+
+    Returns:
+        list: A list of rows returned by the query.
+    """
+    return await run_in_bigquery_executor(
+        lambda: list(query_data(query, parameters, short_query, operation)),
+        operation="query_data",
+    )
+
+
+async def async_insert_rows(
+    table_name: str, dataset_name: str, project_id: str, rows: list[dict]
+) -> None:
+    """
+    Async version of insert_rows, see insert_rows for the description of the parameters
+    """
+    await run_in_bigquery_executor(
+        functools.partial(
+            insert_rows,
+            table_name=table_name,
+            dataset_name=dataset_name,
+            project_id=project_id,
+            rows=rows,
+        ),
+        operation="insert_rows",
+    )
@@ -0,0 +1,566 @@
+from assistant_agent.utils.gcp.bigquery import insert_rows
+from assistant_agent.utils.gcp.gcs import upload_file_from_memory
+from assistant_agent.utils.metrics import metrics
+from assistant_agent.config import BQWriteBufferConfig, GCPConfig
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from loguru import logger
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+
+buffer_config = BQWriteBufferConfig()
+gcp_config = GCPConfig()
+
+
+def write_dead_letter(
+    table_name: str, dataset_name: str, project_id: str, rows: list[dict]
+) -> str:
+    """
+    Store rows that could not be inserted into BigQuery in a GCS object, one JSON row
+    per line, so they can be loaded later. Ex:
+    bq load --source_format=NEWLINE_DELIMITED_JSON <dataset>.<table> gs://<bucket>/<blob_name>
+
+    Args:
+        table_name: str -> Name of the table where the rows had to be inserted
+        dataset_name: str -> Name of the dataset of the table
+        project_id: str -> Project of the dataset
+        rows: list[dict] -> Rows that were not inserted
+
+    Returns:
+        str -> Name of the object in BUCKET_NAME
+    """
+    timestamp = datetime.now(timezone.utc).strftime(r"%Y%m%dT%H%M%S")
+    blob_name = (
+        f"{buffer_config.BQ_WRITE_BUFFER_DEAD_LETTER_PATH}/"
+        f"{project_id}.{dataset_name}.{table_name}/{timestamp}-{uuid.uuid4().hex}.jsonl"
+    )
+
+    upload_file_from_memory(
+        blob_name,
+        "\n".join(json.dumps(row, default=str) for row in rows),
+        gcp_config.BUCKET_NAME,
+    )
+
+    return blob_name
+
+
+class _TableBatch:
+    """
+    Rows waiting to be inserted into a single table
+    """
+
+    def __init__(self):
+        self.rows: list[dict] = list()
+        self.row_sizes: list[int] = list()
+        self.total_bytes: int = 0
+        self.first_enqueued_at: Optional[float] = None
+
+    def add(self, rows: list[dict], row_sizes: list[int]) -> None:
+        if self.first_enqueued_at is None:
+            self.first_enqueued_at = time.monotonic()
+        self.rows.extend(rows)
+        self.row_sizes.extend(row_sizes)
+        self.total_bytes += sum(row_sizes)
+
+
+class BigQueryWriteBuffer:
+    """
+    Write-behind buffer for BigQuery streaming inserts.
+
+    The rows submitted by concurrent requests are coalesced per table and inserted
+    by a background thread as a single insert_rows call when the batch of a table
+    reaches a number of rows, a number of bytes or a maximum age, whichever happens first.
+
+    The buffer is bounded, when it is full, submit() blocks the caller until the
+    flusher frees some space (backpressure). Rows that are waiting or being flushed
+    can be read through pending_rows() so readers can see their own writes.
+
+    The rows that cannot be inserted after the retries are written to the dead letter
+    (see write_dead_letter), and close() reports that the buffer did not shut down cleanly.
+    """
+
+    def __init__(
+        self,
+        max_batch_rows: int = buffer_config.BQ_WRITE_BUFFER_MAX_BATCH_ROWS,
+        max_batch_bytes: int = buffer_config.BQ_WRITE_BUFFER_MAX_BATCH_BYTES,
+        max_batch_age_seconds: float = buffer_config.BQ_WRITE_BUFFER_MAX_BATCH_AGE_SECONDS,
+        max_queued_rows: int = buffer_config.BQ_WRITE_BUFFER_MAX_QUEUED_ROWS,
+        enqueue_timeout_seconds: float = buffer_config.BQ_WRITE_BUFFER_ENQUEUE_TIMEOUT_SECONDS,
+        flush_retries: int = buffer_config.BQ_WRITE_BUFFER_FLUSH_RETRIES,
+        insert_function: Callable = insert_rows,
+        dead_letter_function: Optional[Callable] = (
+            write_dead_letter
+            if buffer_config.BQ_WRITE_BUFFER_DEAD_LETTER_PATH is not None
+            else None
+        ),
+    ):
+        parameters = {
+            "max_batch_rows": max_batch_rows,
+            "max_batch_bytes": max_batch_bytes,
+            "max_batch_age_seconds": max_batch_age_seconds,
+            "max_queued_rows": max_queued_rows,
+        }
+        if not all([param > 0 for param in parameters.values()]):
+            raise ValueError(
+                f"The parameters {', '.join(parameters.keys())} must be greater than 0"
+            )
+
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_age_seconds = max_batch_age_seconds
+        self.max_queued_rows = max_queued_rows
+        self.enqueue_timeout_seconds = enqueue_timeout_seconds
+        self.flush_retries = flush_retries
+        self._insert_function = insert_function
+        self._dead_letter_function = dead_letter_function
+
+        self._condition = threading.Condition()
+        # (project_id, dataset_name, table_name) -> rows waiting to be flushed
+        self._batches: dict[tuple[str, str, str], _TableBatch] = dict()
+        # (project_id, dataset_name, table_name) -> rows currently being inserted
+        self._in_flight: dict[tuple[str, str, str], list[dict]] = dict()
+        self._queued_rows: int = 0
+        self._force_flush: bool = False
+        self._closed: bool = False
+        self._thread: Optional[threading.Thread] = None
+        # Rows that could not be inserted, written to the dead letter or lost
+        self._dead_letter_rows: int = 0
+        self._lost_rows: int = 0
+
+    @property
+    def queued_rows(self) -> int:
+        return self._queued_rows
+
+    @property
+    def failed_rows(self) -> int:
+        return self._dead_letter_rows + self._lost_rows
+
+    def start(self) -> None:
+        """
+        Start the background thread that flushes the batches
+        """
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._closed = False
+            self._thread = threading.Thread(
+                target=self._run, name="bq-write-buffer", daemon=True
+            )
+            self._thread.start()
+        logger.info("BigQuery write buffer started")
+
+    def submit(
+        self, table_name: str, dataset_name: str, project_id: str, rows: list[dict]
+    ) -> None:
+        """
+        Add rows to the buffer, they will be inserted into BigQuery by the flusher.
+        If the buffer is full, waits until there is enough space or until the
+        enqueue timeout is reached.
+
+        Args:
+            table_name: str -> Name of the table where the rows will be inserted
+            dataset_name: str -> Name of the dataset where the table is located
+            project_id: str -> The project ID where the dataset is located
+            rows: list[dict] -> Rows to insert, same format as insert_rows
+
+        Returns:
+            None
+        """
+        if not isinstance(rows, list) or not all(
+            [isinstance(row, dict) for row in rows]
+        ):
+            raise ValueError("rows must be a list of dictionaries")
+
+        if len(rows) == 0:
+            return
+
+        if len(rows) > self.max_queued_rows:
+            raise ValueError(
+                f"Cannot buffer {len(rows)} rows, the buffer capacity is {self.max_queued_rows} rows"
+            )
+
+        # Size of each row once serialized, used to limit the size of the requests
+        row_sizes = [len(json.dumps(row, default=str)) for row in rows]
+
+        table_key = (project_id, dataset_name, table_name)
+
+        with self._condition:
+            if self._closed:
+                raise ValueError("The BigQuery write buffer is closed")
+
+            wait_start = time.perf_counter()
+            has_space = self._condition.wait_for(
+                lambda: self._closed
+                or self._queued_rows + len(rows) <= self.max_queued_rows,
+                timeout=self.enqueue_timeout_seconds,
+            )
+            waited = time.perf_counter() - wait_start
+
+            if waited > 0.001:
+                metrics.observe("bq_write_buffer_backpressure_wait_seconds", waited)
+
+            if self._closed:
+                raise ValueError("The BigQuery write buffer is closed")
+
+            if not has_space:
+                metrics.increment("bq_write_buffer_rejected_rows", len(rows))
+                raise ValueError(
+                    "The BigQuery write buffer is full, the rows could not be queued"
+                )
+
+            batch = self._batches.setdefault(table_key, _TableBatch())
+            batch.add(rows, row_sizes)
+            self._queued_rows += len(rows)
+
+            metrics.increment(
+                "bq_write_buffer_enqueued_rows", len(rows), {"table": table_name}
+            )
+            metrics.set_gauge("bq_write_buffer_queued_rows", self._queued_rows)
+
+            self._condition.notify_all()
+
+    async def submit_async(
+        self, table_name: str, dataset_name: str, project_id: str, rows: list[dict]
+    ) -> None:
+        """
+        Same as submit, but the wait caused by the backpressure does not block the event loop
+        """
+        await asyncio.to_thread(self.submit, table_name, dataset_name, project_id, rows)
+
+    def pending_rows(
+        self, table_name: str, dataset_name: str, project_id: str
+    ) -> list[dict]:
+        """
+        Get the rows of a table that were submitted but may not be visible in BigQuery yet
+
+        Args:
+            table_name: str -> Name of the table
+            dataset_name: str -> Name of the dataset where the table is located
+            project_id: str -> The project ID where the dataset is located
+
+        Returns:
+            list[dict] -> Copy of the rows waiting or being inserted
+        """
+        table_key = (project_id, dataset_name, table_name)
+
+        with self._condition:
+            rows = list(self._in_flight.get(table_key, []))
+            batch = self._batches.get(table_key)
+            if batch is not None:
+                rows.extend(batch.rows)
+
+        return rows
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ask the flusher to insert all the buffered rows and wait until it is done
+
+        Args:
+            timeout: Optional[float] -> Maximum seconds to wait
+
+        Returns:
+            bool -> True if all the rows were flushed before the timeout
+        """
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                # Nobody is running the flusher, flush from the current thread
+                self._force_flush = True
+                batches = self._take_ready_batches()
+            else:
+                self._force_flush = True
+                self._condition.notify_all()
+                return self._condition.wait_for(
+                    lambda: self._queued_rows == 0, timeout=timeout
+                )
+
+        self._flush_batches(batches)
+
+        return True
+
+    def close(
+        self,
+        timeout: Optional[
+            float
+        ] = buffer_config.BQ_WRITE_BUFFER_SHUTDOWN_TIMEOUT_SECONDS,
+    ) -> bool:
+        """
+        Stop accepting rows, flush everything that is still buffered and stop the flusher
+
+        Args:
+            timeout: Optional[float] -> Maximum seconds to wait for the last flush
+
+        Returns:
+            bool -> True if every row submitted was inserted into BigQuery. False if
+                    the last flush timed out or some rows were not inserted
+        """
+        logger.info("Closing the BigQuery write buffer...")
+        with self._condition:
+            self._closed = True
+            self._force_flush = True
+            self._condition.notify_all()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join(timeout=timeout)
+            if thread.is_alive():
+                logger.error(
+                    f"The BigQuery write buffer could not flush {self._queued_rows} rows before the timeout"
+                )
+                return False
+        else:
+            self.flush()
+
+        if self.failed_rows:
+            logger.error(
+                f"BigQuery write buffer closed, {self.failed_rows} rows were not inserted: "
+                f"{self._dead_letter_rows} are in the dead letter and {self._lost_rows} were lost"
+            )
+            return False
+
+        logger.info("BigQuery write buffer closed")
+
+        return True
+
+    def _seconds_to_next_deadline(self) -> Optional[float]:
+        """
+        Seconds until the oldest batch reaches its maximum age, must be called with the lock acquired
+        """
+        first_enqueued = [
+            batch.first_enqueued_at
+            for batch in self._batches.values()
+            if batch.first_enqueued_at is not None
+        ]
+        if not first_enqueued:
+            return None
+
+        deadline = min(first_enqueued) + self.max_batch_age_seconds
+
+        return max(deadline - time.monotonic(), 0)
+
+    def _batch_is_ready(self, batch: _TableBatch) -> bool:
+        if self._force_flush:
+            return True
+        if len(batch.rows) >= self.max_batch_rows:
+            return True
+        if batch.total_bytes >= self.max_batch_bytes:
+            return True
+        return time.monotonic() - batch.first_enqueued_at >= self.max_batch_age_seconds
+
+    def _take_ready_batches(self) -> dict[tuple[str, str, str], _TableBatch]:
+        """
+        Move the batches that must be flushed to the in-flight state, must be called
+        with the lock acquired
+        """
+        ready_batches = {
+            table_key: batch
+            for table_key, batch in self._batches.items()
+            if batch.rows and self._batch_is_ready(batch)
+        }
+
+        for table_key, batch in ready_batches.items():
+            del self._batches[table_key]
+            self._in_flight.setdefault(table_key, []).extend(batch.rows)
+
+        if not self._batches:
+            self._force_flush = False
+
+        return ready_batches
+
+    def _split_batch(self, batch: _TableBatch) -> list[list[dict]]:
+        """
+        Split a batch into chunks that respect the limits of rows and bytes per request
+        """
+        chunks = list()
+        chunk = list()
+        chunk_bytes = 0
+
+        for row, row_size in zip(batch.rows, batch.row_sizes):
+            if chunk and (
+                len(chunk) >= self.max_batch_rows
+                or chunk_bytes + row_size > self.max_batch_bytes
+            ):
+                chunks.append(chunk)
+                chunk = list()
+                chunk_bytes = 0
+
+            chunk.append(row)
+            chunk_bytes += row_size
+
+        if chunk:
+            chunks.append(chunk)
+
+        return chunks
+
+    def _insert_chunk(self, table_key: tuple[str, str, str], rows: list[dict]) -> None:
+        """
+        Insert a chunk of rows, retrying with exponential backoff if it fails
+        """
+        project_id, dataset_name, table_name = table_key
+
+        for attempt in range(1, self.flush_retries + 2):
+            start = time.perf_counter()
+            try:
+                self._insert_function(
+                    table_name=table_name,
+                    dataset_name=dataset_name,
+                    project_id=project_id,
+                    rows=rows,
+                )
+                metrics.observe(
+                    "bq_write_buffer_flush_seconds",
+                    time.perf_counter() - start,
+                    {"table": table_name},
+                )
+                metrics.increment(
+                    "bq_write_buffer_flushed_rows", len(rows), {"table": table_name}
+                )
+                metrics.increment(
+                    "bq_write_buffer_flushes", labels={"table": table_name}
+                )
+                return
+
+            except Exception as e:
+                metrics.increment(
+                    "bq_write_buffer_flush_errors", labels={"table": table_name}
+                )
+                if attempt > self.flush_retries:
+                    metrics.increment(
+                        "bq_write_buffer_dropped_rows",
+                        len(rows),
+                        {"table": table_name},
+                    )
+                    logger.error(
+                        f"{len(rows)} rows could not be inserted into {table_name} "
+                        f"after {attempt} attempts: {e}"
+                    )
+                    self._write_dead_letter(table_key, rows)
+                    return
+
+                logger.warning(
+                    f"Error flushing rows into {table_name} (attempt {attempt}): {e}"
+                )
+                time.sleep(min(0.5 * 2 ** (attempt - 1), 5))
+
+    def _write_dead_letter(
+        self, table_key: tuple[str, str, str], rows: list[dict]
+    ) -> None:
+        """
+        Keep the rows that could not be inserted where they can be recovered
+        """
+        project_id, dataset_name, table_name = table_key
+
+        if self._dead_letter_function is not None:
+            try:
+                location = self._dead_letter_function(
+                    table_name=table_name,
+                    dataset_name=dataset_name,
+                    project_id=project_id,
+                    rows=rows,
+                )
+                self._dead_letter_rows += len(rows)
+                metrics.increment(
+                    "bq_write_buffer_dead_letter_rows", len(rows), {"table": table_name}
+                )
+                logger.error(f"{len(rows)} rows of {table_name} written to {location}")
+                return
+
+            except Exception as e:
+                logger.error(f"Error writing the dead letter of {table_name}: {e}")
+
+        self._lost_rows += len(rows)
+        metrics.increment("bq_write_buffer_lost_rows", len(rows), {"table": table_name})
+        # Last resort, the rows stay in the logs
+        logger.error(
+            f"{len(rows)} rows of {table_name} lost: {json.dumps(rows, default=str)}"
+        )
+
+    def _flush_batches(self, batches: dict[tuple[str, str, str], _TableBatch]) -> None:
+        """
+        Insert the batches and release their space in the buffer
+        """
+        for table_key, batch in batches.items():
+            try:
+                for chunk in self._split_batch(batch):
+                    self._insert_chunk(table_key, chunk)
+            finally:
+                with self._condition:
+                    self._in_flight.pop(table_key, None)
+                    self._queued_rows -= len(batch.rows)
+                    metrics.set_gauge("bq_write_buffer_queued_rows", self._queued_rows)
+                    self._condition.notify_all()
+
+    def _run(self) -> None:
+        """
+        Main loop of the flusher thread
+        """
+        while True:
+            with self._condition:
+                while True:
+                    batches = self._take_ready_batches()
+                    if batches:
+                        break
+                    if self._closed and not self._batches:
+                        return
+                    self._condition.wait(timeout=self._seconds_to_next_deadline())
+
+            self._flush_batches(batches)
+
+
+_write_buffer: Optional[BigQueryWriteBuffer] = None
+_write_buffer_lock = threading.Lock()
+
+
+def get_write_buffer() -> BigQueryWriteBuffer:
+    """
+    Get the write buffer shared by the whole process, it is started the first time it is requested
+
+    Returns:
+        BigQueryWriteBuffer -> Running write buffer
+    """
+    global _write_buffer
+
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            _write_buffer = BigQueryWriteBuffer()
+            _write_buffer.start()
+
+    return _write_buffer
+
+
+def is_buffered_table(table_name: str) -> bool:
+    """
+    Tells if the inserts of a table go through the write buffer
+
+    Args:
+        table_name: str -> Name of the table
+
+    Returns:
+        bool -> True if the rows of the table are buffered
+    """
+    return (
+        buffer_config.BQ_WRITE_BUFFER_ENABLED
+        and table_name in buffer_config.BQ_WRITE_BUFFER_TABLES
+    )
+
+
+def shutdown_write_buffer() -> bool:
+    """
+    Flush and stop the shared write buffer, if it was started
+
+    Returns:
+        bool -> False if some rows submitted were not inserted into BigQuery
+    """
+    global _write_buffer
+
+    with _write_buffer_lock:
+        write_buffer = _write_buffer
+        _write_buffer = None
+
+    if write_buffer is None:
+        return True
+
+    return write_buffer.close()
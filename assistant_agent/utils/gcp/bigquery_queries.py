@@ -0,0 +1,169 @@
+from assistant_agent.utils.gcp.bigquery import query_data
+from google.cloud.bigquery.table import RowIterator
+from typing import Any, Optional
+import threading
+import time
+
+
+class NamedQuery:
+    """
+    SQL template registered in the query engine. The values are never formatted
+    into the SQL, they are passed as query parameters (@name) on each run.
+    """
+
+    def __init__(self, name: str, sql: str, short_query: bool = False):
+        self.name = name
+        self.sql = sql
+        self.short_query = short_query
+
+
+class _QueryStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_bytes_processed = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_seconds": self.total_seconds,
+            "mean_seconds": self.total_seconds / self.calls if self.calls else None,
+            "max_seconds": self.max_seconds,
+            "total_bytes_processed": self.total_bytes_processed,
+        }
+
+
+class QueryEngine:
+    """
+    Registry of the named queries of the application. Each query is registered once
+    with its SQL and then executed by name, binding its parameters, so the SQL text
+    of equivalent lookups is always the same (and can be served from the BigQuery
+    result cache) and the timing and bytes processed are tracked per query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries: dict[str, NamedQuery] = dict()
+        self._stats: dict[str, _QueryStats] = dict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._queries
+
+    def register(self, name: str, sql: str, short_query: bool = False) -> NamedQuery:
+        """
+        Register a named query. Registering again the same name with the same SQL
+        does nothing.
+
+        Args:
+            name: str -> Name of the query. Ex: BQUsersTable.email_in_table
+            sql: str -> SQL of the query, the values are referenced as @parameter_name
+            short_query: bool -> Run the query with query_and_wait, recommended for
+                                 queries that return a few rows quickly
+
+        Returns:
+            NamedQuery -> Query registered
+        """
+        if not isinstance(sql, str) or sql.strip() == "":
+            raise ValueError("The query must be a non-empty string.")
+
+        with self._lock:
+            registered_query = self._queries.get(name)
+
+            if registered_query is not None:
+                if registered_query.sql != sql:
+                    raise ValueError(
+                        f"A different query is already registered as {name}"
+                    )
+                return registered_query
+
+            named_query = NamedQuery(name, sql, short_query)
+            self._queries[name] = named_query
+            self._stats[name] = _QueryStats()
+
+        return named_query
+
+    def get(self, name: str) -> NamedQuery:
+        """
+        Get a registered query
+
+        Args:
+            name: str -> Name of the query
+
+        Returns:
+            NamedQuery -> Query registered with that name
+        """
+        named_query = self._queries.get(name)
+
+        if named_query is None:
+            raise ValueError(f"The query {name} is not registered")
+
+        return named_query
+
+    def run(
+        self, name: str, short_query: Optional[bool] = None, **parameters: Any
+    ) -> RowIterator:
+        """
+        Run a registered query
+
+        Args:
+            name: str -> Name of the query
+            short_query: Optional[bool] -> Overrides the mode the query was registered with
+            **parameters: Any -> Values of the query parameters
+
+        Returns:
+            RowIterator -> Rows returned by the query
+        """
+        named_query = self.get(name)
+
+        if short_query is None:
+            short_query = named_query.short_query
+
+        start = time.perf_counter()
+        try:
+            rows_iterator = query_data(
+                named_query.sql, parameters, short_query, operation=name
+            )
+        except Exception:
+            self._record(name, time.perf_counter() - start, 0, error=True)
+            raise
+
+        self._record(
+            name,
+            time.perf_counter() - start,
+            rows_iterator.total_bytes_processed or 0,
+        )
+
+        return rows_iterator
+
+    def _record(
+        self, name: str, seconds: float, bytes_processed: int, error: bool = False
+    ) -> None:
+        with self._lock:
+            stats = self._stats[name]
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.total_bytes_processed += bytes_processed
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Get the statistics of each registered query
+
+        Returns:
+            dict[str, dict] -> Name of the query -> calls, errors, timings and bytes processed
+        """
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = _QueryStats()
+
+
+# Engine shared by all the tables of the process
+query_engine = QueryEngine()
@@ -0,0 +1,207 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from google.cloud import bigquery, secretmanager, storage
+from loguru import logger
+from typing import Any, Callable, Generic, Iterable, Optional, TypeVar
+import asyncio
+import threading
+import time
+from assistant_agent.utils.metrics import metrics
+
+T = TypeVar("T")
+
+
+class LazyClient(Generic[T]):
+    """
+    Client created the first time it is used, so importing a module does not
+    authenticate or call any API. The attributes of the client can be used directly
+    on this object: lazy_client.query(...) creates the client if needed and calls
+    client.query(...). Thread-safe, the client is created only once.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        """
+        Args:
+            name: str -> Name of the client, used in the logs and the metrics
+            factory: Callable[[], T] -> Creates the client
+        """
+        self._name = name
+        self._factory = factory
+        self._client: Optional[T] = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def created(self) -> bool:
+        return self._client is not None
+
+    def get(self) -> T:
+        """
+        Get the client, it is created by the first caller
+
+        Returns:
+            T -> The client
+        """
+        client = self._client
+        if client is not None:
+            return client
+
+        with self._lock:
+            # Another thread could have created it while this one was waiting
+            if self._client is None:
+                start = time.perf_counter()
+                self._client = self._factory()
+                seconds = time.perf_counter() - start
+                metrics.observe(
+                    "client_creation_seconds", seconds, {"client": self._name}
+                )
+                logger.info(f"{self._name} client created in {seconds:.2f} seconds")
+
+            return self._client
+
+    def reset(self) -> None:
+        """
+        Forget the client, the next use creates a new one
+        """
+        with self._lock:
+            self._client = None
+
+    def __getattr__(self, attribute: str) -> Any:
+        # Only called for the attributes that LazyClient does not have
+        if attribute.startswith("__"):
+            raise AttributeError(attribute)
+        return getattr(self.get(), attribute)
+
+
+class ClientRegistry:
+    """
+    Clients of the external services used by the process. They are created on first
+    use, or in parallel by prewarm() when the application starts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: dict[str, LazyClient] = dict()
+
+    def register(self, name: str, factory: Callable[[], T]) -> LazyClient[T]:
+        """
+        Register a client, replacing the previous one with the same name
+
+        Args:
+            name: str -> Name of the client
+            factory: Callable[[], T] -> Creates the client
+
+        Returns:
+            LazyClient[T] -> Client created on first use
+        """
+        lazy_client = LazyClient(name, factory)
+
+        with self._lock:
+            self._clients[name] = lazy_client
+
+        return lazy_client
+
+    def get(self, name: str) -> LazyClient:
+        """
+        Get a registered client
+
+        Args:
+            name: str -> Name of the client
+
+        Returns:
+            LazyClient -> The client, it may not be created yet
+        """
+        lazy_client = self._clients.get(name)
+
+        if lazy_client is None:
+            raise ValueError(f"The client {name} is not registered")
+
+        return lazy_client
+
+    def prewarm(
+        self, names: Optional[Iterable[str]] = None, timeout: Optional[float] = None
+    ) -> dict[str, Optional[str]]:
+        """
+        Create clients in parallel, each one in its own thread. A client that fails
+        or is not ready after timeout seconds is created on its first use instead
+
+        Args:
+            names: Optional[Iterable[str]] -> Clients to create, all the registered ones if not passed
+            timeout: Optional[float] -> Maximum seconds to wait, None to wait for all of them
+
+        Returns:
+            dict[str, Optional[str]] -> Name of each client -> None if it was created, or the error
+        """
+        if names is None:
+            with self._lock:
+                lazy_clients = list(self._clients.values())
+        else:
+            lazy_clients = [self.get(name) for name in names]
+
+        pending = [
+            lazy_client for lazy_client in lazy_clients if not lazy_client.created
+        ]
+        if not pending:
+            return {lazy_client.name: None for lazy_client in lazy_clients}
+
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(
+            max_workers=len(pending), thread_name_prefix="prewarm"
+        )
+        futures = {
+            executor.submit(lazy_client.get): lazy_client.name
+            for lazy_client in pending
+        }
+        done, not_done = wait(futures, timeout=timeout)
+        # The threads that are still creating a client are not waited for
+        executor.shutdown(wait=False)
+
+        results = {lazy_client.name: None for lazy_client in lazy_clients}
+        for future in done:
+            if future.exception() is not None:
+                results[futures[future]] = str(future.exception())
+        for future in not_done:
+            results[futures[future]] = "Timed out"
+
+        for name, error in results.items():
+            if error is not None:
+                logger.warning(f"The {name} client could not be prewarmed: {error}")
+
+        logger.info(
+            f"{len(pending)} clients prewarmed in {time.perf_counter() - start:.2f} seconds"
+        )
+
+        return results
+
+    async def aprewarm(
+        self, names: Optional[Iterable[str]] = None, timeout: Optional[float] = None
+    ) -> dict[str, Optional[str]]:
+        """
+        prewarm() without blocking the event loop, for the lifespan of the API
+        """
+        return await asyncio.to_thread(self.prewarm, names, timeout)
+
+    def stats(self) -> dict[str, bool]:
+        """
+        Get the registered clients
+
+        Returns:
+            dict[str, bool] -> Name of each client -> True if it was created
+        """
+        return {name: client.created for name, client in self._clients.items()}
+
+
+# Clients shared by the whole process
+client_registry = ClientRegistry()
+
+bigquery_client: LazyClient[bigquery.Client] = client_registry.register(
+    "bigquery", bigquery.Client
+)
+storage_client: LazyClient[storage.Client] = client_registry.register(
+    "storage", storage.Client
+)
+secret_manager_client: LazyClient[secretmanager.SecretManagerServiceClient] = (
+    client_registry.register("secret_manager", secretmanager.SecretManagerServiceClient)
+)
@@ -1,16 +1,77 @@
 from google.cloud import storage
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.auth.credentials import Credentials
+from google.auth.transport.requests import Request
 from loguru import logger
+from typing import Iterator, Literal, Optional
+from datetime import timedelta
+import google.auth
 import os
+import threading
 from io import BytesIO
+from assistant_agent.config import GCSConfig
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.utils.gcp.clients import storage_client
+
+gcs_config = GCSConfig()
+
+# General storage client, created on first use
+client = storage_client
+
+# Handles of the buckets, creating them does not make requests but they are reused
+_buckets = LRUCache(name="gcs_buckets", max_entries=100, size_function=lambda _: 0)
+
+# Result of the existence lookups, the key is (bucket_name, blob_name) and
+# blob_name is None for the bucket itself
+_existence = LRUCache(
+    name="gcs_existence",
+    max_entries=gcs_config.GCS_EXISTENCE_CACHE_MAX_ENTRIES,
+    ttl_seconds=gcs_config.GCS_EXISTENCE_CACHE_TTL_SECONDS,
+    size_function=lambda _: 0,
+)
+
+# Signed URLs of the objects, the key is (bucket_name, blob_name). A URL is served
+# from the cache while it is valid for at least GCS_SIGNED_URL_MIN_REMAINING_SECONDS
+_signed_urls = LRUCache(
+    name="gcs_signed_urls",
+    max_entries=gcs_config.GCS_SIGNED_URL_CACHE_MAX_ENTRIES,
+    ttl_seconds=gcs_config.GCS_SIGNED_URL_EXPIRATION_SECONDS
+    - gcs_config.GCS_SIGNED_URL_MIN_REMAINING_SECONDS,
+)
+
+# Application default credentials used to sign URLs through the IAM API,
+# obtained and refreshed under the lock
+_signing_credentials: Optional[Credentials] = None
+_signing_lock = threading.Lock()
+
+
+def get_bucket_handle(bucket_name: str) -> storage.Bucket:
+    """
+    Get the handle of a bucket, without requesting it to GCS
 
+    Args:
+        bucket_name: str -> Name of the bucket
+
+    Return:
+        storage.Bucket -> Handle of the bucket
+    """
+    bucket = _buckets.get(bucket_name)
+
+    if bucket is None:
+        bucket = client.bucket(bucket_name)
+        _buckets.put(bucket_name, bucket)
+
+    return bucket
 
-# Create a general storage client
-client = storage.Client()
+
+def _set_exists(bucket_name: str, blob_name: Optional[str], exists: bool) -> None:
+    _existence.put((bucket_name, blob_name), exists)
 
 
 def bucket_exists(bucket_name: str) -> bool:
     """
-    Tells if a bucket exists or not.
+    Tells if a bucket exists or not. The result is cached for
+    GCS_EXISTENCE_CACHE_TTL_SECONDS.
 
         Args:
             bucket_name: str -> Name of the bucket
@@ -21,12 +82,19 @@ def bucket_exists(bucket_name: str) -> bool:
     if not isinstance(bucket_name, str) or bucket_name == "":
         raise TypeError("The parameter bucket_name must be a not null string")
 
-    return client.bucket(bucket_name).exists()
+    exists = _existence.get((bucket_name, None))
+
+    if exists is None:
+        exists = get_bucket_handle(bucket_name).exists()
+        _set_exists(bucket_name, None, exists)
+
+    return exists
 
 
 def blob_exists(blob_name: str, bucket_name: str) -> bool:
     """
-    Checks if the blob in the bucket exists.
+    Checks if the blob in the bucket exists, with a lookup of the object (the bucket
+    is not listed). The result is cached for GCS_EXISTENCE_CACHE_TTL_SECONDS.
 
     Args:
         blob_name: Name of the file to verify if exists.
@@ -47,15 +115,73 @@ def blob_exists(blob_name: str, bucket_name: str) -> bool:
     else:
         raise ValueError(f"The bucket {bucket_name} does not exists")
 
-    # Get a list of objects inside the bucket
-    blobs = client.list_blobs(bucket_name)
+    exists = _existence.get((bucket_name, blob_name))
+
+    if exists is None:
+        exists = get_bucket_handle(bucket_name).blob(blob_name).exists()
+        _set_exists(bucket_name, blob_name, exists)
 
-    blobs_name = [blob.name for blob in blobs]
+    return exists
 
-    if blob_name in blobs_name:
-        return True
 
-    return False
+def list_blob_names(
+    prefix: str,
+    bucket_name: str,
+    page_size: int = gcs_config.GCS_LIST_PAGE_SIZE,
+    page_token: Optional[str] = None,
+) -> tuple[list[str], Optional[str]]:
+    """
+    Get one page of the names of the objects whose name starts with prefix
+
+    Args:
+        prefix: str -> Beginning of the names. Ex: "genai_images/tmp/"
+        bucket_name: str -> Name of the bucket
+        page_size: int -> Maximum number of names returned
+        page_token: Optional[str] -> Token returned with the previous page, None for the first one
+
+    Return:
+        tuple[list[str], Optional[str]] -> Names of the page and the token of the next
+                                           page, None if it was the last one
+    """
+    if not isinstance(prefix, str):
+        raise TypeError("The parameter prefix must be a string")
+
+    blobs = client.list_blobs(
+        bucket_name, prefix=prefix, max_results=page_size, page_token=page_token
+    )
+    page = next(blobs.pages, None)
+    names = [blob.name for blob in page] if page is not None else list()
+
+    return names, blobs.next_page_token
+
+
+def iter_blob_names(
+    prefix: str,
+    bucket_name: str,
+    page_size: int = gcs_config.GCS_LIST_PAGE_SIZE,
+) -> Iterator[str]:
+    """
+    Iterate over the names of the objects whose name starts with prefix, the pages
+    are requested as they are consumed
+
+    Args:
+        prefix: str -> Beginning of the names. Ex: "genai_images/tmp/"
+        bucket_name: str -> Name of the bucket
+        page_size: int -> Names requested per page
+
+    Return:
+        Iterator[str] -> Names of the objects
+    """
+    page_token = None
+
+    while True:
+        names, page_token = list_blob_names(
+            prefix, bucket_name, page_size=page_size, page_token=page_token
+        )
+        yield from names
+
+        if page_token is None:
+            return
 
 
 def create_bucket(bucket_name: str, location: str) -> storage.Client.bucket:
@@ -72,6 +198,7 @@ def create_bucket(bucket_name: str, location: str) -> storage.Client.bucket:
         raise ValueError(f"The bucket {bucket_name} already exists")
 
     bucket = client.create_bucket(bucket_name, location=location)
+    _set_exists(bucket_name, None, True)
     logger.info(f"Bucket {bucket_name} successfully created!")
 
     return bucket
@@ -92,6 +219,8 @@ def delete_bucket(bucket_name: str) -> None:
 
     bucket = client.get_bucket(bucket_name)
     bucket.delete()
+    _set_exists(bucket_name, None, False)
+    _buckets.invalidate(bucket_name)
 
     logger.info(f"Bucket {bucket_name} deleted")
 
@@ -141,11 +270,12 @@ def upload_file(
         raise ValueError(f"The bucket {bucket_name} does not exists")
 
     # Get the bucket
-    bucket = client.bucket(bucket_name)
+    bucket = get_bucket_handle(bucket_name)
 
     # Upload file in the bucket
     blob = bucket.blob(destination_file_path)
     blob.upload_from_filename(origin_file_path)
+    _set_exists(bucket_name, destination_file_path, True)
 
     logger.info(
         f"{origin_file_path.split('/')[-1]} stored in GCS as {destination_file_path}"
@@ -156,7 +286,9 @@ def upload_image_from_memory(
     blob_name: str,
     image: BytesIO,
     bucket_name: str,
-) -> None:
+    metadata: Optional[dict[str, str]] = None,
+    url_mode: Literal["signed", "public"] = gcs_config.GCS_IMAGE_URL_MODE,
+) -> str:
     """
     Upload an image to a GCS bucket
 
@@ -164,24 +296,161 @@ def upload_image_from_memory(
         blob_name: str -> Path + name of the file to be stored. ex: "my_folder/my_image.png"
         image: BytesIO -> Image to be stored in GCS.
         bucket_name: str -> Name of the GCS bucket. ex: "my_bucket"
+        metadata: Optional[dict[str, str]] -> Custom metadata of the object, sent in
+                                              the same request as the image
+        url_mode: Literal["signed", "public"] -> "signed" returns a signed URL of the
+                                                 image, "public" makes the image public
 
     Return:
-        None
+        str -> Url of the image
     """
-    if not bucket_exists(bucket_name):
-        raise ValueError(f"The bucket {bucket_name} does not exists")
     if not isinstance(image, BytesIO):
         raise TypeError("The image parameter must be a BytesIO object")
+    if url_mode not in ("signed", "public"):
+        raise ValueError(f"The image url mode {url_mode} is not valid")
 
-    bucket = client.bucket(bucket_name)
+    bucket = get_bucket_handle(bucket_name)
     blob = bucket.blob(blob_name)
-    blob.upload_from_file(image)
+    if metadata:
+        blob.metadata = metadata
+
+    # The upload fails if the bucket does not exist, it is not checked before
+    try:
+        blob.upload_from_file(image)
+    except NotFound:
+        _set_exists(bucket_name, None, False)
+        raise ValueError(f"The bucket {bucket_name} does not exists")
+    _set_exists(bucket_name, None, True)
+    _set_exists(bucket_name, blob_name, True)
 
-    blob.make_public()
+    if url_mode == "public":
+        blob.make_public()
 
     logger.info("Image successfully stored in GCS bucket")
 
-    return blob.public_url
+    return get_image_url(blob_name, bucket_name, mode=url_mode)
+
+
+def _get_signing_identity() -> tuple[str, str]:
+    """
+    Get the service account and the access token used to sign URLs through the
+    IAM API (iam.serviceAccounts.signBlob). The caller needs
+    roles/iam.serviceAccountTokenCreator on the service account, also when it signs
+    as itself.
+
+    Returns:
+        tuple[str, str] -> Email of the service account and access token
+    """
+    global _signing_credentials
+
+    with _signing_lock:
+        if _signing_credentials is None:
+            _signing_credentials, _ = google.auth.default(
+                scopes=["https://www.googleapis.com/auth/cloud-platform"]
+            )
+        if not _signing_credentials.valid:
+            # The metadata server only reports the email of the account after a refresh
+            _signing_credentials.refresh(Request())
+
+        service_account_email = gcs_config.GCS_SIGNING_SERVICE_ACCOUNT or getattr(
+            _signing_credentials, "service_account_email", None
+        )
+        token = _signing_credentials.token
+
+    if not service_account_email or service_account_email == "default":
+        raise ValueError(
+            "The credentials cannot sign URLs: they have no private key and no "
+            "service account. Set GCS_SIGNING_SERVICE_ACCOUNT to a service account "
+            "on which you have roles/iam.serviceAccountTokenCreator, or set "
+            "GCS_IMAGE_URL_MODE=public"
+        )
+
+    return service_account_email, token
+
+
+def _sign_url(blob: storage.Blob, expiration: timedelta) -> str:
+    """
+    Sign a V4 URL to download an object, locally if the credentials of the client
+    have a private key, otherwise through the IAM API
+    """
+    try:
+        # Signed with the private key of the service account, without requests
+        return blob.generate_signed_url(
+            version="v4", expiration=expiration, method="GET"
+        )
+    except AttributeError:
+        # The credentials have no private key (e.g. the ones of the Cloud Run service)
+        service_account_email, access_token = _get_signing_identity()
+
+        return blob.generate_signed_url(
+            version="v4",
+            expiration=expiration,
+            method="GET",
+            service_account_email=service_account_email,
+            access_token=access_token,
+        )
+
+
+def get_signed_url(
+    blob_name: str,
+    bucket_name: str,
+    expiration_seconds: int = gcs_config.GCS_SIGNED_URL_EXPIRATION_SECONDS,
+) -> str:
+    """
+    Get a V4 signed URL to download an object, valid for expiration_seconds.
+    The URLs are cached, the same URL is returned while it is still valid for
+    GCS_SIGNED_URL_MIN_REMAINING_SECONDS.
+
+    Args:
+        blob_name: str -> Path of the file. Ex: "my_folder/my_image.png"
+        bucket_name: str -> Name of the bucket where the file is stored
+        expiration_seconds: int -> Time that the URL is valid
+
+    Return:
+        str -> Signed url of the object
+    """
+    if not isinstance(blob_name, str) or blob_name == "":
+        raise TypeError("The parameter blob_name must be a not null string")
+
+    key = (bucket_name, blob_name)
+    url = _signed_urls.get(key)
+
+    if url is None:
+        blob = get_bucket_handle(bucket_name).blob(blob_name)
+        url = _sign_url(blob, timedelta(seconds=expiration_seconds))
+
+        ttl_seconds = (
+            expiration_seconds - gcs_config.GCS_SIGNED_URL_MIN_REMAINING_SECONDS
+        )
+        if ttl_seconds > 0:
+            _signed_urls.put(key, url, ttl_seconds=ttl_seconds)
+
+    return url
+
+
+def get_image_url(
+    blob_name: str,
+    bucket_name: str,
+    mode: Literal["signed", "public"] = gcs_config.GCS_IMAGE_URL_MODE,
+) -> str:
+    """
+    Get the url used to share an image
+
+    Args:
+        blob_name: str -> Path of the image. Ex: "my_folder/my_image.png"
+        bucket_name: str -> Name of the bucket where the image is stored
+        mode: Literal["signed", "public"] -> "signed" for a V4 signed URL, "public" for
+                                             the public url (the object must be public)
+
+    Return:
+        str -> Url of the image
+    """
+    if mode == "signed":
+        return get_signed_url(blob_name, bucket_name)
+    if mode == "public":
+        return get_bucket_handle(bucket_name).blob(blob_name).public_url
+
+    raise ValueError(f"The image url mode {mode} is not valid")
 
 
 def upload_file_from_memory(
@@ -208,9 +477,10 @@ def upload_file_from_memory(
             "The parameters string_data and blob_name must be string types"
         )
 
-    bucket = client.bucket(bucket_name)
+    bucket = get_bucket_handle(bucket_name)
     blob = bucket.blob(blob_name)
     blob.upload_from_string(string_data)
+    _set_exists(bucket_name, blob_name, True)
 
     logger.info("In-memory data successfully stored in GCS bucket")
 
@@ -231,9 +501,18 @@ def delete_file(file_name: str, bucket_name: str) -> None:
             f"The file {file_name} does not exist in the bucket {bucket_name}"
         )
 
-    bucket = client.bucket(bucket_name)
+    bucket = get_bucket_handle(bucket_name)
     blob = bucket.blob(file_name)
-    blob.delete()
+    try:
+        blob.delete()
+    except NotFound:
+        # Deleted after the cached existence lookup
+        _set_exists(bucket_name, file_name, False)
+        raise ValueError(
+            f"The file {file_name} does not exist in the bucket {bucket_name}"
+        )
+    _set_exists(bucket_name, file_name, False)
+    _signed_urls.invalidate((bucket_name, file_name))
     logger.info(f"The file {file_name} was deleted successfully")
 
 
@@ -261,11 +540,16 @@ def download_file(gcs_file_path: str, local_file_path: str, bucket_name: str) ->
         raise ValueError(f"The path {file_path} does not exists")
 
     # Get the bucket and the file
-    bucket = client.bucket(bucket_name)
+    bucket = get_bucket_handle(bucket_name)
     blob = bucket.blob(gcs_file_path)
 
     # Download the file
-    blob.download_to_filename(local_file_path)
+    try:
+        blob.download_to_filename(local_file_path)
+    except NotFound:
+        # Deleted after the cached existence lookup
+        _set_exists(bucket_name, gcs_file_path, False)
+        raise ValueError(f"The file: {gcs_file_path} does not exists")
     logger.info(f"file {gcs_file_path} downloaded in {local_file_path}")
 
 
@@ -289,9 +573,99 @@ def get_file(
             f"{gcs_file_path} does not exists. Check the path and try again"
         )
 
-    bucket = client.bucket(bucket_name)
+    bucket = get_bucket_handle(bucket_name)
     blob = bucket.blob(gcs_file_path)
 
-    memory_blob = blob.download_as_bytes()
+    try:
+        memory_blob = blob.download_as_bytes()
+    except NotFound:
+        # Deleted after the cached existence lookup
+        _set_exists(bucket_name, gcs_file_path, False)
+        raise ValueError(
+            f"{gcs_file_path} does not exists. Check the path and try again"
+        )
 
     return memory_blob
+
+
+def get_blob_metadata(blob_name: str, bucket_name: str) -> Optional[storage.Blob]:
+    """
+    Get the metadata of an object (size, creation time, custom metadata...) with a
+    single request, without downloading it
+
+    Args:
+        blob_name: str -> Path of the file. Ex: "my_folder/file.png"
+        bucket_name: str -> Name of the bucket where the file is stored
+
+    Return:
+        Optional[storage.Blob] -> Object with its metadata loaded, None if it does not exist
+    """
+    if not isinstance(blob_name, str) or blob_name == "":
+        raise TypeError("The parameter blob_name must be a not null string")
+
+    blob = get_bucket_handle(bucket_name).get_blob(blob_name)
+    _set_exists(bucket_name, blob_name, blob is not None)
+
+    return blob
+
+
+def get_text_with_generation(
+    blob_name: str, bucket_name: str
+) -> tuple[Optional[str], int]:
+    """
+    Read a text file and the generation of the object, in a single request.
+    The generation can be used to update the file only if nobody modified it in between.
+
+    Args:
+        blob_name: str -> Path of the file. Ex: "my_folder/file.json"
+        bucket_name: str -> Name of the bucket where the file is stored
+
+    Return:
+        tuple[Optional[str], int] -> Content of the file and its generation.
+                                     (None, 0) if the file does not exist
+    """
+    if not isinstance(blob_name, str) or blob_name == "":
+        raise TypeError("The parameter blob_name must be a not null string")
+
+    blob = get_bucket_handle(bucket_name).blob(blob_name)
+
+    try:
+        text = blob.download_as_text()
+    except NotFound:
+        return None, 0
+
+    return text, int(blob.generation)
+
+
+def upload_text_if_generation_match(
+    blob_name: str, text: str, bucket_name: str, generation: int
+) -> Optional[int]:
+    """
+    Write a text file only if its current generation is the one provided
+    (compare-and-swap). A generation of 0 means that the file must not exist.
+
+    Args:
+        blob_name: str -> Path of the file. Ex: "my_folder/file.json"
+        text: str -> New content of the file
+        bucket_name: str -> Name of the bucket
+        generation: int -> Expected generation of the object
+
+    Return:
+        Optional[int] -> New generation of the object, None if another writer
+                         modified it first
+    """
+    if not isinstance(text, str):
+        raise TypeError("The parameter text must be a string")
+
+    blob = get_bucket_handle(bucket_name).blob(blob_name)
+
+    try:
+        blob.upload_from_string(
+            text, content_type="application/json", if_generation_match=generation
+        )
+    except PreconditionFailed:
+        return None
+
+    _set_exists(bucket_name, blob_name, True)
+
+    return int(blob.generation)
@@ -1,13 +1,34 @@
-from google.cloud import secretmanager
-from typing import Union
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from google.api_core.exceptions import NotFound
+from typing import Callable, Optional, Union
 from pydantic import SecretStr
 from loguru import logger
+from assistant_agent.config import SecretsConfig
+from assistant_agent.utils.gcp.clients import secret_manager_client
+from assistant_agent.utils.metrics import metrics
+import threading
+import time
 
-# Create a SecretManager Client
-client = secretmanager.SecretManagerServiceClient()
+secrets_config = SecretsConfig()
 
+# SecretManager client, created on first use
+client = secret_manager_client
 
-def secret_exists(secret_id: str, project_id: str) -> None:
+
+def _validate_secret_id(secret_id: str, project_id: str) -> None:
+    if not isinstance(secret_id, str) or not isinstance(project_id, str):
+        raise TypeError("The parameters secret_id and project_id must be strings")
+
+    if secret_id == "" or project_id == "":
+        raise ValueError("Neither secret_id nor project_id can be empty strings")
+
+
+def _validate_version_id(version_id: Union[str, int]) -> None:
+    if not isinstance(version_id, Union[str, int]) or version_id == "":
+        raise TypeError("version_id is not a string or an integer")
+
+
+def secret_exists(secret_id: str, project_id: str) -> bool:
     """
     Checks if a secret already exists
 
@@ -18,31 +39,22 @@ def secret_exists(secret_id: str, project_id: str) -> None:
     Return:
         bool -> True if the secret exists
     """
-    if not isinstance(secret_id, str) or not isinstance(project_id, str):
-        raise TypeError("The parameters secret_id and project_id must be strings")
+    _validate_secret_id(secret_id, project_id)
 
-    if secret_id == "" or project_id == "":
-        raise ValueError("Neither secret_id nor project_id can be empty strings")
+    # A single lookup of the secret, instead of listing all the secrets of the project
+    try:
+        client.get_secret(request={"name": client.secret_path(project_id, secret_id)})
+    except NotFound:
+        return False
 
-    parent = f"projects/{project_id}"
-
-    # Get secret objects and names
-    secret_objects = client.list_secrets(request={"parent": parent})
-
-    # secret.name is in the form: "projects/project_id/secrets/secret_id"
-    secret_names = [secret.name.split("/")[-1] for secret in secret_objects]
-
-    if secret_id in secret_names:
-        return True
-
-    return False
+    return True
 
 
 def secret_version_exists(
     secret_id: str,
     version_id: Union[str, int],
     project_id: str,
-):
+) -> bool:
     """
     Return True if a version of a secret exists
 
@@ -51,28 +63,17 @@ def secret_version_exists(
         version_id: Union[str, int] -> Version of the secret
         project_id: str -> GCP project id
     """
-    # secret_exists has error handlers
-    if not secret_exists(secret_id, project_id):
-        raise ValueError("The secret_id does not exists")
-
-    if not isinstance(version_id, Union[str, int]) or version_id == "":
-        raise TypeError("version_id is not a string or an integer")
-
-    parent = client.secret_path(project_id, secret_id)
-
-    versions = client.list_secret_versions(request={"parent": parent})
-
-    # version.name is in the form:
-    # "projects/project_id/secrets/secret_id/versions/version_id"
-    version_names = [version.name.split("/")[-1] for version in versions]
+    _validate_secret_id(secret_id, project_id)
+    _validate_version_id(version_id)
 
-    # Convert version_id into a string to compare it with version_names
-    version_id = str(version_id)
+    name = client.secret_version_path(project_id, secret_id, str(version_id))
 
-    if version_id in version_names:
-        return True
+    try:
+        client.get_secret_version(request={"name": name})
+    except NotFound:
+        return False
 
-    return False
+    return True
 
 
 def create_secret(
@@ -124,28 +125,32 @@ def get_secret(
     secret_id: str,
     version_id: Union[int, str],
     project_id: str,
-) -> str:
+) -> SecretStr:
     """
-    Get a secret from secretmanager
+    Get a secret from secretmanager with a single request, a secret or a version that
+    does not exist is reported by the request itself.
     Code obtained from:
     https://cloud.google.com/secret-manager/docs/access-secret-version
 
     Args:
         secret_id: str -> Name of the secret
-        version_id: Union[int, str] -> Version of the secret
+        version_id: Union[int, str] -> Version of the secret, or "latest"
+        project_id: str -> GCP project id
 
     Return:
         SecretStr -> string with the version of the secret
     """
-    # secret_version_exists contains error handlers for all the parameters
-    if not secret_version_exists(secret_id, version_id, project_id):
-        raise ValueError("The version_id does not exists")
+    _validate_secret_id(secret_id, project_id)
+    _validate_version_id(version_id)
 
     # Build the resource name
     name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
 
     # Access the secret version
-    response = client.access_secret_version(request={"name": name})
+    try:
+        response = client.access_secret_version(request={"name": name})
+    except NotFound:
+        raise ValueError(f"The version {version_id} of {secret_id} does not exists")
 
     # Get the payload of the response
     payload = SecretStr(response.payload.data.decode("UTF-8"))
@@ -153,6 +158,35 @@ def get_secret(
     return payload
 
 
+def get_secrets(
+    secrets: list[tuple[str, Union[int, str]]],
+    project_id: str,
+) -> dict[tuple[str, str], SecretStr]:
+    """
+    Get several secrets concurrently
+
+    Args:
+        secrets: list[tuple[str, Union[int, str]]] -> secret_id and version_id of each secret
+        project_id: str -> GCP project id
+
+    Return:
+        dict[tuple[str, str], SecretStr] -> (secret_id, version_id) -> value of the secret
+    """
+    if not secrets:
+        return dict()
+
+    workers = min(len(secrets), secrets_config.SECRETS_FETCH_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            (secret_id, str(version_id)): executor.submit(
+                get_secret, secret_id, version_id, project_id
+            )
+            for secret_id, version_id in secrets
+        }
+
+    return {key: future.result() for key, future in futures.items()}
+
+
 def destroy_secret_version(
     secret_id: str,
     version_id: str,
@@ -245,3 +279,154 @@ def add_secret_version(
     )
 
     logger.info("Secret version added")
+
+
+class _CachedSecret:
+    def __init__(self, value: SecretStr):
+        self.value = value
+        self.fetched_at = time.monotonic()
+
+
+class SecretCache:
+    """
+    Values of the secrets read by the process. A value older than ttl_seconds is
+    still returned, while it is fetched again in the background, so a rotated secret
+    ("latest" version) is used without restarting the process and no caller waits
+    for Secret Manager once the secret was read. Concurrent reads of a secret that
+    is not cached make a single request.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = secrets_config.SECRETS_CACHE_TTL_SECONDS,
+        max_workers: int = secrets_config.SECRETS_FETCH_MAX_WORKERS,
+        fetch_function: Callable[[str, str, str], SecretStr] = get_secret,
+    ):
+        """
+        Args:
+            ttl_seconds: float -> Age after which a value is fetched again in the background
+            max_workers: int -> Maximum number of secrets fetched at the same time
+            fetch_function: Callable[[str, str, str], SecretStr] -> Reads a secret from
+                            (secret_id, version_id, project_id)
+        """
+        self.ttl_seconds = ttl_seconds
+        self.fetch_function = fetch_function
+        self._lock = threading.Lock()
+        self._secrets: dict[tuple[str, str, str], _CachedSecret] = dict()
+        self._fetches: dict[tuple[str, str, str], Future] = dict()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="secrets"
+        )
+
+    def _fetch(self, key: tuple[str, str, str]) -> SecretStr:
+        project_id, secret_id, version_id = key
+        try:
+            value = self.fetch_function(secret_id, version_id, project_id)
+            with self._lock:
+                previous = self._secrets.get(key)
+                self._secrets[key] = _CachedSecret(value)
+            metrics.increment("secrets_fetched", labels={"secret": secret_id})
+            if previous is not None and previous.value != value:
+                logger.info(f"The secret {secret_id} changed")
+            return value
+        except Exception as e:
+            metrics.increment("secrets_fetch_errors", labels={"secret": secret_id})
+            logger.warning(f"The secret {secret_id} could not be fetched: {e}")
+            with self._lock:
+                # The current value is kept, the fetch is retried after another ttl
+                if key in self._secrets:
+                    self._secrets[key].fetched_at = time.monotonic()
+            raise
+        finally:
+            with self._lock:
+                self._fetches.pop(key, None)
+
+    def _start_fetch(self, key: tuple[str, str, str], refresh: bool = False) -> Future:
+        # The lock is held while the fetch is registered, so the fetch cannot
+        # unregister itself before it is registered
+        with self._lock:
+            future = self._fetches.get(key)
+            if future is not None:
+                return future
+
+            cached_secret = self._secrets.get(key)
+            if cached_secret is not None and not refresh:
+                # Another fetch finished after the caller looked for the value
+                future = Future()
+                future.set_result(cached_secret.value)
+                return future
+
+            future = self._executor.submit(self._fetch, key)
+            self._fetches[key] = future
+            return future
+
+    def get(
+        self, secret_id: str, version_id: Union[int, str], project_id: str
+    ) -> SecretStr:
+        """
+        Get the value of a secret, it is only requested to Secret Manager if it is
+        not cached yet
+
+        Args:
+            secret_id: str -> Name of the secret
+            version_id: Union[int, str] -> Version of the secret, or "latest"
+            project_id: str -> GCP project id
+
+        Returns:
+            SecretStr -> Value of the secret
+        """
+        key = (project_id, secret_id, str(version_id))
+        cached_secret = self._secrets.get(key)
+
+        if cached_secret is None:
+            return self._start_fetch(key).result()
+
+        if time.monotonic() - cached_secret.fetched_at >= self.ttl_seconds:
+            # If the fetch fails, the current value is kept until the next attempt
+            self._start_fetch(key, refresh=True)
+
+        return cached_secret.value
+
+    def prefetch(
+        self,
+        secrets: list[tuple[str, Union[int, str]]],
+        project_id: str,
+        timeout: Optional[float] = None,
+    ) -> dict[str, Optional[str]]:
+        """
+        Fetch several secrets concurrently, the ones already cached are not fetched again
+
+        Args:
+            secrets: list[tuple[str, Union[int, str]]] -> secret_id and version_id of each secret
+            project_id: str -> GCP project id
+            timeout: Optional[float] -> Maximum seconds to wait, None to wait for all of them
+
+        Returns:
+            dict[str, Optional[str]] -> secret_id -> None if it is cached, or the error
+        """
+        futures = {
+            secret_id: self._start_fetch((project_id, secret_id, str(version_id)))
+            for secret_id, version_id in secrets
+            if (project_id, secret_id, str(version_id)) not in self._secrets
+        }
+        wait(futures.values(), timeout=timeout)
+
+        errors = {secret_id: None for secret_id, _ in secrets}
+        for secret_id, future in futures.items():
+            if not future.done():
+                errors[secret_id] = "Timed out"
+            elif future.exception() is not None:
+                errors[secret_id] = str(future.exception())
+
+        return errors
+
+    def invalidate(self, secret_id: str, version_id: Union[int, str], project_id: str):
+        """
+        Forget the value of a secret, the next read fetches it again
+        """
+        with self._lock:
+            self._secrets.pop((project_id, secret_id, str(version_id)), None)
+
+
+# Secrets read by the process
+secret_cache = SecretCache()
@@ -0,0 +1,314 @@
+from collections import deque
+from contextvars import ContextVar
+from google.genai import errors as genai_errors
+from loguru import logger
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import random
+import time
+from assistant_agent.config import GenAISchedulerConfig
+from assistant_agent.utils.metrics import metrics
+
+scheduler_config = GenAISchedulerConfig()
+
+T = TypeVar("T")
+
+# User on whose behalf the GenAI calls of the current request are made, the calls
+# waiting for a slot are served in turns between users. The API sets it per request
+current_genai_user: ContextVar[str] = ContextVar(
+    "current_genai_user", default="anonymous"
+)
+
+
+class GenAIThrottledError(Exception):
+    """
+    A GenAI call could not be completed before its deadline because the model is
+    throttling the requests or is overloaded. The caller should try again later.
+    """
+
+    def __init__(self, message: str, retry_after_seconds: float):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Tell if an error of the GenAI SDK means that the quota of the model was exceeded
+
+    Args:
+        error: Exception -> Error raised by a GenAI call
+
+    Returns:
+        bool -> True for 429 / RESOURCE_EXHAUSTED errors
+    """
+    return isinstance(error, genai_errors.APIError) and (
+        error.code == 429 or error.status == "RESOURCE_EXHAUSTED"
+    )
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Tell if a GenAI call that failed with error can succeed if it is made again
+
+    Args:
+        error: Exception -> Error raised by a GenAI call
+
+    Returns:
+        bool -> True if the model throttled the call or was unavailable
+    """
+    return is_throttling_error(error) or (
+        isinstance(error, genai_errors.APIError) and error.code in (500, 503)
+    )
+
+
+class _ModelLimiter:
+    """
+    Concurrency limit of one model, adjusted with AIMD: it grows by one slot for
+    each window of successful calls and it is halved when the model throttles. The
+    calls that wait for a slot are queued per user and served in round robin.
+    Only used from the event loop, so it does not need locks.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        min_concurrency: int,
+        decrease_factor: float,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters: dict[str, deque[asyncio.Future]] = dict()
+        # Users with calls waiting, in the order they will be served
+        self._turns: deque[str] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _has_free_slot(self) -> bool:
+        return self.in_flight < max(int(self.limit), self.min_concurrency)
+
+    async def acquire(self, user: str, timeout: float) -> None:
+        if self._has_free_slot() and not self._turns:
+            self.in_flight += 1
+            return
+
+        slot = asyncio.get_running_loop().create_future()
+        user_waiters = self._waiters.setdefault(user, deque())
+        if not user_waiters:
+            self._turns.append(user)
+        user_waiters.append(slot)
+
+        try:
+            await asyncio.wait_for(slot, timeout)
+        except BaseException:
+            if slot.done() and not slot.cancelled():
+                # The slot was given right before the timeout or the cancellation
+                self.release()
+            else:
+                self._remove_waiter(user, slot)
+            raise
+
+    def _remove_waiter(self, user: str, slot: asyncio.Future) -> None:
+        user_waiters = self._waiters.get(user)
+        if user_waiters is None or slot not in user_waiters:
+            return
+
+        user_waiters.remove(slot)
+        if not user_waiters:
+            del self._waiters[user]
+            self._turns.remove(user)
+
+    def _wake_waiters(self) -> None:
+        while self._turns and self._has_free_slot():
+            user = self._turns.popleft()
+            user_waiters = self._waiters[user]
+            slot = user_waiters.popleft()
+
+            # The user goes to the end of the line if it has more calls waiting
+            if user_waiters:
+                self._turns.append(user)
+            else:
+                del self._waiters[user]
+
+            if not slot.done():
+                self.in_flight += 1
+                slot.set_result(None)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def on_success(self) -> None:
+        self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        self._wake_waiters()
+
+    def on_throttle(self, call_started_at: float) -> None:
+        # The calls that were already running when the limit was decreased would
+        # decrease it again for the same burst
+        if call_started_at < self._last_decrease:
+            return
+
+        self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+        self._last_decrease = time.monotonic()
+
+
+class GenAIScheduler:
+    """
+    Process-wide scheduler of the calls made to the GenAI models. Each model has its
+    own adaptive concurrency limit, the calls throttled or failed because the model
+    was unavailable are retried with jittered exponential backoff, and no call waits
+    or retries beyond its deadline: it fails with GenAIThrottledError instead.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: dict[str, int] = scheduler_config.GENAI_MAX_CONCURRENCY,
+        default_max_concurrency: int = scheduler_config.GENAI_DEFAULT_MAX_CONCURRENCY,
+        min_concurrency: int = scheduler_config.GENAI_MIN_CONCURRENCY,
+        decrease_factor: float = scheduler_config.GENAI_DECREASE_FACTOR,
+        max_retries: int = scheduler_config.GENAI_MAX_RETRIES,
+        retry_base_seconds: float = scheduler_config.GENAI_RETRY_BASE_SECONDS,
+        retry_max_seconds: float = scheduler_config.GENAI_RETRY_MAX_SECONDS,
+        deadline_seconds: float = scheduler_config.GENAI_DEADLINE_SECONDS,
+    ):
+        if min_concurrency < 1:
+            raise ValueError("min_concurrency must be greater than 0")
+
+        self.max_concurrency = max_concurrency
+        self.default_max_concurrency = default_max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.deadline_seconds = deadline_seconds
+        self._limiters: dict[str, _ModelLimiter] = dict()
+
+    def _limiter(self, model: str) -> _ModelLimiter:
+        limiter = self._limiters.get(model)
+
+        if limiter is None:
+            limiter = _ModelLimiter(
+                max_concurrency=self.max_concurrency.get(
+                    model, self.default_max_concurrency
+                ),
+                min_concurrency=self.min_concurrency,
+                decrease_factor=self.decrease_factor,
+            )
+            self._limiters[model] = limiter
+
+        return limiter
+
+    def _publish(self, model: str, limiter: _ModelLimiter) -> None:
+        labels = {"model": model}
+        metrics.set_gauge("genai_in_flight", limiter.in_flight, labels)
+        metrics.set_gauge("genai_queued", limiter.queued, labels)
+        metrics.set_gauge("genai_concurrency_limit", limiter.limit, labels)
+
+    async def call(
+        self,
+        model: str,
+        request: Callable[[], Awaitable[T]],
+        deadline_seconds: Optional[float] = None,
+    ) -> T:
+        """
+        Make a GenAI call when the model has a free slot, retrying it if the model
+        throttles it or is unavailable
+
+        Args:
+            model: str -> Name of the model called. Ex: "imagen-3.0-generate-002"
+            request: Callable[[], Awaitable[T]] -> Function that makes the call, it is
+                                                  called again on each retry
+            deadline_seconds: Optional[float] -> Maximum seconds to wait for a slot and
+                                                 retry, the scheduler default if not passed
+
+        Returns:
+            T -> Response of the call
+        """
+        deadline = time.monotonic() + (
+            self.deadline_seconds if deadline_seconds is None else deadline_seconds
+        )
+        limiter = self._limiter(model)
+        labels = {"model": model}
+        user = current_genai_user.get()
+
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.monotonic()
+            try:
+                await limiter.acquire(user, timeout=max(deadline - queued_at, 0))
+            except asyncio.TimeoutError:
+                metrics.increment("genai_rejected", labels=labels)
+                self._publish(model, limiter)
+                raise GenAIThrottledError(
+                    f"The model {model} is busy, try again later",
+                    retry_after_seconds=self.retry_max_seconds,
+                )
+
+            started_at = time.monotonic()
+            metrics.observe("genai_queue_wait_seconds", started_at - queued_at, labels)
+            self._publish(model, limiter)
+
+            try:
+                response = await request()
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                limiter.release()
+                self._publish(model, limiter)
+
+            if error is None:
+                limiter.on_success()
+                metrics.observe(
+                    "genai_call_seconds", time.monotonic() - started_at, labels
+                )
+                return response
+
+            if not is_retryable_error(error):
+                raise error
+
+            if is_throttling_error(error):
+                limiter.on_throttle(started_at)
+                metrics.increment("genai_throttled", labels=labels)
+
+            # Full jitter, so the calls throttled at the same time do not retry together
+            backoff = random.uniform(
+                0, min(self.retry_max_seconds, self.retry_base_seconds * 2**attempt)
+            )
+            if attempt == self.max_retries or time.monotonic() + backoff >= deadline:
+                metrics.increment("genai_rejected", labels=labels)
+                raise GenAIThrottledError(
+                    f"The model {model} is throttling the requests, try again later",
+                    retry_after_seconds=self.retry_max_seconds,
+                ) from error
+
+            logger.warning(
+                f"{model} call failed ({error}), retrying in {backoff:.2f} seconds"
+            )
+            metrics.increment("genai_retries", labels=labels)
+            await asyncio.sleep(backoff)
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Get the state of the limiter of each model
+
+        Returns:
+            dict[str, dict] -> Name of the model -> limit, calls in flight and calls queued
+        """
+        return {
+            model: {
+                "limit": limiter.limit,
+                "in_flight": limiter.in_flight,
+                "queued": limiter.queued,
+            }
+            for model, limiter in self._limiters.items()
+        }
+
+
+# Scheduler shared by all the GenAI calls of the process
+genai_scheduler = GenAIScheduler()
@@ -0,0 +1,135 @@
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+from typing import Optional
+from assistant_agent.config import HistoryCacheConfig
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.utils.metrics import metrics
+
+history_cache_config = HistoryCacheConfig()
+
+
+def decode_steps(steps: list[str]) -> list[ModelMessage]:
+    """
+    Convert agent steps stored as JSON strings into the messages that the agent reads.
+    The steps were serialized by pydantic-ai, so they are validated straight from the
+    JSON, without building python dictionaries first.
+
+    Args:
+        steps: list[str] -> Agent steps, each one is the JSON of a ModelMessage
+
+    Returns:
+        list[ModelMessage] -> Messages of the steps, in the same order
+    """
+    if not steps:
+        return list()
+
+    return ModelMessagesTypeAdapter.validate_json("[" + ",".join(steps) + "]")
+
+
+class _DecodedHistory:
+    def __init__(self, steps_count: int, last_step: str, messages: list[ModelMessage]):
+        # Version of the history: the messages belong to the first steps_count steps,
+        # and the last of them was last_step
+        self.steps_count = steps_count
+        self.last_step = last_step
+        self.messages = messages
+
+
+class HistoryCodec:
+    """
+    Decodes the chat histories and keeps the messages of each session, so a new turn
+    only decodes the steps appended since the previous one. The cached messages are
+    shared between the requests of a session, they must not be modified.
+
+    The messages are only reused for the steps they were decoded from, so they are as
+    fresh as the history passed to decode. When the agent_steps table finds that its
+    cached history is stale, it invalidates the messages of the session as well.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = history_cache_config.HISTORY_CACHE_MAX_SESSIONS,
+        ttl_seconds: Optional[float] = history_cache_config.HISTORY_CACHE_TTL_SECONDS,
+        enabled: bool = history_cache_config.HISTORY_CACHE_ENABLED,
+    ):
+        """
+        Args:
+            max_sessions: int -> Maximum number of sessions whose messages are kept
+            ttl_seconds: Optional[float] -> Time that the messages of a session are kept
+            enabled: bool -> If False, the full history is decoded on every call
+        """
+        self.enabled = enabled
+        self._sessions = LRUCache(
+            name="decoded_history",
+            max_entries=max_sessions,
+            ttl_seconds=ttl_seconds,
+        )
+
+    def _cached_prefix(
+        self, chat_session_id: str, steps: list[str]
+    ) -> Optional[_DecodedHistory]:
+        decoded = self._sessions.get(chat_session_id)
+
+        # The history must be the cached one plus new steps at the end, otherwise
+        # (e.g. it was read again from the database) it is decoded from scratch
+        if (
+            decoded is None
+            or decoded.steps_count > len(steps)
+            or (
+                decoded.steps_count > 0
+                and steps[decoded.steps_count - 1] != decoded.last_step
+            )
+        ):
+            return None
+
+        return decoded
+
+    def decode(self, chat_session_id: str, steps: list[str]) -> list[ModelMessage]:
+        """
+        Get the messages of the history of a chat session
+
+        Args:
+            chat_session_id: str -> Id of the chat session
+            steps: list[str] -> Full history of the session, each step is the JSON of a ModelMessage
+
+        Returns:
+            list[ModelMessage] -> Messages of the history
+        """
+        if not self.enabled:
+            return decode_steps(steps)
+
+        decoded = self._cached_prefix(chat_session_id, steps)
+        reused = 0 if decoded is None else decoded.steps_count
+        messages = list() if decoded is None else decoded.messages
+
+        metrics.increment("history_steps_reused", reused)
+        metrics.increment("history_steps_decoded", len(steps) - reused)
+
+        if reused < len(steps):
+            messages = messages + decode_steps(steps[reused:])
+            self._sessions.put(
+                chat_session_id,
+                _DecodedHistory(len(steps), steps[-1], messages),
+                size=0,
+            )
+
+        # The caller gets its own list, the messages are shared
+        return list(messages)
+
+    def invalidate(self, chat_session_id: str) -> bool:
+        """
+        Forget the messages of a chat session
+
+        Args:
+            chat_session_id: str -> Id of the chat session
+
+        Returns:
+            bool -> True if the messages were cached
+        """
+        return self._sessions.invalidate(chat_session_id)
+
+    def stats(self) -> dict:
+        return self._sessions.stats()
+
+
+# Decoded histories shared by all the requests of the process
+history_codec = HistoryCodec()
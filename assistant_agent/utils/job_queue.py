@@ -0,0 +1,540 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from loguru import logger
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import json
+import time
+import uuid
+from assistant_agent.config import AgentJobsConfig, GCPConfig
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.utils.gcp.gcs import (
+    get_text_with_generation,
+    upload_file_from_memory,
+)
+from assistant_agent.utils.metrics import metrics
+
+jobs_config = AgentJobsConfig()
+gcp_config = GCPConfig()
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+class JobQueueFullError(Exception):
+    """
+    The job queue has reached its maximum size, the job was not accepted
+    """
+
+
+class Job:
+    """
+    Unit of work executed by the workers of a JobManager
+    """
+
+    def __init__(self, owner: str, payload: dict[str, Any]):
+        self.job_id = uuid.uuid4().hex
+        self.owner = owner
+        self.payload = payload
+        self.status = "queued"
+        self.result: Optional[dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._queued_at = time.monotonic()
+        self._finished = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def updated_at(self) -> datetime:
+        return self.finished_at or self.started_at or self.created_at
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    def to_json(self) -> str:
+        """
+        State of the job and its owner, without the payload
+
+        Returns:
+            str -> JSON of the job, the dates in ISO format
+        """
+        return json.dumps(
+            {**self.as_dict(), "owner": self.owner}, default=datetime.isoformat
+        )
+
+    @classmethod
+    def from_json(cls, job_json: str) -> "Job":
+        """
+        Build a job from the state stored by another instance (to_json)
+
+        Args:
+            job_json: str -> JSON returned by to_json
+
+        Returns:
+            Job -> Job in the status stored, finished if it is succeeded or failed
+        """
+        data = json.loads(job_json)
+
+        job = cls(owner=data["owner"], payload=dict())
+        job.job_id = data["job_id"]
+        job.status = data["status"]
+        job.result = data["result"]
+        job.error = data["error"]
+        for field in ("created_at", "started_at", "finished_at"):
+            if data[field] is not None:
+                setattr(job, field, datetime.fromisoformat(data[field]))
+
+        if job.status in FINISHED_STATUSES:
+            job._finished.set()
+
+        return job
+
+
+class JobQueueBackend(ABC):
+    """
+    Queue of the ids of the jobs waiting for a worker
+    """
+
+    @abstractmethod
+    def put(self, job_id: str) -> None:
+        """
+        Add a job at the end of the queue, raises JobQueueFullError if it is full
+
+        Args:
+            job_id: str -> Id of the job
+
+        Returns:
+            None
+        """
+        pass
+
+    @abstractmethod
+    async def get(self) -> str:
+        """
+        Wait for the next job of the queue
+
+        Returns:
+            str -> Id of the job
+        """
+        pass
+
+    @abstractmethod
+    def qsize(self) -> int:
+        pass
+
+    @abstractmethod
+    def drain(self) -> list[str]:
+        """
+        Remove all the jobs of the queue without waiting
+
+        Returns:
+            list[str] -> Ids of the jobs that were queued
+        """
+        pass
+
+
+class LocalJobQueueBackend(JobQueueBackend):
+    """
+    Queue in the memory of the process, the jobs still queued when the process stops
+    are marked as failed by JobManager.stop
+    """
+
+    def __init__(self, max_queued: int):
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queued)
+
+    def put(self, job_id: str) -> None:
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(
+                f"There are already {self._queue.maxsize} jobs waiting, try again later"
+            )
+
+    async def get(self) -> str:
+        return await self._queue.get()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def drain(self) -> list[str]:
+        job_ids = list()
+        while not self._queue.empty():
+            job_ids.append(self._queue.get_nowait())
+
+        return job_ids
+
+
+class JobStore(ABC):
+    """
+    State of the jobs shared by every instance, so the status of a job can be read
+    from any of them and not only from the one that runs it
+    """
+
+    @abstractmethod
+    async def save(self, job: Job) -> None:
+        """
+        Store the current state of a job
+
+        Args:
+            job: Job -> Job to store
+
+        Returns:
+            None
+        """
+        pass
+
+    @abstractmethod
+    async def load(self, job_id: str) -> Optional[Job]:
+        """
+        Read the last state stored of a job
+
+        Args:
+            job_id: str -> Id of the job
+
+        Returns:
+            Optional[Job] -> The job, None if it was never stored
+        """
+        pass
+
+
+class GCSJobStore(JobStore):
+    """
+    One JSON object per job in GCS. Each job is only written by the instance that
+    runs it, so the writes do not need a compare-and-swap
+    """
+
+    def __init__(self, bucket_name: str, path: str):
+        self.bucket_name = bucket_name
+        self.path = path
+
+    def _blob_name(self, job_id: str) -> str:
+        return f"{self.path}/{job_id}.json"
+
+    async def save(self, job: Job) -> None:
+        await asyncio.to_thread(
+            upload_file_from_memory,
+            self._blob_name(job.job_id),
+            job.to_json(),
+            self.bucket_name,
+        )
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        job_json, _ = await asyncio.to_thread(
+            get_text_with_generation, self._blob_name(job_id), self.bucket_name
+        )
+
+        return None if job_json is None else Job.from_json(job_json)
+
+
+class JobManager:
+    """
+    Runs jobs in the background with a pool of asyncio workers, so the request that
+    submits a job returns immediately and the client polls its status. The jobs are
+    kept in memory for result_ttl_seconds after their last update. With a store,
+    each update is also written to it, so the instances that do not run a job read
+    its status from the store.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Job], Awaitable[dict[str, Any]]],
+        backend: JobQueueBackend,
+        workers: int,
+        result_ttl_seconds: float,
+        max_jobs: int = 10_000,
+        store: Optional[JobStore] = None,
+        store_poll_seconds: float = 1,
+    ):
+        """
+        Args:
+            name: str -> Name of the jobs, used to label the metrics
+            handler: Callable[[Job], Awaitable[dict]] -> Runs a job and returns its result
+            backend: JobQueueBackend -> Queue of the jobs waiting for a worker
+            workers: int -> Number of jobs executed at the same time
+            result_ttl_seconds: float -> Time that a job is kept after its last update
+            max_jobs: int -> Maximum number of jobs kept
+            store: Optional[JobStore] -> State of the jobs shared by the instances,
+                                         None to keep the jobs only in memory
+            store_poll_seconds: float -> Time between reads of the store while waiting
+                                         for a job of another instance
+        """
+        if workers < 1:
+            raise ValueError("workers must be greater than 0")
+
+        self.name = name
+        self.handler = handler
+        self.backend = backend
+        self.workers = workers
+        self.store = store
+        self.store_poll_seconds = store_poll_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self._jobs = LRUCache(
+            name=f"{name}_jobs", max_entries=max_jobs, ttl_seconds=result_ttl_seconds
+        )
+        self._worker_tasks: list[asyncio.Task] = list()
+        self._running = 0
+
+    async def _save(self, job: Job) -> None:
+        """
+        Write the state of a job in the store. The errors are only logged, the job
+        keeps running and its state is written again on the next update
+        """
+        if self.store is None:
+            return
+
+        try:
+            await self.store.save(job)
+        except Exception as e:
+            metrics.increment("job_store_errors", labels={"jobs": self.name})
+            logger.error(f"Error storing the {self.name} job {job.job_id}: {e}")
+
+    def _publish(self) -> None:
+        labels = {"jobs": self.name}
+        metrics.set_gauge("jobs_queued", self.backend.qsize(), labels)
+        metrics.set_gauge("jobs_running", self._running, labels)
+
+    def start(self) -> None:
+        """
+        Start the workers, must be called from the event loop
+        """
+        if self._worker_tasks:
+            return
+
+        self._worker_tasks = [
+            asyncio.create_task(self._work(), name=f"{self.name}_worker_{number}")
+            for number in range(self.workers)
+        ]
+        logger.info(f"{self.workers} {self.name} workers started")
+
+    async def stop(self, timeout: float) -> None:
+        """
+        Let the workers finish the jobs that are running and stop them. The jobs that
+        are still queued are not executed: they are marked as failed, so the clients
+        that poll them know that they must submit them again
+
+        Args:
+            timeout: float -> Maximum seconds to wait for the jobs running
+
+        Returns:
+            None
+        """
+        if not self._worker_tasks:
+            return
+
+        # The workers must not start the queued jobs while the running ones finish
+        queued_jobs = [
+            job for job in map(self._jobs.get, self.backend.drain()) if job is not None
+        ]
+        if queued_jobs:
+            logger.warning(
+                f"{len(queued_jobs)} {self.name} jobs were queued when the instance "
+                "stopped, they are marked as failed"
+            )
+
+        for job in queued_jobs:
+            job.error = "The instance stopped before the job started, submit it again"
+            job.status = "failed"
+            job.finished_at = datetime.now(timezone.utc)
+            metrics.increment(
+                "jobs_finished", labels={"jobs": self.name, "status": job.status}
+            )
+            job._finished.set()
+        await asyncio.gather(*[self._save(job) for job in queued_jobs])
+        self._publish()
+
+        deadline = time.monotonic() + timeout
+        while self._running and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = list()
+
+    async def submit(self, owner: str, payload: dict[str, Any]) -> Job:
+        """
+        Queue a new job. With a store, the job is stored before it is queued, so its
+        status can be read from any instance as soon as it is returned
+
+        Args:
+            owner: str -> Id of the user that submits the job, only this user can read it
+            payload: dict[str, Any] -> Input of the handler
+
+        Returns:
+            Job -> Job queued
+        """
+        job = Job(owner, payload)
+
+        if self.store is not None:
+            await self.store.save(job)
+
+        self._jobs.put(job.job_id, job, size=0)
+        try:
+            self.backend.put(job.job_id)
+        except JobQueueFullError as e:
+            self._jobs.invalidate(job.job_id)
+            metrics.increment("jobs_rejected", labels={"jobs": self.name})
+            if self.store is not None:
+                job.error = str(e)
+                job.status = "failed"
+                job.finished_at = datetime.now(timezone.utc)
+                await self._save(job)
+            raise
+
+        metrics.increment("jobs_submitted", labels={"jobs": self.name})
+        self._publish()
+
+        return job
+
+    async def get(self, job_id: str, owner: str) -> Job:
+        """
+        Get a job of a user, from the memory of the instance or from the store if
+        another instance runs it
+
+        Args:
+            job_id: str -> Id of the job
+            owner: str -> Id of the user that submitted the job
+
+        Returns:
+            Job -> The job
+        """
+        job = self._jobs.get(job_id)
+
+        if job is None and self.store is not None:
+            job = await self.store.load(job_id)
+            if (
+                job is not None
+                and (datetime.now(timezone.utc) - job.updated_at).total_seconds()
+                > self.result_ttl_seconds
+            ):
+                job = None
+
+        # The jobs of other users are reported as not found
+        if job is None or job.owner != owner:
+            raise ValueError(f"The job {job_id} does not exist")
+
+        return job
+
+    async def wait(self, job_id: str, owner: str, timeout: float) -> Job:
+        """
+        Get a job of a user once it finishes, or after timeout seconds (long polling)
+
+        Args:
+            job_id: str -> Id of the job
+            owner: str -> Id of the user that submitted the job
+            timeout: float -> Maximum seconds to wait
+
+        Returns:
+            Job -> The job, finished or in its current status
+        """
+        job = await self.get(job_id, owner)
+
+        if timeout <= 0 or job.finished:
+            return job
+
+        if self._jobs.get(job_id) is job:
+            try:
+                await asyncio.wait_for(job._finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return job
+
+        # Job of another instance, its state is read again from the store
+        deadline = time.monotonic() + timeout
+        while not job.finished and time.monotonic() < deadline:
+            await asyncio.sleep(
+                min(self.store_poll_seconds, deadline - time.monotonic())
+            )
+            job = await self.get(job_id, owner)
+
+        return job
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self.backend.get()
+            job = self._jobs.get(job_id)
+            if job is None:
+                # Expired before a worker was free
+                continue
+
+            labels = {"jobs": self.name}
+            job.status = "running"
+            job.started_at = datetime.now(timezone.utc)
+            metrics.observe(
+                "job_wait_seconds", time.monotonic() - job._queued_at, labels
+            )
+            self._running += 1
+            self._publish()
+            await self._save(job)
+
+            start = time.perf_counter()
+            try:
+                job.result = await self.handler(job)
+                job.status = "succeeded"
+            except Exception as e:
+                logger.error(f"{self.name} job {job.job_id} failed: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                if job.status == "running":
+                    # The worker was cancelled while the job was running
+                    job.error = "The worker stopped before the job finished"
+                    job.status = "failed"
+                job.finished_at = datetime.now(timezone.utc)
+                self._running -= 1
+                metrics.observe("job_run_seconds", time.perf_counter() - start, labels)
+                metrics.increment(
+                    "jobs_finished", labels={**labels, "status": job.status}
+                )
+                self._publish()
+                # The result is kept result_ttl_seconds from now
+                self._jobs.put(job.job_id, job, size=0)
+                job._finished.set()
+                await self._save(job)
+
+
+def get_job_queue_backend() -> JobQueueBackend:
+    """
+    Get the queue backend configured in AgentJobsConfig
+
+    Returns:
+        JobQueueBackend -> New queue
+    """
+    backend_name = jobs_config.AGENT_JOB_QUEUE_BACKEND
+
+    if backend_name == "local":
+        return LocalJobQueueBackend(max_queued=jobs_config.AGENT_JOB_MAX_QUEUED)
+
+    raise ValueError(f"Unknown AGENT_JOB_QUEUE_BACKEND '{backend_name}', use 'local'")
+
+
+def get_job_store() -> Optional[JobStore]:
+    """
+    Get the store of the jobs configured in AgentJobsConfig
+
+    Returns:
+        Optional[JobStore] -> New store, None if the jobs are only kept in memory
+    """
+    store_name = jobs_config.AGENT_JOB_STORE
+
+    if store_name == "gcs":
+        return GCSJobStore(
+            bucket_name=gcp_config.BUCKET_NAME, path=jobs_config.AGENT_JOB_STORE_PATH
+        )
+    if store_name == "local":
+        return None
+
+    raise ValueError(f"Unknown AGENT_JOB_STORE '{store_name}', use 'gcs' or 'local'")
@@ -0,0 +1,201 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import threading
+import time
+
+
+# Upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _metric_key(name: str, labels: Optional[dict]) -> str:
+    """
+    Build the key used to store a metric, in the form name{label1=value1,label2=value2}
+
+    Args:
+        name: str -> Name of the metric
+        labels: Optional[dict] -> Labels that identify a specific series of the metric
+
+    Returns:
+        str -> Key of the metric
+    """
+    if not labels:
+        return name
+
+    labels_str = ",".join(f"{key}={value}" for key, value in sorted(labels.items()))
+
+    return f"{name}{{{labels_str}}}"
+
+
+class Histogram:
+    """
+    Keeps the count, sum, min, max and the cumulative buckets of the observed values
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+        for bucket_number, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[bucket_number] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {
+                f"le_{upper_bound}": bucket_count
+                for upper_bound, bucket_count in zip(self.buckets, self.bucket_counts)
+            },
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process and thread-safe registry of counters, gauges and histograms
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = dict()
+        self._gauges: dict[str, float] = dict()
+        self._histograms: dict[str, Histogram] = dict()
+
+    def increment(
+        self, name: str, value: float = 1, labels: Optional[dict] = None
+    ) -> None:
+        """
+        Increment a counter
+
+        Args:
+            name: str -> Name of the counter
+            value: float -> Amount to add to the counter
+            labels: Optional[dict] -> Labels of the series
+
+        Returns:
+            None
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[dict] = None) -> None:
+        """
+        Set the current value of a gauge
+
+        Args:
+            name: str -> Name of the gauge
+            value: float -> Current value
+            labels: Optional[dict] -> Labels of the series
+
+        Returns:
+            None
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: Optional[dict] = None,
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        """
+        Register a value in a histogram
+
+        Args:
+            name: str -> Name of the histogram
+            value: float -> Observed value (Ex: latency in seconds)
+            labels: Optional[dict] -> Labels of the series
+            buckets: tuple[float, ...] -> Upper bounds of the buckets, only used
+                                          the first time the histogram is created
+
+        Returns:
+            None
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(buckets)
+                self._histograms[key] = histogram
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, labels: Optional[dict] = None) -> Iterator[None]:
+        """
+        Context manager that observes the elapsed seconds of its block in a histogram
+
+        Args:
+            name: str -> Name of the histogram
+            labels: Optional[dict] -> Labels of the series
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def get_counter(self, name: str, labels: Optional[dict] = None) -> float:
+        with self._lock:
+            return self._counters.get(_metric_key(name, labels), 0)
+
+    def get_gauge(self, name: str, labels: Optional[dict] = None) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(_metric_key(name, labels))
+
+    def snapshot(self) -> dict:
+        """
+        Get a copy of all the metrics registered
+
+        Returns:
+            dict -> Dictionary with the keys counters, gauges and histograms
+        """
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {
+                    key: histogram.to_dict()
+                    for key, histogram in self._histograms.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+# Registry shared by the whole process
+metrics = MetricsRegistry()
@@ -0,0 +1,72 @@
+from typing import Awaitable, Callable, Hashable, TypeVar
+import asyncio
+from assistant_agent.utils.metrics import metrics
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one: the first caller starts
+    the call and the callers that arrive while it is running wait for the same
+    result (or error). The call is cancelled only when every caller waiting for it
+    was cancelled. Only used from the event loop, so it does not need locks.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: str -> Name of the group of calls, used to label its metrics
+        """
+        self.name = name
+        self._flights: dict[Hashable, _Flight] = dict()
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run function, or wait for the call with the same key that is already running
+
+        Args:
+            key: Hashable -> Fingerprint of the call, equal keys must produce equal results
+            function: Callable[[], Awaitable[T]] -> Makes the call, only called by the first caller
+
+        Returns:
+            T -> Result of the call shared by all the callers. The callers must not
+                 modify it, mutable results must be copied by each caller
+        """
+        flight = self._flights.get(key)
+
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(function()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            metrics.increment(
+                "single_flight_calls", labels={"name": self.name, "role": "leader"}
+            )
+        else:
+            metrics.increment(
+                "single_flight_calls", labels={"name": self.name, "role": "follower"}
+            )
+
+        flight.waiters += 1
+        try:
+            # The cancellation of one caller must not cancel the call of the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller gave up, new callers start a new call
+                self._forget(key, flight)
+                flight.task.cancel()
@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+import asyncio
+import json
+
+# Queue of the stream that is being served in the current context. The tools run in
+# the same task as the agent, so they inherit it and can publish events while the
+# agent is still working. It is None when the agent is not being streamed.
+_stream_queue: ContextVar[Optional[asyncio.Queue]] = ContextVar(
+    "stream_queue", default=None
+)
+
+
+@contextmanager
+def capture_stream_events(queue: asyncio.Queue) -> Iterator[asyncio.Queue]:
+    """
+    Publish in queue the events emitted in the current context
+
+    Args:
+        queue: asyncio.Queue -> Queue that receives the events as dictionaries
+                                with the keys event and data
+
+    Returns:
+        Iterator[asyncio.Queue] -> The same queue
+    """
+    token = _stream_queue.set(queue)
+    try:
+        yield queue
+    finally:
+        _stream_queue.reset(token)
+
+
+def emit_stream_event(event: str, data: dict[str, Any]) -> None:
+    """
+    Publish an event in the stream of the current context, does nothing if the
+    agent is not being streamed
+
+    Args:
+        event: str -> Name of the event. Ex: image_url
+        data: dict[str, Any] -> JSON serializable payload of the event
+
+    Returns:
+        None
+    """
+    queue = _stream_queue.get()
+
+    if queue is not None:
+        queue.put_nowait({"event": event, "data": data})
+
+
+def format_sse(event: str, data: dict[str, Any]) -> str:
+    """
+    Format an event as a server-sent event
+
+    Args:
+        event: str -> Name of the event
+        data: dict[str, Any] -> JSON serializable payload of the event
+
+    Returns:
+        str -> Event ready to be written in a text/event-stream response
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,62 @@
+from assistant_agent.agent import (
+    agent_registry,
+    get_model,
+    llm_config,
+    system_prompt,
+)
+from assistant_agent.tools.image_generator import generate_prompts, generate_images
+from pydantic_ai import Agent, Tool
+import argparse
+import time
+
+# Compares the cost of building the agent on every request (as the API used to do)
+# with leasing a prebuilt agent from the registry.
+# Usage: uv run python -m benchmarks.agent_construction [--iterations 1000]
+
+
+def build_agent_per_request() -> None:
+    # Same construction that generate_agent_instance did before the registry existed,
+    # the tools are wrapped again, so their schemas are generated on every call
+    Agent(
+        get_model(llm_config.AGENT_MODEL_NAME),
+        tools=[
+            Tool(generate_prompts, takes_ctx=False),
+            Tool(generate_images, takes_ctx=False),
+        ],
+        system_prompt=system_prompt,
+    )
+
+
+def lease_prebuilt_agent() -> None:
+    with agent_registry.lease():
+        pass
+
+
+def measure(function, iterations: int) -> float:
+    """
+    Mean time of a call in microseconds
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Agent construction cost per request")
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    agent_registry.prebuild()
+
+    results = {
+        "build per request": measure(build_agent_per_request, args.iterations),
+        "lease from registry": measure(lease_prebuilt_agent, args.iterations),
+    }
+
+    for name, microseconds in results.items():
+        print(f"{name:<22} {microseconds:>10.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
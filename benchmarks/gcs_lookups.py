@@ -0,0 +1,205 @@
+from assistant_agent.utils.gcp import gcs
+from types import SimpleNamespace
+from typing import Iterator, Optional
+import argparse
+import bisect
+import time
+
+# Compares the existence check of an object that the GCS utilities used to make
+# (listing every object of the bucket) with the lookup of the object, cached or not,
+# and the listing of a prefix, on a local fake of GCS with many objects. Each request
+# to the fake can wait --latency-ms to simulate the round trip to GCS.
+# Usage: uv run python -m benchmarks.gcs_lookups [--objects 100000] [--latency-ms 0]
+
+BUCKET_NAME = "benchmark_bucket"
+# Maximum objects per page of the GCS list API
+MAX_PAGE_SIZE = 1000
+
+
+class FakeGCS:
+    """
+    Storage client that keeps the names of the objects of a single bucket in memory
+    """
+
+    def __init__(self, names: list[str], latency_seconds: float):
+        self.names = sorted(names)
+        self.existing = set(names)
+        self.latency_seconds = latency_seconds
+        self.requests = 0
+
+    def request(self) -> None:
+        self.requests += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def bucket(self, bucket_name: str) -> "FakeBucket":
+        return FakeBucket(self, bucket_name)
+
+    def list_blobs(
+        self,
+        bucket_name: str,
+        prefix: Optional[str] = None,
+        max_results: Optional[int] = None,
+        page_token: Optional[str] = None,
+    ) -> "FakeBlobIterator":
+        return FakeBlobIterator(self, prefix or "", max_results, page_token)
+
+
+class FakeBucket:
+    def __init__(self, gcs: FakeGCS, name: str):
+        self.gcs = gcs
+        self.name = name
+
+    def exists(self) -> bool:
+        self.gcs.request()
+        return self.name == BUCKET_NAME
+
+    def blob(self, blob_name: str) -> "FakeBlob":
+        return FakeBlob(self.gcs, blob_name)
+
+
+class FakeBlob:
+    def __init__(self, gcs: FakeGCS, name: str):
+        self.gcs = gcs
+        self.name = name
+
+    def exists(self) -> bool:
+        self.gcs.request()
+        return self.name in self.gcs.existing
+
+
+class FakeBlobIterator:
+    """
+    Pages of the names that start with prefix, one request per page
+    """
+
+    def __init__(
+        self,
+        gcs: FakeGCS,
+        prefix: str,
+        max_results: Optional[int],
+        page_token: Optional[str],
+    ):
+        self.gcs = gcs
+        self.prefix = prefix
+        self.max_results = max_results
+        self.position = (
+            int(page_token) if page_token else bisect.bisect_left(gcs.names, prefix)
+        )
+        self.next_page_token: Optional[str] = None
+
+    @property
+    def pages(self) -> Iterator[list]:
+        remaining = self.max_results
+        while remaining is None or remaining > 0:
+            page_size = (
+                MAX_PAGE_SIZE if remaining is None else min(remaining, MAX_PAGE_SIZE)
+            )
+            self.gcs.request()
+
+            page = list()
+            names = self.gcs.names
+            while (
+                len(page) < page_size
+                and self.position < len(names)
+                and names[self.position].startswith(self.prefix)
+            ):
+                page.append(SimpleNamespace(name=names[self.position]))
+                self.position += 1
+
+            has_more = self.position < len(names) and names[self.position].startswith(
+                self.prefix
+            )
+            self.next_page_token = str(self.position) if has_more else None
+
+            yield page
+
+            if remaining is not None:
+                remaining -= len(page)
+            if not has_more:
+                return
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        for page in self.pages:
+            yield from page
+
+
+def listing_blob_exists(blob_name: str, bucket_name: str) -> bool:
+    # The implementation of blob_exists before the lookups: the bucket is checked
+    # and every object of the bucket is listed
+    if not gcs.client.bucket(bucket_name).exists():
+        raise ValueError(f"The bucket {bucket_name} does not exists")
+
+    blobs_name = [blob.name for blob in gcs.client.list_blobs(bucket_name)]
+
+    return blob_name in blobs_name
+
+
+def measure(fake: FakeGCS, function, iterations: int) -> tuple[float, float]:
+    """
+    Mean time of a call in milliseconds and mean requests per call
+    """
+    requests = fake.requests
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    seconds = time.perf_counter() - start
+
+    return seconds / iterations * 1e3, (fake.requests - requests) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cost of the GCS object lookups")
+    parser.add_argument("--objects", type=int, default=100_000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    names = [
+        f"genai_images/tmp/image_{number:07d}.png" for number in range(args.objects)
+    ]
+    names += [f"prompt_cache/{number:04d}.json" for number in range(1000)]
+    fake = FakeGCS(names, latency_seconds=args.latency_ms / 1e3)
+    gcs.client = fake
+
+    present = names[args.objects // 2]
+    missing = "genai_images/tmp/missing.png"
+
+    def cold_lookup(blob_name: str):
+        def lookup():
+            # Nothing cached, as in the first lookup of the object
+            gcs._existence.clear()
+            gcs.blob_exists(blob_name, BUCKET_NAME)
+
+        return lookup
+
+    results = {
+        "list the bucket (present)": measure(
+            fake, lambda: listing_blob_exists(present, BUCKET_NAME), args.iterations
+        ),
+        "list the bucket (missing)": measure(
+            fake, lambda: listing_blob_exists(missing, BUCKET_NAME), args.iterations
+        ),
+        "lookup (present)": measure(fake, cold_lookup(present), args.iterations),
+        "lookup (missing)": measure(fake, cold_lookup(missing), args.iterations),
+        "cached lookup (present)": measure(
+            fake, lambda: gcs.blob_exists(present, BUCKET_NAME), args.iterations
+        ),
+        "cached lookup (missing)": measure(
+            fake, lambda: gcs.blob_exists(missing, BUCKET_NAME), args.iterations
+        ),
+        "list a page of a prefix": measure(
+            fake,
+            lambda: gcs.list_blob_names("prompt_cache/", BUCKET_NAME, page_size=100),
+            args.iterations,
+        ),
+    }
+
+    print(f"{len(names)} objects, {args.latency_ms} ms per request")
+    print(f"{'operation':<28} {'ms/call':>10} {'requests/call':>14}")
+    for name, (milliseconds, requests) in results.items():
+        print(f"{name:<28} {milliseconds:>10.3f} {requests:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
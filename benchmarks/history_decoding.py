@@ -0,0 +1,112 @@
+from assistant_agent.utils.history_codec import HistoryCodec, decode_steps
+from pydantic_ai.messages import (
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+from pydantic_core import to_jsonable_python
+import argparse
+import json
+import time
+
+# Compares the ways of decoding a stored chat history on each turn: converting it to
+# python objects and validating them (as the API used to do), validating the stored
+# JSON, and decoding only the steps added since the previous turn of the session.
+# Usage: uv run python -m benchmarks.history_decoding [--iterations 20]
+
+
+def make_steps(number_steps: int) -> list[str]:
+    """
+    JSON of the steps of a chat history, as they are stored in the table. Each turn
+    has 4 steps: prompt, tool call, tool return and answer
+    """
+    messages = list()
+    for number in range(number_steps // 4 + 1):
+        messages += [
+            ModelRequest(parts=[UserPromptPart(content=f"Generate image {number}")]),
+            ModelResponse(
+                parts=[
+                    ToolCallPart(
+                        "generate_images",
+                        {"prompts_info": [{"prompt": "a cat " * 20}]},
+                        f"call{number}",
+                    )
+                ]
+            ),
+            ModelRequest(
+                parts=[
+                    ToolReturnPart(
+                        "generate_images",
+                        [{"image_name": f"{number}.png", "url": "https://x/y.png"}],
+                        f"call{number}",
+                    )
+                ]
+            ),
+            ModelResponse(parts=[TextPart(content="Here is your image " * 10)]),
+        ]
+
+    steps = json.loads(ModelMessagesTypeAdapter.dump_json(messages))
+    return [json.dumps(step) for step in steps[:number_steps]]
+
+
+def validate_python(steps: list[str]) -> None:
+    # The history used to be read from the database as dictionaries
+    history = [json.loads(step) for step in steps]
+    ModelMessagesTypeAdapter.validate_python(to_jsonable_python(history))
+
+
+def validate_json(steps: list[str]) -> None:
+    decode_steps(steps)
+
+
+def measure(function, iterations: int) -> float:
+    """
+    Mean time of a call in milliseconds
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chat history decoding cost per turn")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    print("Milliseconds to decode the history of a turn")
+    print(f"{'steps':>6} {'validate_python':>16} {'validate_json':>14} {'codec':>10}")
+
+    for number_steps in (10, 100, 1000):
+        steps = make_steps(number_steps + 4)
+        history, new_turn = steps[:number_steps], steps
+
+        def codec_turn() -> None:
+            # The previous turn was decoded by the codec, this turn adds 4 steps
+            codec = HistoryCodec(max_sessions=1, ttl_seconds=None)
+            codec.decode("CS1", history)
+            start = time.perf_counter()
+            codec.decode("CS1", new_turn)
+            codec_times.append(time.perf_counter() - start)
+
+        codec_times = list()
+        for _ in range(args.iterations):
+            codec_turn()
+
+        results = [
+            measure(lambda: validate_python(new_turn), args.iterations),
+            measure(lambda: validate_json(new_turn), args.iterations),
+            sum(codec_times) / len(codec_times) * 1e3,
+        ]
+
+        print(
+            f"{number_steps:>6} {results[0]:>16.2f} {results[1]:>14.2f} {results[2]:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Measures the cold start of the API: the time to import each module in a new
+# interpreter (including the modules it imports) and the clients created while
+# importing it, then the time to create all the clients in parallel as the lifespan does.
+# Usage: uv run python -m benchmarks.import_time [--runs 5] [--prewarm]
+
+MODULES = [
+    "assistant_agent.utils.gcp.clients",
+    "assistant_agent.utils.gcp.secret_manager",
+    "assistant_agent.utils.gcp.gcs",
+    "assistant_agent.utils.gcp.bigquery",
+    "assistant_agent.credentials",
+    "assistant_agent.tools.image_generator",
+    "assistant_agent.agent",
+    "assistant_agent.memory",
+    "app.backend.main",
+]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+from assistant_agent.utils.gcp.clients import client_registry
+created = [name for name, created in client_registry.stats().items() if created]
+print(json.dumps({"seconds": seconds, "created": created}))
+"""
+
+PREWARM_SCRIPT = """
+import json, time
+import app.backend.main
+from assistant_agent.utils.gcp.clients import client_registry
+start = time.perf_counter()
+errors = client_registry.prewarm()
+print(json.dumps({"seconds": time.perf_counter() - start, "errors": errors}))
+"""
+
+
+def run_script(script: str, *arguments: str) -> dict:
+    """
+    Run a script in a new interpreter and get the JSON that it prints
+    """
+    completed = subprocess.run(
+        [sys.executable, "-c", script, *arguments],
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import time of the API modules")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--prewarm",
+        action="store_true",
+        help="Also create the clients, needs Google credentials",
+    )
+    args = parser.parse_args()
+
+    print(f"{'module':<42} {'median ms':>10} {'min ms':>8}  clients created")
+
+    for module in MODULES:
+        try:
+            results = [run_script(IMPORT_SCRIPT, module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<42} failed: {e}")
+            continue
+
+        times = [result["seconds"] * 1e3 for result in results]
+        created = ", ".join(results[-1]["created"]) or "-"
+        print(
+            f"{module:<42} {statistics.median(times):>10.1f} {min(times):>8.1f}  {created}"
+        )
+
+    if args.prewarm:
+        result = run_script(PREWARM_SCRIPT)
+        print(f"\nprewarm of all the clients: {result['seconds'] * 1e3:.1f} ms")
+        for name, error in result["errors"].items():
+            print(f"  {name:<16} {'ok' if error is None else error}")
+
+
+if __name__ == "__main__":
+    main()
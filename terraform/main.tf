@@ -49,6 +49,9 @@ resource "google_cloud_run_v2_service" "agent_api_instance" {
           memory = "2Gi"
           cpu    = "1"
         }
+        # The agent jobs run after the request that submits them returns, with
+        # request-based billing the CPU would be throttled between requests
+        cpu_idle = false
       }
     }
     scaling {
@@ -67,6 +70,19 @@ resource "google_cloud_run_v2_service_iam_member" "agent_api_instance_auth" {
   member   = "allUsers"
 }
 
+# The API signs the URLs of the generated images through the IAM API (signBlob), as
+# the service account of the container. Signing as itself also needs this role
+resource "google_service_account_iam_member" "agent_api_url_signer" {
+  service_account_id = "projects/${var.gcp_project_id}/serviceAccounts/${var.gcp_dev_sa}"
+  role               = "roles/iam.serviceAccountTokenCreator"
+  member             = "serviceAccount:${var.gcp_dev_sa}"
+}
+
+resource "google_project_service" "iam_credentials_api" {
+  service            = "iamcredentials.googleapis.com"
+  disable_on_destroy = false
+}
+
 #################### CLOUD RUN - AGENT UI #######################
 
 resource "google_cloud_run_v2_service" "agent_ui_instance" {
@@ -186,6 +202,14 @@ resource "google_bigquery_table" "ai_agent_chat_sessions_table" {
     env = "default"
   }
 
+  # Same layout as BQTableLayoutConfig in assistant_agent/config.py, the existing
+  # tables are rebuilt with it by make migrate-tables
+  time_partitioning {
+    type  = "DAY"
+    field = "created_at"
+  }
+  clustering = ["user_id", "chat_session_id"]
+
   schema = <<EOF
 
 [
@@ -220,6 +244,14 @@ resource "google_bigquery_table" "ai_agent_prompts_table" {
     env = "default"
   }
 
+  # Same layout as BQTableLayoutConfig in assistant_agent/config.py, the existing
+  # tables are rebuilt with it by make migrate-tables
+  time_partitioning {
+    type  = "DAY"
+    field = "created_at"
+  }
+  clustering = ["chat_session_id", "prompt_id"]
+
   schema = <<EOF
 
 [
@@ -265,6 +297,14 @@ resource "google_bigquery_table" "ai_agent_steps_table" {
     env = "default"
   }
 
+  # Same layout as BQTableLayoutConfig in assistant_agent/config.py, the existing
+  # tables are rebuilt with it by make migrate-tables
+  time_partitioning {
+    type  = "DAY"
+    field = "created_at"
+  }
+  clustering = ["chat_session_id", "prompt_id"]
+
   schema = <<EOF
 
 [
@@ -301,3 +341,55 @@ resource "google_bigquery_table" "ai_agent_steps_table" {
 ]
 EOF
 }
+
+resource "google_bigquery_table" "ai_agent_session_summaries_table" {
+  dataset_id = google_bigquery_dataset.ai_agent_dataset.dataset_id
+  table_id   = var.session_summaries_table_id
+
+  labels = {
+    env = "default"
+  }
+
+  # Same layout as BQTableLayoutConfig in assistant_agent/config.py
+  time_partitioning {
+    type  = "DAY"
+    field = "created_at"
+  }
+  clustering = ["chat_session_id"]
+
+  schema = <<EOF
+
+[
+  {
+    "name": "summary_id",
+    "type": "STRING",
+    "mode": "REQUIRED",
+    "description": "Id of the summary"
+  },
+  {
+    "name": "chat_session_id",
+    "type": "STRING",
+    "mode": "REQUIRED",
+    "description": "Id of the chat session summarized"
+  },
+  {
+    "name": "created_at",
+    "type": "TIMESTAMP",
+    "mode": "REQUIRED",
+    "description": "Time when the summary was created"
+  },
+  {
+    "name": "summary",
+    "type": "STRING",
+    "mode": "REQUIRED",
+    "description": "Summary of the first turns of the chat session"
+  },
+  {
+    "name": "summarized_turns",
+    "type": "INTEGER",
+    "mode": "REQUIRED",
+    "description": "Number of turns, from the start of the session, included in the summary"
+  }
+]
+EOF
+}
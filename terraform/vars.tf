@@ -113,3 +113,9 @@ variable "agent_steps_table_id" {
   description = "Name of the BigQuery table that contains the prompts of the chats"
   default     = "agent_steps"
 }
+
+variable "session_summaries_table_id" {
+  type        = string
+  description = "Name of the BigQuery table that contains the summaries of the chat sessions"
+  default     = "session_summaries"
+}
@@ -0,0 +1,55 @@
+from assistant_agent.database.tables.bigquery import (
+    BQAgentStepsTable,
+    BQChatSessionsTable,
+    BQPromptsTable,
+    BQSessionSummariesTable,
+    BQUsersTable,
+)
+from assistant_agent.utils.gcp.bigquery import (
+    build_query_parameters,
+    estimate_query_bytes,
+)
+from google.cloud import bigquery
+import pytest
+
+USER_ID = "UID2505ABC123"
+CHAT_SESSION_ID = "CS2505ABC123-001"
+
+# Queries of the tables and the parameters they need. The dry runs are validated
+# by BigQuery against the real tables, without running them or billing them
+QUERIES = [
+    (BQUsersTable, "email_in_table", {"email": "user@example.com"}),
+    (BQUsersTable, "get_user_data", {"user_id": USER_ID}),
+    (BQChatSessionsTable, "get_user_sessions", {"user_id": USER_ID}),
+    (
+        BQPromptsTable,
+        "get_prompts_from_user_session",
+        {"user_id": USER_ID, "chat_session_id": CHAT_SESSION_ID},
+    ),
+    (
+        BQAgentStepsTable,
+        "get_chat_session_history",
+        {"chat_session_id": CHAT_SESSION_ID},
+    ),
+    (
+        BQSessionSummariesTable,
+        "get_latest_summary",
+        {"chat_session_id": CHAT_SESSION_ID},
+    ),
+]
+
+
+@pytest.mark.bigquery
+@pytest.mark.parametrize(
+    "table_class, query_name, parameters",
+    QUERIES,
+    ids=[f"{table.__name__}.{name}" for table, name, _ in QUERIES],
+)
+def test_query_is_valid(table_class, query_name, parameters):
+    table = table_class()
+    sql = table._queries[query_name].format(**table._query_identifiers())
+
+    estimate_query_bytes(
+        sql,
+        bigquery.QueryJobConfig(query_parameters=build_query_parameters(parameters)),
+    )
@@ -0,0 +1,127 @@
+from assistant_agent.database.tables.bigquery import BQAgentStepsTable
+from assistant_agent.database.tables.bigquery import agent_history
+from assistant_agent.database.tables.bigquery.session_summaries import summaries_cache
+from assistant_agent.utils.history_codec import history_codec
+from assistant_agent.utils.metrics import metrics
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+
+CHAT_SESSION_ID = "CS2505ABC123-001"
+
+
+class Row(dict):
+    """
+    Row of a query, read by key and by attribute like the BigQuery rows
+    """
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+class FakeDataset:
+    """
+    agent_steps table seen by BigQuery, it counts the queries run by name
+    """
+
+    def __init__(self):
+        self.steps = list()
+        self.queries = list()
+        self.table = BQAgentStepsTable()
+
+    def add_step(self, step_data: str) -> None:
+        self.steps.append(
+            Row(
+                step_id=f"AST2505ABC123001-{len(self.steps) + 1:03d}",
+                created_at=datetime.now(timezone.utc),
+                step_data=step_data,
+            )
+        )
+
+    def run_query(self, query_name, sql_identifiers=None, **parameters):
+        self.queries.append(query_name)
+
+        if query_name == "count_session_steps":
+            return iter([SimpleNamespace(steps_count=len(self.steps))])
+
+        return iter(list(self.steps))
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    dataset = FakeDataset()
+    table = dataset.table
+    monkeypatch.setattr(table, "_run_query", dataset.run_query)
+    monkeypatch.setattr(table, "_pending_rows", lambda *args, **kwargs: list())
+    monkeypatch.setattr(table._sessions_table, "session_exists", lambda *args: True)
+    agent_history.history_cache.clear()
+    metrics.reset()
+
+    return dataset
+
+
+def test_cached_history_is_used_while_it_has_every_step(dataset):
+    dataset.add_step('{"step": 1}')
+
+    assert dataset.table.get_chat_session_history(CHAT_SESSION_ID) == ['{"step": 1}']
+    assert dataset.table.get_chat_session_history(CHAT_SESSION_ID) == ['{"step": 1}']
+    assert dataset.queries == ["get_chat_session_history", "count_session_steps"]
+
+
+def test_steps_added_by_another_instance_make_the_history_stale(dataset):
+    dataset.add_step('{"step": 1}')
+    dataset.table.get_chat_session_history(CHAT_SESSION_ID)
+
+    # Another instance answers the next turn of the session
+    dataset.add_step('{"step": 2}')
+
+    assert dataset.table.get_chat_session_history(CHAT_SESSION_ID) == [
+        '{"step": 1}',
+        '{"step": 2}',
+    ]
+    assert dataset.queries == [
+        "get_chat_session_history",
+        "count_session_steps",
+        "get_chat_session_history",
+    ]
+    assert metrics.get_counter("chat_history_stale") == 1
+
+
+def test_stale_histories_invalidate_the_decoded_messages(dataset):
+    dataset.add_step('{"kind": "request", "parts": []}')
+    history_codec.decode(
+        CHAT_SESSION_ID, dataset.table.get_chat_session_history(CHAT_SESSION_ID)
+    )
+
+    dataset.add_step('{"kind": "response", "parts": []}')
+    dataset.table.get_chat_session_history(CHAT_SESSION_ID)
+
+    # Nothing left to invalidate
+    assert not history_codec.invalidate(CHAT_SESSION_ID)
+
+
+def test_stale_histories_invalidate_the_summary(dataset):
+    dataset.add_step('{"step": 1}')
+    dataset.table.get_chat_session_history(CHAT_SESSION_ID)
+    summaries_cache.put(CHAT_SESSION_ID, "summary of the first turns")
+
+    dataset.table.get_chat_session_history(CHAT_SESSION_ID)
+    assert summaries_cache.get(CHAT_SESSION_ID) == "summary of the first turns"
+
+    # Another instance answers the next turn and stores a newer summary
+    dataset.add_step('{"step": 2}')
+    dataset.table.get_chat_session_history(CHAT_SESSION_ID)
+
+    assert summaries_cache.get(CHAT_SESSION_ID) is None
+
+
+def test_the_validation_can_be_disabled(dataset, monkeypatch):
+    monkeypatch.setattr(
+        agent_history.history_cache_config, "HISTORY_CACHE_VALIDATION_ENABLED", False
+    )
+    dataset.add_step('{"step": 1}')
+    dataset.table.get_chat_session_history(CHAT_SESSION_ID)
+    dataset.add_step('{"step": 2}')
+
+    assert dataset.table.get_chat_session_history(CHAT_SESSION_ID) == ['{"step": 1}']
+    assert dataset.queries == ["get_chat_session_history"]
@@ -0,0 +1,200 @@
+from assistant_agent.database import id_allocator
+from assistant_agent.database.id_allocator import (
+    GCSSequenceBackend,
+    IDAllocator,
+    SequenceBackend,
+)
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.exceptions import TooManyRequests
+import pytest
+
+
+class InMemoryBackend(SequenceBackend):
+    """
+    Shared backend kept in memory, it represents the GCS objects
+    """
+
+    def __init__(self):
+        self.last_numbers = dict()
+
+    def reserve(self, sequence_key, count, seed):
+        last_number = self.last_numbers.get(sequence_key)
+        if last_number is None:
+            last_number = seed()
+        self.last_numbers[sequence_key] = last_number + count
+        return last_number + 1
+
+
+def test_sequence_is_seeded_once():
+    """
+    The seed function is only called the first time a sequence is used
+    """
+    seed_calls = list()
+
+    def seed():
+        seed_calls.append(1)
+        return 7
+
+    allocator = IDAllocator()
+
+    assert allocator.next_number("prompts/CS1", seed) == 8
+    assert allocator.next_numbers("prompts/CS1", seed, count=3) == [9, 10, 11]
+    assert len(seed_calls) == 1
+
+
+def test_new_parent_does_not_need_seed():
+    """
+    The sequences of a parent created by the process start in 1 without calling the seed
+    """
+
+    def seed():
+        raise AssertionError("The seed must not be called")
+
+    allocator = IDAllocator()
+    allocator.mark_new_parent("agent_steps/PID1")
+
+    assert allocator.next_numbers("agent_steps/PID1", seed, count=2) == [1, 2]
+
+
+def test_concurrent_allocations_are_unique():
+    """
+    Concurrent threads never get the same number
+    """
+    allocator = IDAllocator()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        numbers = list(
+            executor.map(
+                lambda _: allocator.next_number("chat_sessions/UID1", lambda: 0),
+                range(200),
+            )
+        )
+
+    assert sorted(numbers) == list(range(1, 201))
+
+
+def test_processes_sharing_a_backend_get_unique_numbers():
+    """
+    Two allocators (two API instances) using the same backend do not repeat numbers
+    """
+    backend = InMemoryBackend()
+    first_instance = IDAllocator(backend=backend)
+    second_instance = IDAllocator(backend=backend)
+
+    numbers = [
+        first_instance.next_number("prompts/CS1", lambda: 2),
+        second_instance.next_number("prompts/CS1", lambda: 2),
+        first_instance.next_number("prompts/CS1", lambda: 2),
+    ]
+
+    assert numbers == [3, 4, 5]
+
+
+def test_local_sequences_do_not_use_the_backend():
+    """
+    Sequences that are not shared are allocated only in memory
+    """
+    backend = InMemoryBackend()
+    allocator = IDAllocator(backend=backend)
+
+    allocator.next_number("agent_steps/PID1", lambda: 0, shared=False)
+
+    assert backend.last_numbers == {}
+
+
+def test_sequences_in_use_are_not_evicted():
+    """
+    A sequence is only evicted when nobody is between its lookup and the end of its use
+    """
+    allocator = IDAllocator(max_sequences=1)
+
+    with allocator._use_sequence("prompts/CS1") as first_sequence:
+        with allocator._use_sequence("prompts/CS2"):
+            pass
+
+        assert allocator._sequences["prompts/CS1"] is first_sequence
+
+    with allocator._use_sequence("prompts/CS3"):
+        pass
+
+    assert list(allocator._sequences) == ["prompts/CS3"]
+
+
+def test_gcs_backend_does_not_read_the_sequence_it_wrote(monkeypatch):
+    """
+    The object is only read again if another process wrote it in between
+    """
+    objects = dict()
+    requests = list()
+
+    def get_text_with_generation(blob_name, bucket_name):
+        requests.append("read")
+        return objects.get(blob_name, (None, 0))
+
+    def upload_text_if_generation_match(blob_name, text, bucket_name, generation):
+        requests.append("write")
+        if objects.get(blob_name, (None, 0))[1] != generation:
+            return None
+        objects[blob_name] = (text, generation + 1)
+        return generation + 1
+
+    monkeypatch.setattr(
+        id_allocator, "get_text_with_generation", get_text_with_generation
+    )
+    monkeypatch.setattr(
+        id_allocator, "upload_text_if_generation_match", upload_text_if_generation_match
+    )
+    first_instance = GCSSequenceBackend(bucket_name="bucket")
+    second_instance = GCSSequenceBackend(bucket_name="bucket")
+
+    assert first_instance.reserve("prompts/CS1", 1, lambda: 0) == 1
+    assert first_instance.reserve("prompts/CS1", 1, lambda: 0) == 2
+    assert requests == ["read", "write", "write"]
+
+    assert second_instance.reserve("prompts/CS1", 1, lambda: 0) == 3
+    # The generation known by the first instance is stale now
+    assert first_instance.reserve("prompts/CS1", 1, lambda: 0) == 4
+
+
+def test_gcs_backend_retries_the_rate_limited_writes(monkeypatch):
+    """
+    A write rejected by the rate limit of the object is retried after reading it again
+    """
+    objects = {"id_sequences/prompts/CS1.json": ('{"last": 4}', 7)}
+    writes = list()
+
+    def upload_text_if_generation_match(blob_name, text, bucket_name, generation):
+        writes.append(generation)
+        if len(writes) == 1:
+            raise TooManyRequests("The object exceeded the rate limit")
+        objects[blob_name] = (text, generation + 1)
+        return generation + 1
+
+    monkeypatch.setattr(
+        id_allocator,
+        "get_text_with_generation",
+        lambda blob_name, bucket_name: objects[blob_name],
+    )
+    monkeypatch.setattr(
+        id_allocator, "upload_text_if_generation_match", upload_text_if_generation_match
+    )
+    backend = GCSSequenceBackend(bucket_name="bucket", backoff_seconds=0)
+
+    assert backend.reserve("prompts/CS1", 1, lambda: 0) == 5
+    assert writes == [7, 7]
+
+
+def test_gcs_backend_gives_up_after_the_retries(monkeypatch):
+    def upload_text_if_generation_match(blob_name, text, bucket_name, generation):
+        raise TooManyRequests("The object exceeded the rate limit")
+
+    monkeypatch.setattr(
+        id_allocator, "get_text_with_generation", lambda *args: (None, 0)
+    )
+    monkeypatch.setattr(
+        id_allocator, "upload_text_if_generation_match", upload_text_if_generation_match
+    )
+    backend = GCSSequenceBackend(bucket_name="bucket", max_retries=3, backoff_seconds=0)
+
+    with pytest.raises(ValueError, match="after 3 attempts"):
+        backend.reserve("prompts/CS1", 1, lambda: 0)
@@ -0,0 +1,96 @@
+from assistant_agent.database import migrate_tables
+from assistant_agent.database.migrate_tables import has_expected_layout
+from assistant_agent.utils.gcp import bigquery as bq
+from google.cloud import bigquery
+from google.api_core.exceptions import BadRequest, Conflict, NotFound
+import pytest
+import sys
+
+
+class FakeClient:
+    def __init__(self):
+        self.created_tables = list()
+        self.error = None
+
+    def get_table(self, table_id):
+        raise NotFound(table_id)
+
+    def create_table(self, table):
+        self.created_tables.append(table)
+        if self.error is not None:
+            raise self.error
+        return table
+
+
+def test_create_table_with_layout(monkeypatch):
+    fake_client = FakeClient()
+    monkeypatch.setattr(bq, "client", fake_client)
+
+    bq.create_table(
+        table_name="prompts",
+        dataset_name="dataset",
+        project_id="project",
+        schema={"prompt_id": "STRING", "created_at": "TIMESTAMP"},
+        partition_field="created_at",
+        partition_expiration_days=2,
+        clustering_fields=["chat_session_id"],
+    )
+    bq.invalidate_metadata("dataset", "project", "prompts")
+
+    table = fake_client.created_tables[0]
+    assert table.time_partitioning.field == "created_at"
+    assert table.time_partitioning.expiration_ms == 2 * 24 * 60 * 60 * 1000
+    assert table.clustering_fields == ["chat_session_id"]
+
+
+def test_has_expected_layout():
+    table = bigquery.Table("project.dataset.prompts")
+
+    assert not has_expected_layout(table, ["chat_session_id", "prompt_id"])
+
+    table.time_partitioning = bigquery.TimePartitioning(field="created_at")
+    table.clustering_fields = ["chat_session_id", "prompt_id"]
+
+    assert has_expected_layout(table, ["chat_session_id", "prompt_id"])
+    assert not has_expected_layout(table, ["user_id"])
+
+
+def test_create_table_raises_the_errors_except_conflicts(monkeypatch):
+    fake_client = FakeClient()
+    monkeypatch.setattr(bq, "client", fake_client)
+
+    fake_client.error = Conflict("Already Exists: Table project:dataset.prompts")
+    bq.create_table("prompts", "dataset", "project", {"prompt_id": "STRING"})
+
+    fake_client.error = BadRequest("The field created_at does not exist")
+    with pytest.raises(BadRequest):
+        bq.create_table(
+            "prompts",
+            "dataset",
+            "project",
+            {"prompt_id": "STRING"},
+            partition_field="created_at",
+        )
+
+
+def test_missing_tables_are_skipped(monkeypatch):
+    migrated = list()
+    monkeypatch.setattr(
+        migrate_tables,
+        "get_table_metadata",
+        lambda table_name, *args, **kwargs: (
+            None if table_name == "session_summaries" else object()
+        ),
+    )
+    monkeypatch.setattr(
+        migrate_tables,
+        "migrate_table",
+        lambda table_name, **kwargs: migrated.append(table_name),
+    )
+    monkeypatch.setattr(
+        sys, "argv", ["migrate_tables", "--tables", "prompts", "session_summaries"]
+    )
+
+    migrate_tables.main()
+
+    assert migrated == ["prompts"]
@@ -0,0 +1,122 @@
+from assistant_agent.utils.gcp import bigquery_queries
+from assistant_agent.database.tables.bigquery import BQPromptsTable
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+
+USER_ID = "UID2505ABC123"
+CHAT_SESSION_ID = "CS2505ABC123-001"
+
+
+class FakeRows(list):
+    total_bytes_processed = 0
+
+
+def session_row(
+    user_found=True, session_owner=USER_ID, prompt_id=None, created_at=None
+):
+    return SimpleNamespace(
+        user_found=user_found,
+        session_owner=session_owner,
+        prompt_id=prompt_id,
+        chat_session_id=CHAT_SESSION_ID if prompt_id else None,
+        created_at=(created_at or datetime.now(timezone.utc)) if prompt_id else None,
+        prompt="prompt" if prompt_id else None,
+        response="response" if prompt_id else None,
+    )
+
+
+@pytest.fixture
+def prompts_table(monkeypatch):
+    table = BQPromptsTable()
+    monkeypatch.setattr(table, "_pending_rows", lambda *args, **kwargs: list())
+    return table
+
+
+def test_prompts_are_read_in_one_query(monkeypatch, prompts_table):
+    queries = list()
+
+    def fake_query_data(query, parameters=None, short_query=False, operation=None):
+        queries.append((query, parameters))
+        return FakeRows(
+            [
+                session_row(prompt_id="PID2505ABC123001-0001"),
+                session_row(prompt_id="PID2505ABC123001-0002"),
+            ]
+        )
+
+    monkeypatch.setattr(bigquery_queries, "query_data", fake_query_data)
+
+    prompts = prompts_table.get_prompts_from_user_session(USER_ID, CHAT_SESSION_ID)
+
+    assert [prompt.prompt_id for prompt in prompts] == [
+        "PID2505ABC123001-0001",
+        "PID2505ABC123001-0002",
+    ]
+    assert len(queries) == 1
+    # The values are passed as parameters, not formatted into the SQL
+    assert queries[0][1] == {"user_id": USER_ID, "chat_session_id": CHAT_SESSION_ID}
+    assert CHAT_SESSION_ID not in queries[0][0]
+
+
+@pytest.mark.parametrize(
+    "row, error",
+    [
+        (session_row(user_found=False, session_owner=None), "user_id"),
+        (session_row(session_owner=None), "chat_session_id does not exists"),
+        (session_row(session_owner="UID2505XYZ789"), "is not of the user_id"),
+    ],
+)
+def test_errors_are_told_apart(monkeypatch, prompts_table, row, error):
+    monkeypatch.setattr(
+        bigquery_queries, "query_data", lambda *args, **kwargs: FakeRows([row])
+    )
+
+    with pytest.raises(ValueError, match=error):
+        prompts_table.get_prompts_from_user_session(USER_ID, CHAT_SESSION_ID)
+
+
+def test_session_without_prompts(monkeypatch, prompts_table):
+    monkeypatch.setattr(
+        bigquery_queries,
+        "query_data",
+        lambda *args, **kwargs: FakeRows([session_row()]),
+    )
+
+    assert prompts_table.get_prompts_from_user_session(USER_ID, CHAT_SESSION_ID) == []
+
+
+def test_pending_prompts_are_ordered_by_creation(monkeypatch, prompts_table):
+    # Prompts of another instance can have a lower number although they are newer
+    monkeypatch.setattr(
+        bigquery_queries,
+        "query_data",
+        lambda *args, **kwargs: FakeRows(
+            [
+                session_row(
+                    prompt_id="PID2505ABC123001-0005",
+                    created_at=datetime(2025, 5, 1, 10, 0, tzinfo=timezone.utc),
+                )
+            ]
+        ),
+    )
+    monkeypatch.setattr(
+        prompts_table,
+        "_pending_rows",
+        lambda *args, **kwargs: [
+            {
+                "prompt_id": "PID2505ABC123001-0002",
+                "chat_session_id": CHAT_SESSION_ID,
+                "created_at": "2025-05-01 10:01:00",
+                "prompt": "prompt",
+                "response": "response",
+            }
+        ],
+    )
+
+    prompts = prompts_table.get_prompts_from_user_session(USER_ID, CHAT_SESSION_ID)
+
+    assert [prompt.prompt_id for prompt in prompts] == [
+        "PID2505ABC123001-0005",
+        "PID2505ABC123001-0002",
+    ]
@@ -0,0 +1,105 @@
+from assistant_agent.database.tables.bigquery import (
+    BQAgentStepsTable,
+    BQChatSessionsTable,
+    BQPromptsTable,
+    BQSessionSummariesTable,
+    BQUsersTable,
+)
+from collections import defaultdict
+import pytest
+import re
+
+TABLES = [
+    BQUsersTable,
+    BQChatSessionsTable,
+    BQPromptsTable,
+    BQAgentStepsTable,
+    BQSessionSummariesTable,
+]
+
+# <from|join> <source> [as] <alias>, the source is a table or a subquery
+SOURCE = re.compile(
+    r"\b(from|(?:left|right|full)(?:\s+outer)?\s+join|(?:inner\s+)?join)\s+"
+    r"(\([^()]*\)|[\w.`-]+)\s+(?:as\s+)?(?!where\b|on\b)(\w+)",
+    flags=re.IGNORECASE,
+)
+# Equality between two columns: <alias>.<column> = <alias>.<column>
+COLUMN_EQUALITY = re.compile(r"\b(\w+)\.\w+\s*=\s*(\w+)\.\w+")
+KEYWORDS = re.compile(
+    r"\b(where|group|order|limit|left|right|full|inner|join)\b", flags=re.IGNORECASE
+)
+
+
+def outer_joins_without_equality(sql: str) -> list[str]:
+    """
+    Outer joins whose condition is not an equality between columns of both sides.
+    BigQuery rejects them with "LEFT OUTER JOIN cannot be used without a condition
+    that is an equality of fields from both sides of the join"
+    """
+    invalid = list()
+    aliases = list()
+
+    for match in SOURCE.finditer(sql):
+        kind, alias = match.group(1).lower(), match.group(3)
+
+        if kind.split()[0] in ("left", "right", "full"):
+            condition = sql[match.end() :].lstrip()
+            assert condition.lower().startswith("on"), f"Join without on: {alias}"
+            # The condition ends where the next clause starts
+            end = KEYWORDS.search(condition, 2)
+            condition = condition[: end.start() if end else None]
+
+            for left, right in COLUMN_EQUALITY.findall(condition):
+                other = {left, right} - {alias}
+                if alias in (left, right) and other and other.pop() in aliases:
+                    break
+            else:
+                invalid.append(alias)
+
+        aliases.append(alias)
+
+    return invalid
+
+
+def table_queries() -> list[tuple[str, str]]:
+    """
+    SQL of every query of the tables, with the identifiers of each table. The extra
+    identifiers of the base queries (Ex: {id_column}) keep a placeholder name
+    """
+    queries = list()
+    for table_class in TABLES:
+        table = table_class()
+        identifiers = defaultdict(lambda: "placeholder", table._query_identifiers())
+
+        for query_name, template in table._queries.items():
+            queries.append(
+                (
+                    f"{table_class.__name__}.{query_name}",
+                    template.format_map(identifiers),
+                )
+            )
+
+    return queries
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [sql for _, sql in table_queries()],
+    ids=[name for name, _ in table_queries()],
+)
+def test_outer_joins_are_on_an_equality_of_both_sides(sql):
+    assert outer_joins_without_equality(sql) == []
+
+
+def test_outer_joins_on_a_parameter_are_rejected():
+    # get_prompts_from_user_session before the anchor carried the chat_session_id
+    sql = """
+        select 1
+        from unnest([1]) as anchor
+        left join project.dataset.chat_sessions as sessions
+            on sessions.chat_session_id = @chat_session_id
+        left join project.dataset.prompts as prompts
+            on prompts.chat_session_id = sessions.chat_session_id
+    """
+
+    assert outer_joins_without_equality(sql) == ["sessions"]
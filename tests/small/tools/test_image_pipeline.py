@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from types import SimpleNamespace
+import asyncio
+import pytest
+
+# The Gemini API key is only read when the genai client is created
+from assistant_agent.tools import image_generator
+from assistant_agent.tools import image_cache as image_cache_module
+
+
+@pytest.fixture
+def fake_gcs(monkeypatch):
+    blobs = dict()
+
+    def get_blob_metadata(blob_name, bucket_name):
+        blob = blobs.get(blob_name)
+        return None if isinstance(blob, str) else blob
+
+    def get_text_with_generation(blob_name, bucket_name):
+        return blobs.get(blob_name), 1
+
+    def upload_file_from_memory(blob_name, string_data, bucket_name):
+        blobs[blob_name] = string_data
+
+    def get_image_url(blob_name, bucket_name):
+        return f"https://storage.googleapis.com/{bucket_name}/{blob_name}"
+
+    monkeypatch.setattr(image_cache_module, "get_blob_metadata", get_blob_metadata)
+    monkeypatch.setattr(
+        image_cache_module, "get_text_with_generation", get_text_with_generation
+    )
+    monkeypatch.setattr(
+        image_cache_module, "upload_file_from_memory", upload_file_from_memory
+    )
+    monkeypatch.setattr(image_cache_module, "get_image_url", get_image_url)
+    monkeypatch.setattr(image_generator, "image_cache", image_cache_module.ImageCache())
+
+    return blobs
+
+
+@pytest.fixture
+def fake_stages(monkeypatch, fake_gcs):
+    calls = list()
+
+    async def generate_image(prompt, general_image_name):
+        calls.append(("generate", general_image_name))
+        # The first image is the slowest one
+        await asyncio.sleep(0.2 if general_image_name == "slow" else 0.01)
+        if prompt == "fails":
+            raise ValueError("quota exceeded")
+        return {
+            "image_name": f"genai_images/tmp/{general_image_name}.png",
+            "image_bytes": BytesIO(b"png"),
+        }
+
+    async def upload_image(image_name, image_bytes, metadata=None):
+        calls.append(("upload", image_name))
+        await asyncio.sleep(0.01)
+        fake_gcs[image_name] = SimpleNamespace(
+            metadata=metadata, time_created=datetime.now(timezone.utc)
+        )
+        return f"https://storage.googleapis.com/bucket/{image_name}"
+
+    monkeypatch.setattr(image_generator, "generate_image", generate_image)
+    monkeypatch.setattr(image_generator, "upload_image", upload_image)
+
+    return calls
+
+
+def test_each_image_is_uploaded_as_soon_as_it_is_generated(fake_stages):
+    results = asyncio.run(
+        image_generator.generate_images(
+            [
+                {"prompt": "a", "image_name": "slow"},
+                {"prompt": "b", "image_name": "fast"},
+            ]
+        )
+    )
+
+    assert [result.image_name for result in results] == ["slow", "fast"]
+    assert all(result.url and result.error is None for result in results)
+    # The fast image does not wait for the slow one to be generated
+    assert fake_stages.index(("upload", "genai_images/tmp/fast.png")) < (
+        fake_stages.index(("upload", "genai_images/tmp/slow.png"))
+    )
+    assert results[0].generation_seconds >= 0.2
+    assert results[0].upload_seconds is not None
+
+
+def test_failed_images_are_returned_with_the_stage_that_failed(fake_stages):
+    results = asyncio.run(
+        image_generator.generate_images(
+            [
+                {"prompt": "fails", "image_name": "broken"},
+                {"prompt": "b", "image_name": "fast"},
+            ]
+        )
+    )
+
+    assert results[0].url is None
+    assert results[0].failed_stage == "generation"
+    assert results[0].error == "quota exceeded"
+    assert ("upload", "genai_images/tmp/broken.png") not in fake_stages
+    assert results[1].url is not None
+
+
+def test_images_of_the_same_prompt_are_reused(fake_stages):
+    prompts_info = [{"prompt": "a", "image_name": "waves"}]
+
+    first_results = asyncio.run(image_generator.generate_images(prompts_info))
+    second_results = asyncio.run(image_generator.generate_images(prompts_info))
+
+    assert not first_results[0].cached
+    assert second_results[0].cached
+    assert second_results[0].url == first_results[0].url
+    assert fake_stages.count(("generate", "waves")) == 1
+
+    # Unless the user asks for new variations
+    third_results = asyncio.run(
+        image_generator.generate_images(prompts_info, new_variations=True)
+    )
+    assert not third_results[0].cached
+    assert fake_stages.count(("generate", "waves")) == 2
+
+
+def test_reused_images_are_returned_with_the_name_of_their_object(fake_stages):
+    asyncio.run(
+        image_generator.generate_images([{"prompt": "a", "image_name": "waves"}])
+    )
+    results = asyncio.run(
+        image_generator.generate_images([{"prompt": "a", "image_name": "sea"}])
+    )
+
+    assert results[0].cached
+    assert results[0].image_name == "sea"
+    assert results[0].blob_name == "genai_images/tmp/waves.png"
+    assert results[0].url.endswith("/genai_images/tmp/waves.png")
+
+
+def test_the_index_of_the_images_is_shared_through_gcs(
+    fake_stages, fake_gcs, monkeypatch
+):
+    asyncio.run(
+        image_generator.generate_images([{"prompt": "a", "image_name": "waves"}])
+    )
+
+    # Another instance, or the same one after a restart
+    monkeypatch.setattr(image_generator, "image_cache", image_cache_module.ImageCache())
+    results = asyncio.run(
+        image_generator.generate_images([{"prompt": "a", "image_name": "waves"}])
+    )
+
+    assert results[0].cached
+    assert results[0].blob_name == "genai_images/tmp/waves.png"
+    assert fake_stages.count(("generate", "waves")) == 1
+
+
+def test_overwritten_or_expiring_images_are_not_reused(fake_stages, fake_gcs):
+    asyncio.run(
+        image_generator.generate_images([{"prompt": "a", "image_name": "waves"}])
+    )
+
+    # Another prompt stored its image with the same name
+    asyncio.run(
+        image_generator.generate_images([{"prompt": "b", "image_name": "waves"}])
+    )
+    results = asyncio.run(
+        image_generator.generate_images([{"prompt": "a", "image_name": "waves"}])
+    )
+    assert not results[0].cached
+
+    # The image will be deleted by the lifecycle rule soon
+    fake_gcs["genai_images/tmp/waves.png"].time_created -= timedelta(hours=23)
+    results = asyncio.run(
+        image_generator.generate_images([{"prompt": "a", "image_name": "waves"}])
+    )
+    assert not results[0].cached
+
+
+def test_concurrent_generations_of_a_prompt_share_the_call(monkeypatch):
+    calls = list()
+
+    class FakeScheduler:
+        async def call(self, model, request):
+            calls.append(model)
+            await asyncio.sleep(0.01)
+            return SimpleNamespace(
+                generated_images=[
+                    SimpleNamespace(image=SimpleNamespace(image_bytes=b"png"))
+                ]
+            )
+
+    monkeypatch.setattr(image_generator, "genai_scheduler", FakeScheduler())
+
+    async def run():
+        return await asyncio.gather(
+            image_generator.generate_image("a photo of waves", "waves"),
+            image_generator.generate_image("a photo of waves", "more_waves"),
+        )
+
+    first_image, second_image = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert first_image["image_name"].endswith("waves.png")
+    assert second_image["image_name"].endswith("more_waves.png")
+    # Each caller reads its own stream
+    assert first_image["image_bytes"] is not second_image["image_bytes"]
+    assert first_image["image_bytes"].read() == second_image["image_bytes"].read()
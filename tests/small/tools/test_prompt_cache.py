@@ -0,0 +1,75 @@
+from assistant_agent.tools.prompt_cache import (
+    PromptCache,
+    PromptCacheBackend,
+    prompt_cache_key,
+)
+from typing import Optional
+import asyncio
+import time
+
+
+class FakeBackend(PromptCacheBackend):
+    def __init__(self):
+        self.prompts: dict[str, tuple[str, float]] = dict()
+        self.reads = 0
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        self.reads += 1
+        return self.prompts.get(key)
+
+    def put(self, key: str, prompt: str) -> None:
+        self.prompts[key] = (prompt, time.time())
+
+
+def test_key_ignores_spacing_but_not_the_case_or_the_model():
+    key = prompt_cache_key("Waves in the sea", "gemini", 0.05, "instruction")
+
+    assert key == prompt_cache_key(
+        "  Waves in  the sea ", "gemini", 0.05, "instruction"
+    )
+    assert prompt_cache_key(
+        'A poster with the text "SALE"', "gemini", 0.05, "instruction"
+    ) != prompt_cache_key(
+        'A poster with the text "sale"', "gemini", 0.05, "instruction"
+    )
+    assert key != prompt_cache_key(
+        "Waves in the sea", "gemini-pro", 0.05, "instruction"
+    )
+    assert key != prompt_cache_key("Waves in the sea", "gemini", 0.8, "instruction")
+    assert key != prompt_cache_key(
+        "Waves in the sea", "gemini", 0.05, "new instruction"
+    )
+
+
+def test_prompts_are_served_from_memory_then_from_the_backend():
+    backend = FakeBackend()
+    first_instance = PromptCache(backend=backend, max_entries=10, ttl_seconds=60)
+    second_instance = PromptCache(backend=backend, max_entries=10, ttl_seconds=60)
+
+    async def run():
+        assert await first_instance.get("key") is None
+        await first_instance.put("key", "A photo of waves")
+
+        assert await first_instance.get("key") == "A photo of waves"
+        assert backend.reads == 1
+
+        # Another instance finds it in the backend and then in its memory
+        assert await second_instance.get("key") == "A photo of waves"
+        assert await second_instance.get("key") == "A photo of waves"
+        assert backend.reads == 2
+
+    asyncio.run(run())
+
+    assert first_instance.stats()["misses"] == 1
+    assert first_instance.stats()["hit_rate"] == 0.5
+    assert second_instance.stats()["backend_hits"] == 1
+    assert second_instance.stats()["memory_hits"] == 1
+
+
+def test_expired_prompts_in_the_backend_are_ignored():
+    backend = FakeBackend()
+    backend.prompts["key"] = ("old prompt", time.time() - 120)
+    cache = PromptCache(backend=backend, max_entries=10, ttl_seconds=60)
+
+    assert asyncio.run(cache.get("key")) is None
+    assert cache.stats()["misses"] == 1
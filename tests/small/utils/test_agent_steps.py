@@ -0,0 +1,42 @@
+from assistant_agent.schemas import AgentStep
+from assistant_agent.utils.agent_auxiliars import serialize_agent_steps
+from assistant_agent.utils.history_codec import decode_steps
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+import json
+
+
+def make_history(number_turns: int) -> list:
+    history = list()
+    for number in range(number_turns):
+        history += [
+            ModelRequest(parts=[UserPromptPart(content=f"prompt {number}")]),
+            ModelResponse(parts=[TextPart(content=f"answer {number}")]),
+        ]
+    return history
+
+
+def test_only_the_messages_of_the_run_are_serialized():
+    agent = Agent(TestModel(custom_output_text="new answer"))
+    history = make_history(5)
+
+    # The agent only receives a window of the history
+    result = agent.run_sync("new prompt", message_history=history[-2:])
+    steps = serialize_agent_steps(result.new_messages())
+
+    assert len(steps) == 2
+    assert decode_steps(steps) == result.new_messages()
+    assert decode_steps(steps)[0].parts[0].content == "new prompt"
+    assert decode_steps(steps)[-1].parts[0].content == "new answer"
+
+
+def test_agent_steps_keep_the_serialized_step_data():
+    step = json.dumps({"kind": "request", "parts": []})
+
+    agent_step = AgentStep(step_data=step)
+    assert agent_step.step_data is step
+    assert agent_step.model_dump(include={"step_data"}) == {"step_data": step}
+
+    # Dictionaries are serialized when the step is created
+    assert AgentStep(step_data={"kind": "request"}).step_data == '{"kind": "request"}'
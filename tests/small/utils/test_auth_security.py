@@ -0,0 +1,15 @@
+from app.backend import auth_security
+from fastapi import HTTPException
+import asyncio
+import pytest
+
+
+def test_only_the_admin_users_can_read_the_metrics(monkeypatch):
+    monkeypatch.setattr(auth_security.api_config, "METRICS_ADMIN_USER_IDS", ["UID1"])
+
+    assert asyncio.run(auth_security.get_admin_user_id_from_token("UID1")) == "UID1"
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(auth_security.get_admin_user_id_from_token("UID2"))
+
+    assert error.value.status_code == 403
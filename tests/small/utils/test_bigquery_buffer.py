@@ -0,0 +1,133 @@
+from assistant_agent.utils.gcp.bigquery_buffer import BigQueryWriteBuffer
+import threading
+import pytest
+
+
+class FakeInsert:
+    """
+    Records the calls that the write buffer makes to insert_rows
+    """
+
+    def __init__(self):
+        self.calls = list()
+        self.lock = threading.Lock()
+
+    def __call__(self, table_name, dataset_name, project_id, rows):
+        with self.lock:
+            self.calls.append((table_name, list(rows)))
+
+
+def test_rows_are_coalesced_per_table():
+    """
+    Rows of different submits to the same table are inserted in one call
+    """
+    fake_insert = FakeInsert()
+    write_buffer = BigQueryWriteBuffer(
+        max_batch_age_seconds=60, insert_function=fake_insert
+    )
+
+    write_buffer.submit("prompts", "dataset", "project", [{"prompt_id": "1"}])
+    write_buffer.submit("prompts", "dataset", "project", [{"prompt_id": "2"}])
+    write_buffer.submit("agent_steps", "dataset", "project", [{"step_id": "1"}])
+
+    assert fake_insert.calls == []
+    assert len(write_buffer.pending_rows("prompts", "dataset", "project")) == 2
+
+    write_buffer.flush()
+
+    assert sorted(fake_insert.calls) == [
+        ("agent_steps", [{"step_id": "1"}]),
+        ("prompts", [{"prompt_id": "1"}, {"prompt_id": "2"}]),
+    ]
+    assert write_buffer.queued_rows == 0
+    assert write_buffer.pending_rows("prompts", "dataset", "project") == []
+
+
+def test_flush_by_row_count_splits_batches():
+    """
+    A batch bigger than max_batch_rows is inserted in several requests
+    """
+    fake_insert = FakeInsert()
+    write_buffer = BigQueryWriteBuffer(
+        max_batch_rows=2, max_batch_age_seconds=60, insert_function=fake_insert
+    )
+    write_buffer.start()
+
+    write_buffer.submit("prompts", "dataset", "project", [{"n": i} for i in range(5)])
+    write_buffer.close()
+
+    assert [len(rows) for _, rows in fake_insert.calls] == [2, 2, 1]
+
+
+def test_backpressure_rejects_when_full():
+    """
+    When the buffer is full and nobody flushes it, submit fails after the timeout
+    """
+    write_buffer = BigQueryWriteBuffer(
+        max_queued_rows=2,
+        max_batch_age_seconds=60,
+        enqueue_timeout_seconds=0.05,
+        insert_function=FakeInsert(),
+    )
+
+    write_buffer.submit("prompts", "dataset", "project", [{"n": 1}, {"n": 2}])
+
+    with pytest.raises(ValueError, match="full"):
+        write_buffer.submit("prompts", "dataset", "project", [{"n": 3}])
+
+
+def test_failed_flush_is_retried():
+    """
+    A failed insert is retried before dropping the rows
+    """
+    attempts = list()
+
+    def flaky_insert(table_name, dataset_name, project_id, rows):
+        attempts.append(rows)
+        if len(attempts) == 1:
+            raise ValueError("Temporary error")
+
+    write_buffer = BigQueryWriteBuffer(
+        max_batch_age_seconds=60, flush_retries=1, insert_function=flaky_insert
+    )
+    write_buffer.submit("prompts", "dataset", "project", [{"n": 1}])
+    write_buffer.flush()
+
+    assert len(attempts) == 2
+    assert write_buffer.queued_rows == 0
+
+
+def test_rows_that_cannot_be_inserted_go_to_the_dead_letter():
+    """
+    The rows are kept in the dead letter and the shutdown is not reported as clean
+    """
+    dead_letters = list()
+
+    def failing_insert(table_name, dataset_name, project_id, rows):
+        raise ValueError("Permanent error")
+
+    def dead_letter(table_name, dataset_name, project_id, rows):
+        dead_letters.append((table_name, rows))
+        return "gs://bucket/dead_letter.jsonl"
+
+    write_buffer = BigQueryWriteBuffer(
+        max_batch_age_seconds=60,
+        flush_retries=0,
+        insert_function=failing_insert,
+        dead_letter_function=dead_letter,
+    )
+    write_buffer.submit("prompts", "dataset", "project", [{"n": 1}])
+
+    assert write_buffer.close() is False
+    assert dead_letters == [("prompts", [{"n": 1}])]
+    assert write_buffer.failed_rows == 1
+
+
+def test_clean_shutdown():
+    write_buffer = BigQueryWriteBuffer(
+        max_batch_age_seconds=60, insert_function=FakeInsert()
+    )
+    write_buffer.start()
+    write_buffer.submit("prompts", "dataset", "project", [{"n": 1}])
+
+    assert write_buffer.close() is True
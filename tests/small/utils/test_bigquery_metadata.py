@@ -0,0 +1,58 @@
+from assistant_agent.utils.gcp import bigquery as bq
+from google.api_core.exceptions import NotFound
+from google.cloud.bigquery import SchemaField, Table
+import pytest
+
+
+class FakeClient:
+    """
+    Counts the metadata requests that reach BigQuery
+    """
+
+    def __init__(self, existing_tables: set):
+        self.existing_tables = existing_tables
+        self.get_table_calls = 0
+
+    def get_table(self, table_id):
+        self.get_table_calls += 1
+        if table_id not in self.existing_tables:
+            raise NotFound(table_id)
+        return Table(table_id, schema=[SchemaField("user_id", "STRING", "REQUIRED")])
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    fake = FakeClient({"project.dataset.users"})
+    monkeypatch.setattr(bq, "client", fake)
+    bq._tables_metadata.clear()
+    yield fake
+    bq._tables_metadata.clear()
+
+
+def test_table_metadata_is_cached(fake_client):
+    assert bq.table_exists("users", "dataset", "project")
+    assert bq.table_exists("users", "dataset", "project")
+    assert bq.get_table_schema("users", "dataset", "project")[0].name == "user_id"
+
+    assert fake_client.get_table_calls == 1
+
+
+def test_missing_tables_are_not_cached(fake_client):
+    assert not bq.table_exists("prompts", "dataset", "project")
+
+    fake_client.existing_tables.add("project.dataset.prompts")
+
+    assert bq.table_exists("prompts", "dataset", "project")
+
+
+def test_validate_rows():
+    schema = [
+        SchemaField("user_id", "STRING", "REQUIRED"),
+        SchemaField("tags", "STRING", "REPEATED"),
+    ]
+
+    assert bq.validate_rows([{"user_id": "1", "tags": ["a"]}], schema) == []
+
+    errors = bq.validate_rows([{"tags": "a", "unknown": 1}], schema)
+
+    assert len(errors) == 3
@@ -0,0 +1,171 @@
+from assistant_agent.database.tables.bigquery import BQUsersTable
+from assistant_agent.utils.gcp import bigquery, bigquery_queries
+from assistant_agent.utils.metrics import metrics
+from assistant_agent.utils.gcp.bigquery import build_query_parameters
+from assistant_agent.utils.gcp.bigquery_queries import QueryEngine
+from datetime import datetime, timezone
+import pytest
+
+
+class FakeRows(list):
+    total_bytes_processed = 100
+
+
+class EmptyRowIterator:
+    """
+    RowIterator of a query without results
+    """
+
+    total_bytes_processed = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raise StopIteration
+
+
+def test_register_is_idempotent():
+    engine = QueryEngine()
+
+    first = engine.register("users.by_email", "select 1 where @email = ''")
+    second = engine.register("users.by_email", "select 1 where @email = ''")
+
+    assert first is second
+
+    with pytest.raises(ValueError):
+        engine.register("users.by_email", "select 2")
+
+
+def test_run_binds_parameters_and_records_stats(monkeypatch):
+    calls = list()
+
+    def fake_query_data(query, parameters=None, short_query=False, operation=None):
+        calls.append((query, parameters, short_query))
+        return FakeRows([1])
+
+    monkeypatch.setattr(bigquery_queries, "query_data", fake_query_data)
+
+    engine = QueryEngine()
+    engine.register("users.by_email", "select 1 where email = @email", True)
+
+    engine.run("users.by_email", email="a@b.com")
+    engine.run("users.by_email", email="c@d.com")
+
+    assert calls[1] == ("select 1 where email = @email", {"email": "c@d.com"}, True)
+
+    stats = engine.stats()["users.by_email"]
+    assert stats["calls"] == 2
+    assert stats["total_bytes_processed"] == 200
+
+
+def test_parameter_types_are_inferred():
+    parameters = build_query_parameters(
+        {
+            "name": "abc",
+            "count": 1,
+            "enabled": True,
+            "created_at": datetime.now(timezone.utc),
+            "ids": ["a", "b"],
+        }
+    )
+
+    types = {parameter.name: parameter.to_api_repr() for parameter in parameters}
+
+    assert types["name"]["parameterType"]["type"] == "STRING"
+    assert types["count"]["parameterType"]["type"] == "INT64"
+    assert types["enabled"]["parameterType"]["type"] == "BOOL"
+    assert types["created_at"]["parameterType"]["type"] == "TIMESTAMP"
+    assert types["ids"]["parameterType"]["arrayType"]["type"] == "STRING"
+
+
+class FakeClient:
+    """
+    Records which BigQuery API was used to run each query
+    """
+
+    def __init__(self):
+        self.paths = list()
+
+    def query_and_wait(self, query, job_config=None):
+        self.paths.append("short")
+        rows = FakeRows([1])
+        rows.job_id = None
+        return rows
+
+    def query(self, query, job_config=None):
+        self.paths.append("job")
+
+        class FakeJob:
+            total_bytes_billed = 10485760
+            slot_millis = 5
+            cache_hit = False
+
+            def result(self):
+                rows = FakeRows([1])
+                rows.job_id = "job_1"
+                return rows
+
+        return FakeJob()
+
+
+def test_short_queries_skip_the_job(monkeypatch):
+    fake_client = FakeClient()
+    monkeypatch.setattr(bigquery, "client", fake_client)
+    metrics.reset()
+
+    bigquery.query_data("select 1", short_query=True)
+    bigquery.query_data("select 1")
+
+    assert fake_client.paths == ["short", "job"]
+    assert metrics.get_counter("bq_queries_without_job") == 1
+
+    snapshot = metrics.snapshot()["histograms"]
+    assert snapshot["bq_query_path_seconds{path=short}"]["count"] == 1
+    assert snapshot["bq_query_path_seconds{path=job}"]["count"] == 1
+
+
+def test_query_cost_is_recorded_per_operation(monkeypatch):
+    monkeypatch.setattr(bigquery, "client", FakeClient())
+    metrics.reset()
+
+    bigquery.query_data("select 1", operation="BQUsersTable.get_user_data")
+
+    labels = {"operation": "BQUsersTable.get_user_data"}
+    assert metrics.get_counter("bq_bytes_billed", labels) == 10485760
+    assert metrics.get_counter("bq_slot_millis", labels) == 5
+
+    last_query = bigquery.get_recent_query_costs()[-1]
+    assert last_query["job_id"] == "job_1"
+    assert last_query["operation"] == "BQUsersTable.get_user_data"
+
+
+def test_dry_run_guard_rejects_expensive_queries(monkeypatch):
+    monkeypatch.setattr(bigquery, "client", FakeClient())
+    monkeypatch.setattr(bigquery.cost_config, "BQ_DRY_RUN_GUARD_ENABLED", True)
+    monkeypatch.setattr(bigquery.cost_config, "BQ_DRY_RUN_MAX_BYTES", 10)
+    monkeypatch.setattr(bigquery, "estimate_query_bytes", lambda *args: 100)
+
+    with pytest.raises(ValueError, match="budget"):
+        bigquery.query_data("select 1")
+
+
+def test_table_queries_with_other_identifiers_are_registered_apart(monkeypatch):
+    queries = list()
+
+    def fake_query_data(query, parameters=None, short_query=False, operation=None):
+        queries.append(query)
+        return EmptyRowIterator()
+
+    monkeypatch.setattr(bigquery_queries, "query_data", fake_query_data)
+    table = BQUsersTable()
+
+    for table_name in ["users", "session_summaries"]:
+        table._id_in_table(
+            primary_key_row_value="ID1",
+            primary_key_column_name="id",
+            table_name=table_name,
+        )
+
+    assert "session_summaries" not in queries[0]
+    assert f"{table.dataset_id}.session_summaries" in queries[1]
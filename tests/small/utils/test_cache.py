@@ -0,0 +1,60 @@
+from assistant_agent.utils.cache import LRUCache
+import time
+
+
+def test_least_recently_used_entry_is_evicted():
+    """
+    When the cache is full, the entry that was used the longest time ago is removed
+    """
+    cache = LRUCache(name="test", max_entries=2)
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.evictions == 1
+
+
+def test_entries_are_evicted_by_size():
+    """
+    The total size of the entries never exceeds max_bytes
+    """
+    cache = LRUCache(name="test", max_entries=10, max_bytes=10, size_function=len)
+
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    cache.put("c", "123")
+
+    assert "a" not in cache
+    assert cache.total_bytes == 8
+
+
+def test_entries_expire():
+    """
+    An entry is not returned after its ttl
+    """
+    cache = LRUCache(name="test", max_entries=10, ttl_seconds=0.01)
+
+    cache.put("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_update_only_cached_entries():
+    """
+    update changes the cached value in place and does nothing for missing keys
+    """
+    cache = LRUCache(name="test", max_entries=10, size_function=len)
+
+    cache.put("history", ["step_1"])
+
+    assert cache.update("history", lambda steps: steps + ["step_2"], size_delta=1)
+    assert not cache.update("other", lambda steps: steps + ["step_2"])
+    assert cache.get("history") == ["step_1", "step_2"]
+    assert cache.total_bytes == 2
+    assert cache.stats()["hit_rate"] == 1.0
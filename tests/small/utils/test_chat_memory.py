@@ -0,0 +1,131 @@
+from assistant_agent.memory import ChatMemoryManager
+from assistant_agent.utils.chat_memory import (
+    build_memory_window,
+    render_turns,
+    split_into_turns,
+)
+from pydantic_ai.messages import (
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+import asyncio
+
+
+def make_turn(number: int, with_tool: bool = False) -> list:
+    """
+    Messages of a turn: the user prompt, optionally a tool call and its return,
+    and the answer of the agent
+    """
+    messages = [ModelRequest(parts=[UserPromptPart(content=f"prompt {number}")])]
+
+    if with_tool:
+        messages += [
+            ModelResponse(
+                parts=[
+                    ToolCallPart("generate_images", {"prompt": "x"}, f"call{number}")
+                ]
+            ),
+            ModelRequest(
+                parts=[ToolReturnPart("generate_images", ["url"], f"call{number}")]
+            ),
+        ]
+
+    messages.append(ModelResponse(parts=[TextPart(content=f"answer {number}")]))
+
+    return messages
+
+
+def make_history(number_turns: int) -> list:
+    history = list()
+    for number in range(number_turns):
+        history += make_turn(number, with_tool=number % 2 == 0)
+
+    # The first request of a session contains the system prompt
+    history[0] = ModelRequest(
+        parts=[SystemPromptPart(content="system"), *history[0].parts]
+    )
+
+    return history
+
+
+def test_tool_calls_stay_in_their_turn():
+    turns = split_into_turns(make_history(3))
+
+    assert [len(turn) for turn in turns] == [4, 2, 4]
+
+
+def test_window_keeps_last_turns_and_system_prompt():
+    window = build_memory_window(
+        make_history(6), memory_limit=2, summary="previous", summarized_turns=4
+    )
+
+    assert len(split_into_turns(window)) == 2
+    assert window[0].parts[0].content == "system"
+    assert window[0].parts[2].content == "prompt 4"
+    # The tool call of the turn 4 keeps its tool return
+    assert isinstance(window[2].parts[0], ToolReturnPart)
+
+
+def test_without_summary_the_turns_are_kept_up_to_twice_the_limit():
+    history = make_history(3)
+
+    # Nothing covers the first turn, so it is not dropped
+    assert build_memory_window(history, memory_limit=2) is history
+
+    window = build_memory_window(make_history(6), memory_limit=2)
+
+    assert len(split_into_turns(window)) == 4
+    assert window[0].parts[0].content == "system"
+    assert window[0].parts[1].content == "prompt 2"
+
+
+def test_window_adds_the_summary():
+    window = build_memory_window(
+        make_history(6), memory_limit=2, summary="previous", summarized_turns=4
+    )
+
+    assert len(split_into_turns(window)) == 2
+    assert "previous" in window[0].parts[1].content
+
+
+def test_turns_not_summarized_yet_are_kept():
+    window = build_memory_window(
+        make_history(6), memory_limit=2, summary="previous", summarized_turns=3
+    )
+
+    assert len(split_into_turns(window)) == 3
+
+
+def test_window_is_built_without_summary_if_it_cannot_be_read():
+    class FailingSummariesTable:
+        async def get_latest_summary(self, chat_session_id):
+            raise ValueError("Not found: Table session_summaries")
+
+    manager = ChatMemoryManager(
+        summaries_table=FailingSummariesTable(), memory_limit=2, summary_enabled=True
+    )
+    window = asyncio.run(manager.get_memory_window("CS1", make_history(6)))
+
+    assert len(split_into_turns(window)) == 4
+
+
+def test_short_history_is_not_modified():
+    history = make_history(2)
+
+    assert build_memory_window(history, memory_limit=5) is history
+
+
+def test_render_turns():
+    text = render_turns(split_into_turns(make_history(1)))
+
+    assert text.splitlines() == [
+        "User: prompt 0",
+        'Assistant called generate_images({"prompt":"x"})',
+        'generate_images returned: ["url"]',
+        "Assistant: answer 0",
+    ]
@@ -0,0 +1,74 @@
+from assistant_agent.utils.gcp.clients import ClientRegistry
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+
+class FakeClient:
+    def query(self, sql: str) -> str:
+        return f"rows of {sql}"
+
+
+def test_clients_are_created_once_on_first_use():
+    registry = ClientRegistry()
+    created = list()
+
+    def factory():
+        created.append(1)
+        time.sleep(0.01)
+        return FakeClient()
+
+    client = registry.register("fake", factory)
+    assert created == list()
+    assert registry.stats() == {"fake": False}
+
+    # Concurrent first uses create a single client
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: client.get(), range(8)))
+
+    assert len(created) == 1
+    assert all(other is clients[0] for other in clients)
+    # The attributes of the client are used through the lazy client
+    assert client.query("users") == "rows of users"
+    assert registry.stats() == {"fake": True}
+
+
+def test_prewarm_creates_the_clients_in_parallel():
+    registry = ClientRegistry()
+    barrier = threading.Barrier(2, timeout=1)
+
+    def factory():
+        # Only passes if both clients are being created at the same time
+        barrier.wait()
+        return FakeClient()
+
+    def failing_factory():
+        raise ValueError("no credentials")
+
+    registry.register("first", factory)
+    registry.register("second", factory)
+    registry.register("failing", failing_factory)
+
+    errors = registry.prewarm(timeout=1)
+
+    assert errors == {"first": None, "second": None, "failing": "no credentials"}
+    assert registry.stats() == {"first": True, "second": True, "failing": False}
+
+
+def test_prewarm_does_not_wait_beyond_the_timeout():
+    registry = ClientRegistry()
+    release = threading.Event()
+
+    def slow_factory():
+        release.wait(1)
+        return FakeClient()
+
+    client = registry.register("slow", slow_factory)
+
+    start = time.perf_counter()
+    assert registry.prewarm(timeout=0.05) == {"slow": "Timed out"}
+    assert time.perf_counter() - start < 0.5
+
+    # The client is still created, the first use waits for it
+    release.set()
+    assert isinstance(client.get(), FakeClient)
@@ -0,0 +1,94 @@
+from assistant_agent.utils.cache import LRUCache
+from assistant_agent.utils.gcp import gcs
+from google.api_core.exceptions import NotFound
+from types import SimpleNamespace
+import pytest
+
+BUCKET_NAME = "bucket"
+
+
+class FakeStorageClient:
+    def __init__(self, names: list[str]):
+        self.names = sorted(names)
+        self.requests = list()
+
+    def bucket(self, bucket_name: str):
+        client = self
+
+        class Blob:
+            def __init__(self, name):
+                self.name = name
+
+            def exists(self):
+                client.requests.append(("exists", self.name))
+                return self.name in client.names
+
+            def download_as_bytes(self):
+                client.requests.append(("download", self.name))
+                if self.name not in client.names:
+                    raise NotFound(self.name)
+                return b"data"
+
+        return SimpleNamespace(
+            exists=lambda: client.requests.append(("bucket", bucket_name)) or True,
+            blob=Blob,
+        )
+
+    def list_blobs(self, bucket_name, prefix, max_results, page_token):
+        self.requests.append(("list", prefix))
+        start = int(page_token or 0)
+        names = [name for name in self.names if name.startswith(prefix)]
+        page = names[start : start + max_results]
+        next_token = start + max_results
+        return SimpleNamespace(
+            pages=iter([[SimpleNamespace(name=name) for name in page]]),
+            next_page_token=str(next_token) if next_token < len(names) else None,
+        )
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    client = FakeStorageClient(["images/a.png", "images/b.png", "other/c.json"])
+    monkeypatch.setattr(gcs, "client", client)
+    monkeypatch.setattr(gcs, "_buckets", LRUCache(name="buckets", max_entries=10))
+    monkeypatch.setattr(
+        gcs, "_existence", LRUCache(name="existence", max_entries=10, ttl_seconds=60)
+    )
+    return client
+
+
+def test_blob_exists_looks_up_the_object_and_caches_the_result(fake_client):
+    assert gcs.blob_exists("images/a.png", BUCKET_NAME)
+    assert not gcs.blob_exists("images/missing.png", BUCKET_NAME)
+
+    # The bucket is checked once and the results are reused
+    assert gcs.blob_exists("images/a.png", BUCKET_NAME)
+    assert not gcs.blob_exists("images/missing.png", BUCKET_NAME)
+    assert fake_client.requests == [
+        ("bucket", BUCKET_NAME),
+        ("exists", "images/a.png"),
+        ("exists", "images/missing.png"),
+    ]
+
+
+def test_get_file_of_a_deleted_object_updates_the_cache(fake_client):
+    assert gcs.blob_exists("images/a.png", BUCKET_NAME)
+    fake_client.names.remove("images/a.png")
+
+    with pytest.raises(ValueError):
+        gcs.get_file("images/a.png", BUCKET_NAME)
+
+    # Known to be missing without another lookup
+    assert not gcs.blob_exists("images/a.png", BUCKET_NAME)
+    assert fake_client.requests.count(("exists", "images/a.png")) == 1
+
+
+def test_the_names_of_a_prefix_are_listed_by_pages(fake_client):
+    names, page_token = gcs.list_blob_names("images/", BUCKET_NAME, page_size=1)
+    assert names == ["images/a.png"]
+    assert page_token is not None
+
+    assert list(gcs.iter_blob_names("images/", BUCKET_NAME, page_size=1)) == [
+        "images/a.png",
+        "images/b.png",
+    ]
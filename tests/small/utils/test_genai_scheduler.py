@@ -0,0 +1,111 @@
+from assistant_agent.utils.genai_scheduler import (
+    GenAIScheduler,
+    GenAIThrottledError,
+    current_genai_user,
+)
+from google.genai import errors as genai_errors
+import asyncio
+import pytest
+
+MODEL = "imagen-test"
+
+
+def throttled() -> genai_errors.ClientError:
+    return genai_errors.ClientError(
+        429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}
+    )
+
+
+def make_scheduler(**kwargs) -> GenAIScheduler:
+    parameters = {
+        "max_concurrency": {MODEL: 4},
+        "retry_base_seconds": 0.001,
+        "retry_max_seconds": 0.002,
+        "deadline_seconds": 1,
+    }
+    parameters.update(kwargs)
+    return GenAIScheduler(**parameters)
+
+
+def test_throttled_calls_are_retried_and_decrease_the_limit():
+    scheduler = make_scheduler()
+    attempts = list()
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise throttled()
+        return "image"
+
+    assert asyncio.run(scheduler.call(MODEL, request)) == "image"
+    assert len(attempts) == 3
+    # Halved once per throttled call, then a success adds 1/limit
+    assert scheduler.stats()[MODEL]["limit"] == pytest.approx(1 + 1 / 1)
+    assert scheduler.stats()[MODEL]["in_flight"] == 0
+
+
+def test_calls_fail_with_throttled_error_after_the_retries():
+    scheduler = make_scheduler(max_retries=2)
+
+    async def request():
+        raise throttled()
+
+    with pytest.raises(GenAIThrottledError):
+        asyncio.run(scheduler.call(MODEL, request))
+
+    assert scheduler.stats()[MODEL]["in_flight"] == 0
+
+
+def test_other_errors_are_not_retried():
+    scheduler = make_scheduler()
+    attempts = list()
+
+    async def request():
+        attempts.append(1)
+        raise ValueError("invalid prompt")
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.call(MODEL, request))
+
+    assert len(attempts) == 1
+
+
+def test_calls_waiting_beyond_the_deadline_are_rejected():
+    scheduler = make_scheduler(max_concurrency={MODEL: 1})
+
+    async def slow_request():
+        await asyncio.sleep(0.2)
+
+    async def run():
+        first_call = asyncio.create_task(scheduler.call(MODEL, slow_request))
+        await asyncio.sleep(0)
+        with pytest.raises(GenAIThrottledError):
+            await scheduler.call(MODEL, slow_request, deadline_seconds=0.05)
+        await first_call
+
+    asyncio.run(run())
+    assert scheduler.stats()[MODEL] == {"limit": 1.0, "in_flight": 0, "queued": 0}
+
+
+def test_waiting_calls_are_served_in_turns_between_users():
+    scheduler = make_scheduler(max_concurrency={MODEL: 1})
+    served = list()
+
+    async def call_as(user: str, number: int):
+        current_genai_user.set(user)
+
+        async def request():
+            served.append(f"{user}{number}")
+            await asyncio.sleep(0.01)
+
+        await scheduler.call(MODEL, request)
+
+    async def run():
+        # user_a sends a burst before user_b sends its calls
+        tasks = [asyncio.create_task(call_as("a", number)) for number in range(3)]
+        tasks += [asyncio.create_task(call_as("b", number)) for number in range(2)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert served == ["a0", "a1", "b0", "a2", "b1"]
@@ -0,0 +1,84 @@
+from assistant_agent.utils.history_codec import HistoryCodec, decode_steps
+from pydantic_ai.messages import (
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+import json
+
+
+def make_steps(number_turns: int, first_turn: int = 0) -> list[str]:
+    """
+    JSON of the steps of number_turns turns, as they are stored in the table
+    """
+    messages = list()
+    for number in range(first_turn, first_turn + number_turns):
+        messages += [
+            ModelRequest(parts=[UserPromptPart(content=f"prompt {number}")]),
+            ModelResponse(
+                parts=[ToolCallPart("generate_images", {"prompt": "x"}, f"c{number}")]
+            ),
+            ModelRequest(
+                parts=[ToolReturnPart("generate_images", ["url"], f"c{number}")]
+            ),
+            ModelResponse(parts=[TextPart(content=f"answer {number}")]),
+        ]
+
+    return [
+        json.dumps(step)
+        for step in json.loads(ModelMessagesTypeAdapter.dump_json(messages))
+    ]
+
+
+def test_decode_steps_is_equal_to_validating_the_python_objects():
+    steps = make_steps(3)
+
+    expected = ModelMessagesTypeAdapter.validate_python(
+        [json.loads(step) for step in steps]
+    )
+
+    assert decode_steps(steps) == expected
+    assert decode_steps(list()) == list()
+
+
+def test_only_the_new_steps_are_decoded():
+    codec = HistoryCodec(max_sessions=10, ttl_seconds=None)
+    steps = make_steps(2)
+
+    new_steps = make_steps(1, first_turn=2)
+
+    first_turn = codec.decode("CS1", steps)
+    second_turn = codec.decode("CS1", steps + new_steps)
+
+    # The messages of the previous turn are reused
+    assert second_turn[: len(first_turn)] == first_turn
+    assert all(a is b for a, b in zip(first_turn, second_turn))
+    assert second_turn == decode_steps(steps + new_steps)
+
+
+def test_a_history_that_changed_is_decoded_again():
+    codec = HistoryCodec(max_sessions=10, ttl_seconds=None)
+    first_turn = codec.decode("CS1", make_steps(2))
+
+    # Same length but different steps, e.g. it was read again from the database
+    other_history = make_steps(2, first_turn=5)
+    messages = codec.decode("CS1", other_history)
+
+    assert messages == decode_steps(other_history)
+    assert messages[0] is not first_turn[0]
+
+    # A shorter history is not a continuation of the cached one
+    assert codec.decode("CS1", other_history[:3]) == decode_steps(other_history[:3])
+
+
+def test_modifying_the_returned_list_does_not_change_the_cache():
+    codec = HistoryCodec(max_sessions=10, ttl_seconds=None)
+    steps = make_steps(1)
+
+    codec.decode("CS1", steps).append("not a message")
+
+    assert len(codec.decode("CS1", steps)) == len(steps)
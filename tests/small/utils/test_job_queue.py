@@ -0,0 +1,180 @@
+from assistant_agent.utils.job_queue import (
+    Job,
+    JobManager,
+    JobQueueFullError,
+    JobStore,
+    LocalJobQueueBackend,
+)
+import asyncio
+import pytest
+
+
+class MemoryJobStore(JobStore):
+    """
+    Store shared by the managers of a test, like GCS is shared by the instances
+    """
+
+    def __init__(self):
+        self.jobs = dict()
+
+    async def save(self, job):
+        self.jobs[job.job_id] = job.to_json()
+
+    async def load(self, job_id):
+        job_json = self.jobs.get(job_id)
+        return None if job_json is None else Job.from_json(job_json)
+
+
+def make_manager(handler, workers=2, max_queued=10, store=None) -> JobManager:
+    return JobManager(
+        name="test",
+        handler=handler,
+        backend=LocalJobQueueBackend(max_queued=max_queued),
+        workers=workers,
+        result_ttl_seconds=60,
+        store=store,
+        store_poll_seconds=0.01,
+    )
+
+
+def test_jobs_run_in_the_background_and_can_be_awaited():
+    async def handler(job):
+        await asyncio.sleep(0.05)
+        if job.payload["prompt"] == "fails":
+            raise ValueError("agent error")
+        return {"answer": job.payload["prompt"].upper()}
+
+    async def run():
+        manager = make_manager(handler)
+        manager.start()
+
+        job = await manager.submit("UID1", {"prompt": "hola"})
+        failed_job = await manager.submit("UID1", {"prompt": "fails"})
+        assert job.status == "queued"
+
+        # Without waiting, the current status is returned
+        assert (await manager.wait(job.job_id, "UID1", timeout=0)).status != (
+            "succeeded"
+        )
+
+        job = await manager.wait(job.job_id, "UID1", timeout=1)
+        failed_job = await manager.wait(failed_job.job_id, "UID1", timeout=1)
+        await manager.stop(timeout=1)
+
+        return job, failed_job
+
+    job, failed_job = asyncio.run(run())
+
+    assert job.status == "succeeded"
+    assert job.result == {"answer": "HOLA"}
+    assert job.started_at <= job.finished_at
+    assert failed_job.status == "failed"
+    assert failed_job.error == "agent error"
+
+
+def test_jobs_of_other_users_are_not_found():
+    async def handler(job):
+        return dict()
+
+    async def run():
+        manager = make_manager(handler)
+        job = await manager.submit("UID1", dict())
+        await manager.get(job.job_id, "UID2")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+def test_jobs_are_rejected_when_the_queue_is_full():
+    async def handler(job):
+        return dict()
+
+    async def run():
+        manager = make_manager(handler, max_queued=1)
+        await manager.submit("UID1", dict())
+        await manager.submit("UID1", dict())
+
+    with pytest.raises(JobQueueFullError):
+        asyncio.run(run())
+
+
+def test_workers_limit_the_jobs_running_at_the_same_time():
+    running = list()
+    max_running = list()
+
+    async def handler(job):
+        running.append(job.job_id)
+        max_running.append(len(running))
+        await asyncio.sleep(0.02)
+        running.remove(job.job_id)
+        return dict()
+
+    async def run():
+        manager = make_manager(handler, workers=2)
+        manager.start()
+        jobs = [await manager.submit("UID1", dict()) for _ in range(6)]
+        for job in jobs:
+            await manager.wait(job.job_id, "UID1", timeout=1)
+        await manager.stop(timeout=1)
+
+    asyncio.run(run())
+
+    assert max(max_running) == 2
+
+
+def test_the_status_of_a_job_can_be_read_from_another_instance():
+    async def handler(job):
+        await asyncio.sleep(0.05)
+        return {"answer": job.payload["prompt"].upper()}
+
+    async def run():
+        store = MemoryJobStore()
+        instance = make_manager(handler, store=store)
+        other_instance = make_manager(handler, store=store)
+        instance.start()
+
+        job = await instance.submit("UID1", {"prompt": "hola"})
+        assert (await other_instance.get(job.job_id, "UID1")).status == "queued"
+        with pytest.raises(ValueError):
+            await other_instance.get(job.job_id, "UID2")
+
+        job = await other_instance.wait(job.job_id, "UID1", timeout=1)
+        await instance.stop(timeout=1)
+
+        return job
+
+    job = asyncio.run(run())
+
+    assert job.status == "succeeded"
+    assert job.result == {"answer": "HOLA"}
+    assert job.started_at <= job.finished_at
+
+
+def test_queued_jobs_fail_when_the_workers_stop():
+    async def handler(job):
+        await asyncio.sleep(0.05)
+        return dict()
+
+    async def run():
+        store = MemoryJobStore()
+        manager = make_manager(handler, workers=1, store=store)
+        manager.start()
+
+        running_job = await manager.submit("UID1", dict())
+        queued_job = await manager.submit("UID1", dict())
+        await asyncio.sleep(0.01)
+        await manager.stop(timeout=1)
+
+        return (
+            await manager.get(running_job.job_id, "UID1"),
+            queued_job,
+            Job.from_json(store.jobs[queued_job.job_id]),
+        )
+
+    running_job, queued_job, stored_job = asyncio.run(run())
+
+    assert running_job.status == "succeeded"
+    assert queued_job.finished
+    # The clients that poll the job from any instance see that it failed
+    assert stored_job.status == "failed"
+    assert "submit it again" in stored_job.error
@@ -0,0 +1,115 @@
+from assistant_agent.utils.gcp import secret_manager
+from assistant_agent.utils.gcp.secret_manager import SecretCache
+from google.api_core.exceptions import NotFound
+from pydantic import SecretStr
+from types import SimpleNamespace
+import threading
+import pytest
+
+
+class FakeSecretManagerClient:
+    def __init__(self, secrets: dict[str, str]):
+        self.secrets = secrets
+        self.requests = list()
+
+    def access_secret_version(self, request: dict):
+        self.requests.append(request["name"])
+        if request["name"] not in self.secrets:
+            raise NotFound(request["name"])
+        data = self.secrets[request["name"]].encode("UTF-8")
+        return SimpleNamespace(payload=SimpleNamespace(data=data))
+
+
+def test_get_secret_makes_a_single_request(monkeypatch):
+    client = FakeSecretManagerClient(
+        {"projects/p/secrets/API_KEY/versions/latest": "key"}
+    )
+    monkeypatch.setattr(secret_manager, "client", client)
+
+    assert secret_manager.get_secret("API_KEY", "latest", "p").get_secret_value() == (
+        "key"
+    )
+    assert len(client.requests) == 1
+
+    # A missing secret or version is reported by the request itself
+    with pytest.raises(ValueError):
+        secret_manager.get_secret("OTHER", 1, "p")
+    assert len(client.requests) == 2
+
+
+def test_get_secrets_fetches_them_concurrently(monkeypatch):
+    barrier = threading.Barrier(2, timeout=1)
+
+    def get_secret(secret_id, version_id, project_id):
+        # Only passes if both secrets are being fetched at the same time
+        barrier.wait()
+        return SecretStr(f"{secret_id}-{version_id}")
+
+    monkeypatch.setattr(secret_manager, "get_secret", get_secret)
+
+    secrets = secret_manager.get_secrets([("A", 1), ("B", "latest")], "p")
+
+    assert {key: value.get_secret_value() for key, value in secrets.items()} == {
+        ("A", "1"): "A-1",
+        ("B", "latest"): "B-latest",
+    }
+
+
+def test_expired_secrets_are_refreshed_in_the_background():
+    values = ["first", "second"]
+    fetched = threading.Event()
+
+    def fetch(secret_id, version_id, project_id):
+        value = SecretStr(values.pop(0))
+        fetched.set()
+        return value
+
+    cache = SecretCache(ttl_seconds=0, max_workers=2, fetch_function=fetch)
+
+    assert cache.get("KEY", "latest", "p").get_secret_value() == "first"
+
+    # The cached value is returned while the new one is fetched
+    fetched.clear()
+    assert cache.get("KEY", "latest", "p").get_secret_value() == "first"
+    assert fetched.wait(1)
+    cache._executor.shutdown(wait=True)
+    assert cache._secrets[("p", "KEY", "latest")].value.get_secret_value() == "second"
+
+
+def test_prefetch_reads_each_secret_once():
+    requests = list()
+    release = threading.Event()
+
+    def fetch(secret_id, version_id, project_id):
+        requests.append(secret_id)
+        release.wait(1)
+        if secret_id == "MISSING":
+            raise ValueError("The secret does not exist")
+        return SecretStr(secret_id.lower())
+
+    cache = SecretCache(ttl_seconds=60, max_workers=4, fetch_function=fetch)
+
+    # A read that starts while the secret is being prefetched waits for the same request
+    reader = threading.Thread(target=lambda: cache.get("A", 1, "p"))
+    errors = dict()
+
+    def prefetch():
+        errors.update(
+            cache.prefetch([("A", 1), ("B", 1), ("MISSING", 1)], "p", timeout=1)
+        )
+
+    prefetcher = threading.Thread(target=prefetch)
+    prefetcher.start()
+    reader.start()
+    release.set()
+    prefetcher.join()
+    reader.join()
+
+    assert sorted(requests) == ["A", "B", "MISSING"]
+    assert errors == {
+        "A": None,
+        "B": None,
+        "MISSING": "The secret does not exist",
+    }
+    assert cache.get("B", 1, "p").get_secret_value() == "b"
+    assert len(requests) == 3
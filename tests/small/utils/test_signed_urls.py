@@ -0,0 +1,142 @@
+from app.frontend.utils import find_image_urls
+from assistant_agent.utils.gcp import gcs
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.cloud import storage
+from google.oauth2 import credentials as user_credentials
+from google.oauth2 import service_account
+from types import SimpleNamespace
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+import pytest
+
+
+@pytest.fixture
+def storage_client(monkeypatch):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    credentials = service_account.Credentials.from_service_account_info(
+        {
+            "type": "service_account",
+            "client_email": "signer@project.iam.gserviceaccount.com",
+            "private_key": private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ).decode(),
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }
+    )
+    client = storage.Client(project="project", credentials=credentials)
+
+    monkeypatch.setattr(gcs, "client", client)
+    gcs._buckets.clear()
+    gcs._existence.clear()
+    gcs._signed_urls.clear()
+
+    return client
+
+
+def test_signed_urls_are_computed_locally_and_cached(storage_client, monkeypatch):
+    # Any request to GCS would fail the test
+    monkeypatch.setattr(storage_client, "_http_internal", None)
+
+    url = gcs.get_image_url("genai_images/tmp/image.png", "bucket", mode="signed")
+    query = parse_qs(urlparse(url).query)
+
+    assert url.startswith("https://storage.googleapis.com/bucket/genai_images/tmp/")
+    assert query["X-Goog-Algorithm"] == ["GOOG4-RSA-SHA256"]
+    assert query["X-Goog-Expires"] == [
+        str(gcs.gcs_config.GCS_SIGNED_URL_EXPIRATION_SECONDS)
+    ]
+    assert "X-Goog-Signature" in query
+
+    assert gcs.get_image_url("genai_images/tmp/image.png", "bucket") == url
+    assert gcs._signed_urls.stats()["hits"] == 1
+
+
+def test_uploaded_images_are_only_made_public_in_public_mode(
+    storage_client, monkeypatch
+):
+    calls = list()
+    monkeypatch.setattr(
+        storage.Blob, "upload_from_file", lambda blob, image: calls.append("upload")
+    )
+    monkeypatch.setattr(storage.Blob, "make_public", lambda blob: calls.append("acl"))
+
+    signed_url = gcs.upload_image_from_memory("a.png", BytesIO(b"png"), "bucket")
+    public_url = gcs.upload_image_from_memory(
+        "b.png", BytesIO(b"png"), "bucket", url_mode="public"
+    )
+
+    assert calls == ["upload", "upload", "acl"]
+    assert "X-Goog-Signature=" in signed_url
+    assert public_url == "https://storage.googleapis.com/bucket/b.png"
+    assert gcs.blob_exists("a.png", "bucket")
+
+
+def test_the_frontend_keeps_the_query_of_the_signed_urls(storage_client):
+    url = gcs.get_signed_url("genai_images/tmp/image.png", "bucket")
+
+    assert find_image_urls(f"Here is your image: {url}\nEnjoy it!") == [url]
+
+
+@pytest.fixture
+def keyless_signing(storage_client, monkeypatch):
+    """
+    Credentials without a private key, the URLs can only be signed by the IAM API
+    """
+    calls = list()
+
+    def generate_signed_url(blob, **kwargs):
+        if "service_account_email" not in kwargs:
+            raise AttributeError("you need a private key to sign credentials")
+        calls.append(kwargs)
+        return f"https://storage.googleapis.com/{blob.name}?X-Goog-Signature=iam"
+
+    monkeypatch.setattr(storage.Blob, "generate_signed_url", generate_signed_url)
+    monkeypatch.setattr(gcs, "_signing_credentials", None)
+
+    return calls
+
+
+def test_urls_are_signed_by_the_service_account_of_the_credentials(
+    keyless_signing, monkeypatch
+):
+    cloud_run_credentials = SimpleNamespace(
+        valid=True,
+        token="access-token",
+        service_account_email="dev-service-account@project.iam.gserviceaccount.com",
+    )
+    monkeypatch.setattr(
+        gcs.google.auth, "default", lambda scopes: (cloud_run_credentials, "project")
+    )
+
+    gcs.get_signed_url("genai_images/tmp/image.png", "bucket")
+
+    assert keyless_signing[0]["service_account_email"] == (
+        "dev-service-account@project.iam.gserviceaccount.com"
+    )
+    assert keyless_signing[0]["access_token"] == "access-token"
+
+
+def test_user_credentials_need_a_signing_service_account(keyless_signing, monkeypatch):
+    monkeypatch.setattr(
+        gcs.google.auth,
+        "default",
+        lambda scopes: (user_credentials.Credentials(token="user-token"), "project"),
+    )
+
+    with pytest.raises(ValueError, match="GCS_SIGNING_SERVICE_ACCOUNT"):
+        gcs.get_signed_url("genai_images/tmp/image.png", "bucket")
+
+    monkeypatch.setattr(
+        gcs.gcs_config,
+        "GCS_SIGNING_SERVICE_ACCOUNT",
+        "signer@project.iam.gserviceaccount.com",
+    )
+    gcs.get_signed_url("genai_images/tmp/image.png", "bucket")
+
+    assert keyless_signing[0]["service_account_email"] == (
+        "signer@project.iam.gserviceaccount.com"
+    )
+    assert keyless_signing[0]["access_token"] == "user-token"
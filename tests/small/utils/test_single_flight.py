@@ -0,0 +1,77 @@
+from assistant_agent.utils.single_flight import SingleFlight
+import asyncio
+import pytest
+
+
+def test_concurrent_calls_with_the_same_key_share_the_result():
+    single_flight = SingleFlight("test")
+    calls = list()
+
+    async def expand(idea: str) -> str:
+        calls.append(idea)
+        await asyncio.sleep(0.01)
+        return idea.upper()
+
+    async def run():
+        return await asyncio.gather(
+            single_flight.do("waves", lambda: expand("waves")),
+            single_flight.do("waves", lambda: expand("waves")),
+            single_flight.do("sunset", lambda: expand("sunset")),
+        )
+
+    assert asyncio.run(run()) == ["WAVES", "WAVES", "SUNSET"]
+    assert calls == ["waves", "sunset"]
+    assert len(single_flight) == 0
+
+
+def test_errors_are_raised_to_every_caller():
+    single_flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("quota exceeded")
+
+    async def run():
+        return await asyncio.gather(
+            single_flight.do("key", fail),
+            single_flight.do("key", fail),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+
+    assert [str(result) for result in results] == ["quota exceeded"] * 2
+    assert len(single_flight) == 0
+
+
+def test_the_call_is_cancelled_only_when_every_caller_is_cancelled():
+    single_flight = SingleFlight("test")
+
+    async def run():
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "image"
+
+        first = asyncio.create_task(single_flight.do("key", slow))
+        second = asyncio.create_task(single_flight.do("key", slow))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()
+
+        second.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled.is_set()
+
+        with pytest.raises(asyncio.CancelledError):
+            await second
+
+    asyncio.run(run())
+    assert len(single_flight) == 0
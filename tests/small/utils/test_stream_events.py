@@ -0,0 +1,68 @@
+from app.frontend.utils import iter_sse_events
+from assistant_agent.utils.agent_auxiliars import stream_agent_run
+from assistant_agent.utils.stream_events import (
+    capture_stream_events,
+    emit_stream_event,
+    format_sse,
+)
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+import asyncio
+
+
+def drain(queue: asyncio.Queue) -> list[dict]:
+    events = list()
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_emit_outside_a_stream_does_nothing():
+    emit_stream_event("image_url", {"url": "https://example.com/a.png"})
+
+
+def test_events_are_captured_only_inside_the_context():
+    async def run() -> list[dict]:
+        queue = asyncio.Queue()
+        with capture_stream_events(queue):
+            emit_stream_event("image_url", {"url": "a"})
+        emit_stream_event("image_url", {"url": "b"})
+        return drain(queue)
+
+    assert asyncio.run(run()) == [{"event": "image_url", "data": {"url": "a"}}]
+
+
+def test_format_sse_round_trip():
+    stream = format_sse("text_delta", {"delta": "Hola"}) + format_sse(
+        "done", {"agent_response": "Hola mundo"}
+    )
+
+    assert list(iter_sse_events(stream.split("\n"))) == [
+        ("text_delta", {"delta": "Hola"}),
+        ("done", {"agent_response": "Hola mundo"}),
+    ]
+
+
+def test_stream_agent_run_emits_deltas_and_tool_calls():
+    agent = Agent(TestModel(custom_output_text="Image generated"))
+
+    @agent.tool_plain
+    def generate_images(prompt: str) -> str:
+        emit_stream_event("image_url", {"url": f"https://example.com/{prompt}.png"})
+        return "ok"
+
+    async def run():
+        queue = asyncio.Queue()
+        with capture_stream_events(queue):
+            result = await stream_agent_run(agent, "Draw waves", [])
+        return result, drain(queue)
+
+    result, events = asyncio.run(run())
+    event_names = [event["event"] for event in events]
+
+    assert result.output == "Image generated"
+    assert event_names.index("tool_call_start") < event_names.index("image_url")
+    assert event_names.index("image_url") < event_names.index("tool_call_end")
+    assert "".join(
+        event["data"]["delta"] for event in events if event["event"] == "text_delta"
+    ) == ("Image generated")